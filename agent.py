@@ -1,15 +1,22 @@
 # agent.py (VOLLSTÄNDIG & FINAL KORRIGIERT)
 
+import asyncio
 import json
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import msgpack
 from cognitive.layers import  ThinkingLayer3, ThinkingLayer4, ThinkingLayer5
+from cognitive.speculation import SpeculationStats
 from affective.engine import AffectiveEngine
 from processing.layer1 import ContextEnricher
 from memory.man import MemoryAccessNetwork
 from memory.subsystem import MemorySubsystem
 from affective.logger import ActionLogger
 from memory.stm_manager import STMManager 
+from memory.stm_view import STMGraphView
 try:
     from capa_core import CPPCore
 except ImportError:
@@ -39,11 +46,57 @@ def _parse_and_validate_llm_response(response: dict) -> tuple[str, str, int]:
         
     return internal_monologue, external_response, confidence
 
+# Ab dieser Konfidenz (exklusiv) gilt eine Antwort als endgültig
+CONFIDENCE_THRESHOLD = 90
+
+
+def _escalates(fields: dict) -> bool:
+    """Stop condition for streamed L3 calls: the confidence is known and too low for a final answer."""
+    if 'confidence_score' not in fields and 'confidence' not in fields:
+        return False
+    return _parse_and_validate_llm_response(fields)[2] <= CONFIDENCE_THRESHOLD
+
+
+# Antwort, wenn die Eskalation scheitert und das L3-Ergebnis keine Antwort enthält
+ESCALATION_FAILED_RESPONSE = "Sorry, I could not work this out right now. Could you try again or rephrase it?"
+
+
+def _fallback_result(result: dict) -> dict:
+    """
+    The answer returned when L4 produces no plan. A streamed L3 result that was stopped
+    early, a timed-out stage or any result without an external_response carries no
+    answer for the user, so it is replaced by an explicit error response.
+    """
+    if result.get("external_response") not in (None, "", "N/A") and not result.get("stopped_early"):
+        return result
+    return {
+        "internal_monologue": result.get("internal_monologue") or "Escalation to L4/L5 failed.",
+        "external_response": ESCALATION_FAILED_RESPONSE,
+        "confidence_score": 0,
+    }
+
+# Zeitlimits (Sekunden) je Stufe von process_input_async; None = ohne Limit
+DEFAULT_STAGE_TIMEOUTS = {
+    "enrich": 30.0,
+    "plans": 5.0,
+    "layer3": 60.0,
+    "layer4": 120.0,
+    "layer5": 120.0,
+}
+
 # --- Der Rest der Datei ist bereits korrekt und bleibt unverändert ---
 
 class Agent:
-    def __init__(self, cpp_core: CPPCore, man: MemoryAccessNetwork, context_enricher: ContextEnricher, memory_subsystem: MemorySubsystem):
+    def __init__(self, cpp_core: CPPCore, man: MemoryAccessNetwork, context_enricher: ContextEnricher, memory_subsystem: MemorySubsystem,
+                 stage_timeouts: dict | None = None, speculative_l4: bool = False, stream_l3: bool = False):
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.stage_timeouts = {**DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {})}
+        # Opt-in: L4 plant spekulativ parallel zum L3-Reflex (kostet Tokens, spart bei Eskalation einen Modellaufruf)
+        self.speculative_l4 = speculative_l4
+        self.speculation_stats = SpeculationStats()
+        self._speculation_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="SpeculativeL4") if speculative_l4 else None
+        # Opt-in: L3 wird gestreamt und abgebrochen, sobald eine niedrige Konfidenz feststeht
+        self.stream_l3 = stream_l3
         self.cpp_core = cpp_core
         self.man = man
         self.context_enricher = context_enricher
@@ -51,9 +104,12 @@ class Agent:
         self.affective_engine = AffectiveEngine()
         self.action_logger = ActionLogger()
         self.stm_manager = STMManager(memory_subsystem)
+        # Python-seitige Kopie des STM, die nur per Delta aktualisiert wird. Die Prompts
+        # rendert der C++-Kern selbst; synchronisiert wird erst, wenn jemand den Graphen liest.
+        self.stm_view = STMGraphView(cpp_core)
         self.layers = {
             3: ThinkingLayer3(cpp_core, man),
-            4: ThinkingLayer4(cpp_core, man),
+            4: ThinkingLayer4(cpp_core, 0, man),
             5: ThinkingLayer5(cpp_core, man)
         }
         self.logger.info("Agent initialized successfully.")
@@ -71,36 +127,84 @@ class Agent:
         
         self.logger.info("Storing input in STM to initiate cognitive cycle.")
         self.cpp_core.add_node(label, salience=1.0)
-        initial_graph = self.cpp_core.serialize_graph()
+        initial_graph = self.stm_view
         
         # Starte den kognitiven Prozess und gib sein Ergebnis zurück
         return self._run_cognitive_process(initial_graph, emotion, text)
 
     
 
-    def _run_cognitive_process(self, initial_graph_snapshot: bytes, emotion_context: str, input_text: str) -> dict:
+    def _speculative_l4_call(self, l4_kwargs: dict, discarded: threading.Event) -> tuple[dict, dict, float, float]:
+        started = time.perf_counter()
+        # Gestreamt, damit ein verworfener Plan den Worker und das Modell sofort freigibt
+        result, usage = self.layers[4].think_streaming_with_usage(stop_when=lambda fields: discarded.is_set(), **l4_kwargs)
+        return result, usage, started, time.perf_counter()
+
+    def _discard_speculation(self, speculation: Future, discarded: threading.Event):
+        self.speculation_stats.record_miss()
+        # Der Stream wird beim nächsten Chunk geschlossen; Ollama bricht die Generierung dann ab
+        discarded.set()
+        def record_outcome(future: Future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            result, usage = future.result()[:2]
+            if result.get("stopped_early"):
+                self.speculation_stats.record_cancelled()
+            # Auch ein abgebrochener Plan hat den Prompt und die bis dahin gestreamten Tokens gekostet
+            self.speculation_stats.record_waste(usage)
+        if speculation.cancel():
+            self.speculation_stats.record_cancelled()
+        else:
+            speculation.add_done_callback(record_outcome)
+        self.logger.info(f"Discarded speculative L4 plan. Speculation stats: {self.speculation_stats.stats()}")
+
+    def _run_cognitive_process(self, initial_graph_snapshot: STMGraphView, emotion_context: str, input_text: str) -> dict:
         internal_emotion_text = self.affective_engine.get_state_as_text()
         active_plans = self.man.find_active_plans()
+        # Placeholder: Layer 1 wird in Zukunft die Rekursionstiefe bestimmen
+        max_recursions = 3
+
+        # Der erste L4-Aufruf hängt nicht vom L3-Ergebnis ab und kann daher spekulativ mitlaufen
+        first_l4_kwargs = dict(
+            graph_snapshot=initial_graph_snapshot,
+            active_plans=active_plans,
+            emotion_context=emotion_context,
+            internal_emotion_text=internal_emotion_text,
+            recursion_info=f"Reasoning cycle 1 of {max_recursions}.",
+            recursion_counter=0,
+            input_text=input_text
+        )
+        speculation = None
+        discarded = threading.Event()
+        if self.speculative_l4:
+            self.logger.info("--- Starting Layer 4 (Planner) speculatively alongside Layer 3 ---")
+            self.speculation_stats.record_start()
+            speculation = self._speculation_pool.submit(self._speculative_l4_call, first_l4_kwargs, discarded)
 
         # --- PHASE 1: REFLEX-SCHICHT (LAYER 3) ---
         self.logger.info("--- Passing control to Layer 3 (Reflex) ---")
-        l3_result = self.layers[3].think(
+        l3_kwargs = dict(
             graph_snapshot=initial_graph_snapshot, 
             emotion_context=emotion_context, 
             internal_emotion_text=internal_emotion_text,
             input_text=input_text
         )
+        if self.stream_l3:
+            l3_result = self.layers[3].think_streaming(stop_when=_escalates, **l3_kwargs)
+        else:
+            l3_result = self.layers[3].think(**l3_kwargs)
+        l3_finished = time.perf_counter()
         _, _, l3_confidence = _parse_and_validate_llm_response(l3_result)
         
-        if l3_confidence > 90:
+        if l3_confidence > CONFIDENCE_THRESHOLD:
             self.logger.info("Layer 3 has high confidence. Finalizing thought process.")
+            if speculation is not None:
+                self._discard_speculation(speculation, discarded)
             return l3_result
         
         self.logger.warning(f"Layer 3 has low/medium confidence ({l3_confidence}%). Escalating to L4/L5 reasoning duo.")
 
         # --- PHASE 2: L4/L5 REASONING-SCHLEIFE ---
-        # Placeholder: Layer 1 wird in Zukunft die Rekursionstiefe bestimmen
-        max_recursions = 3
         recursion_counter = 0
         current_graph = initial_graph_snapshot
         last_l5_result = l3_result # Fallback-Antwort
@@ -109,28 +213,34 @@ class Agent:
             recursion_info = f"Reasoning cycle {recursion_counter + 1} of {max_recursions}."
             
             # 1. LAYER 4 (PLANNER)
-            self.logger.info(f"--- Passing control to Layer 4 (Planner) | {recursion_info} ---")
-            l4_result = self.layers[4].think(
-                graph_snapshot=current_graph,
-                active_plans=active_plans,
-                emotion_context=emotion_context,
-                internal_emotion_text=internal_emotion_text,
-                recursion_info=recursion_info,
-                recursion_counter=recursion_counter,
-                input_text=input_text
-            )
+            if speculation is not None:
+                self.logger.info(f"--- Using speculative Layer 4 (Planner) plan | {recursion_info} ---")
+                l4_result, _, l4_started, l4_finished = speculation.result()
+                self.speculation_stats.record_hit(max(0.0, min(l3_finished, l4_finished) - l4_started))
+                self.logger.info(f"Speculation stats: {self.speculation_stats.stats()}")
+                speculation = None
+            else:
+                self.logger.info(f"--- Passing control to Layer 4 (Planner) | {recursion_info} ---")
+                l4_result = self.layers[4].think(
+                    graph_snapshot=current_graph,
+                    active_plans=active_plans,
+                    emotion_context=emotion_context,
+                    internal_emotion_text=internal_emotion_text,
+                    recursion_info=recursion_info,
+                    recursion_counter=recursion_counter,
+                    input_text=input_text
+                )
             l4_plan = l4_result.get("plan_for_layer5")
 
             if not l4_plan:
                 self.logger.error("Layer 4 failed to produce a plan. Aborting reasoning loop.")
-                return last_l5_result
+                return _fallback_result(last_l5_result)
 
             self.logger.info(f"Layer 4 produced a plan for Layer 5: {l4_plan}")
 
             # 2. LAYER 5 (EXECUTOR)
             self.cpp_core.add_node(f"L4_PLAN: {l4_plan}")
             self.cpp_core.add_node(f"L4_THOUGHT: {l4_result.get('internal_monologue')}")
-            current_graph = self.cpp_core.serialize_graph()
 
             self.logger.info(f"--- Passing control to Layer 5 (Executor) | {recursion_info} ---")
             l5_result = self.layers[5].think(
@@ -146,13 +256,12 @@ class Agent:
             last_l5_result = l5_result
             _, _, l5_confidence = _parse_and_validate_llm_response(l5_result)
 
-            if l5_confidence > 90:
+            if l5_confidence > CONFIDENCE_THRESHOLD:
                 self.logger.info("Layer 5 has high confidence. Finalizing reasoning loop.")
                 return l5_result
             
             self.logger.warning(f"Layer 5 has low/medium confidence ({l5_confidence}%). Looping back to Layer 4 for a new plan.")
             self.cpp_core.add_node(f"L5_FAILED_ATTEMPT: {l5_result.get('internal_monologue')}")
-            current_graph = self.cpp_core.serialize_graph()
             recursion_counter += 1
         
         self.logger.warning("Max recursion depth for L4/L5 loop reached. Returning best effort.")
@@ -160,6 +269,154 @@ class Agent:
     
     
         
+    async def _run_stage(self, stage: str, awaitable, fallback):
+        """Awaits one pipeline stage within its timeout; on timeout the stage is cancelled and `fallback` returned."""
+        timeout = self.stage_timeouts.get(stage)
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Stage '{stage}' timed out after {timeout}s. Continuing with fallback.")
+            return fallback
+
+    async def process_input_async(self, text: str) -> dict:
+        """
+        Asynchronous variant of `process_input` on ollama.AsyncClient. The L1 enrichment and
+        the lookup of active plans run concurrently; every stage has a timeout (see
+        DEFAULT_STAGE_TIMEOUTS). Cancelling the returned coroutine cancels the running stages.
+        """
+        self.logger.info(f"--- New Input Received (async): '{text}' ---")
+        enriched_packet, active_plans = await asyncio.gather(
+            self._run_stage("enrich", self.context_enricher.process_async(text),
+                            {"original_input": text, "emotion_context": "neutral"}),
+            self._run_stage("plans", asyncio.to_thread(self.man.find_active_plans), []),
+        )
+
+        self.logger.info("Storing input in STM to initiate cognitive cycle.")
+        self.cpp_core.add_node(enriched_packet['original_input'], salience=1.0)
+        initial_graph = self.stm_view
+        return await self._run_cognitive_process_async(initial_graph, enriched_packet['emotion_context'], text, active_plans)
+
+    async def _run_cognitive_process_async(self, initial_graph_snapshot: STMGraphView, emotion_context: str,
+                                           input_text: str, active_plans: list[str]) -> dict:
+        internal_emotion_text = self.affective_engine.get_state_as_text()
+        timed_out = {"internal_monologue": "Timed out.", "external_response": "N/A", "confidence_score": 0}
+        max_recursions = 3
+
+        speculation = None
+        # Wird beim Streamen laufend aktualisiert, enthält also auch die Tokens eines abgebrochenen Plans
+        speculation_usage = {}
+        if self.speculative_l4:
+            self.logger.info("--- Starting Layer 4 (Planner, async) speculatively alongside Layer 3 ---")
+            self.speculation_stats.record_start()
+            speculation = asyncio.create_task(self._timed_stage("layer4", self.layers[4].think_streaming_async(
+                usage=speculation_usage,
+                graph_snapshot=initial_graph_snapshot,
+                active_plans=active_plans,
+                emotion_context=emotion_context,
+                internal_emotion_text=internal_emotion_text,
+                recursion_info=f"Reasoning cycle 1 of {max_recursions}.",
+                recursion_counter=0,
+                input_text=input_text
+            ), {}))
+
+        try:
+            return await self._reason_async(initial_graph_snapshot, emotion_context, input_text, active_plans,
+                                            internal_emotion_text, timed_out, max_recursions, speculation,
+                                            speculation_usage)
+        finally:
+            if speculation is not None and not speculation.done():
+                speculation.cancel()
+
+    async def _timed_stage(self, stage: str, awaitable, fallback) -> tuple:
+        started = time.perf_counter()
+        result = await self._run_stage(stage, awaitable, fallback)
+        return result, started, time.perf_counter()
+
+    async def _reason_async(self, initial_graph_snapshot: STMGraphView, emotion_context: str, input_text: str,
+                            active_plans: list[str], internal_emotion_text: str, timed_out: dict,
+                            max_recursions: int, speculation: asyncio.Task | None,
+                            speculation_usage: dict | None = None) -> dict:
+        self.logger.info("--- Passing control to Layer 3 (Reflex, async) ---")
+        l3_kwargs = dict(
+            graph_snapshot=initial_graph_snapshot,
+            emotion_context=emotion_context,
+            internal_emotion_text=internal_emotion_text,
+            input_text=input_text
+        )
+        if self.stream_l3:
+            l3_call = self.layers[3].think_streaming_async(stop_when=_escalates, **l3_kwargs)
+        else:
+            l3_call = self.layers[3].think_async(**l3_kwargs)
+        l3_result = await self._run_stage("layer3", l3_call, timed_out)
+        l3_finished = time.perf_counter()
+        _, _, l3_confidence = _parse_and_validate_llm_response(l3_result)
+        if l3_confidence > CONFIDENCE_THRESHOLD:
+            self.logger.info("Layer 3 has high confidence. Finalizing thought process.")
+            if speculation is not None:
+                # Abbrechen beendet auch die Generierung im Modellserver; verbraucht ist, was bis dahin gestreamt wurde
+                self.speculation_stats.record_miss()
+                if not speculation.done():
+                    speculation.cancel()
+                    self.speculation_stats.record_cancelled()
+                self.speculation_stats.record_waste(speculation_usage or {})
+                self.logger.info(f"Cancelled speculative L4 plan. Speculation stats: {self.speculation_stats.stats()}")
+            return l3_result
+        self.logger.warning(f"Layer 3 has low/medium confidence ({l3_confidence}%). Escalating to L4/L5 reasoning duo.")
+
+        current_graph = initial_graph_snapshot
+        last_l5_result = l3_result
+        for recursion_counter in range(max_recursions):
+            recursion_info = f"Reasoning cycle {recursion_counter + 1} of {max_recursions}."
+
+            if speculation is not None:
+                self.logger.info(f"--- Using speculative Layer 4 (Planner) plan | {recursion_info} ---")
+                l4_result, l4_started, l4_finished = await speculation
+                self.speculation_stats.record_hit(max(0.0, min(l3_finished, l4_finished) - l4_started))
+                self.logger.info(f"Speculation stats: {self.speculation_stats.stats()}")
+                speculation = None
+            else:
+                self.logger.info(f"--- Passing control to Layer 4 (Planner, async) | {recursion_info} ---")
+                l4_result = await self._run_stage("layer4", self.layers[4].think_async(
+                    graph_snapshot=current_graph,
+                    active_plans=active_plans,
+                    emotion_context=emotion_context,
+                    internal_emotion_text=internal_emotion_text,
+                    recursion_info=recursion_info,
+                    recursion_counter=recursion_counter,
+                    input_text=input_text
+                ), {})
+            l4_plan = l4_result.get("plan_for_layer5")
+            if not l4_plan:
+                self.logger.error("Layer 4 failed to produce a plan. Aborting reasoning loop.")
+                return _fallback_result(last_l5_result)
+
+            self.logger.info(f"Layer 4 produced a plan for Layer 5: {l4_plan}")
+            self.cpp_core.add_node(f"L4_PLAN: {l4_plan}")
+            self.cpp_core.add_node(f"L4_THOUGHT: {l4_result.get('internal_monologue')}")
+
+            self.logger.info(f"--- Passing control to Layer 5 (Executor, async) | {recursion_info} ---")
+            l5_result = await self._run_stage("layer5", self.layers[5].think_async(
+                graph_snapshot=current_graph,
+                active_plans=active_plans,
+                emotion_context=emotion_context,
+                internal_emotion_text=internal_emotion_text,
+                l4_plan=l4_plan,
+                recursion_info=recursion_info,
+                recursion_counter=recursion_counter,
+                input_text=input_text
+            ), timed_out)
+            last_l5_result = l5_result
+            _, _, l5_confidence = _parse_and_validate_llm_response(l5_result)
+            if l5_confidence > CONFIDENCE_THRESHOLD:
+                self.logger.info("Layer 5 has high confidence. Finalizing reasoning loop.")
+                return l5_result
+
+            self.logger.warning(f"Layer 5 has low/medium confidence ({l5_confidence}%). Looping back to Layer 4 for a new plan.")
+            self.cpp_core.add_node(f"L5_FAILED_ATTEMPT: {l5_result.get('internal_monologue')}")
+
+        self.logger.warning("Max recursion depth for L4/L5 loop reached. Returning best effort.")
+        return last_l5_result
+
     def initiate_training(self):
         """Initiates the autonomous training cycle as per MAD Block 4."""
         self.logger.info("--- AUTONOMOUS TRAINING DEACTIVATED FOR NOW ---")
@@ -264,14 +521,16 @@ class Agent:
         self.logger.info("--- STM Management Cycle Initiated (Consolidate & Learn) ---")
         graph_snapshot = self.cpp_core.serialize_graph()
         nodes, _ = msgpack.unpackb(graph_snapshot)
+        # Knoten, die das begrenzte STM während der Session verdrängt hat
+        evicted_nodes, _ = msgpack.unpackb(self.cpp_core.drain_evicted())
 
-        if not nodes:
+        if not nodes and not evicted_nodes:
             self.logger.info("STM is empty. Nothing to manage.")
             return
         
         # 1. Den Manager die Lektionen aus der Session erstellen lassen
         final_emotion = self.affective_engine.get_state_as_text()
-        self.stm_manager.consolidate_and_learn(nodes, final_emotion)
+        self.stm_manager.consolidate_and_learn(nodes, final_emotion, evicted_nodes=evicted_nodes)
             
         # 2. STM leeren
         self.logger.info("Consolidation complete. Clearing STM for the next session.")
@@ -1,11 +1,18 @@
 # arena_v3.py (KORRIGIERTE main-Funktion)
 
+import time
+_PROCESS_START = time.perf_counter()
+
 import logging
+import threading
 from agent import Agent
+from cognitive.llm_gateway import get_gateway
 from memory.subsystem import MemorySubsystem
 from memory.man import MemoryAccessNetwork
+from memory.service import connect_memory_subsystem
 from processing.layer1 import ContextEnricher
 import json
+import os
 
 try:
     import capa_core # type: ignore
@@ -13,6 +20,13 @@ except ImportError:
     print("FATAL: Could not import 'capa_core'. Build it first.")
     exit(1)
 
+# Obergrenze und Salienz-Zerfall des Kurzzeitgedächtnisses
+STM_CAPACITY = 512
+STM_DECAY_PER_STEP = 0.99
+# Periodischer STM-Snapshot, damit ein Absturz nicht die ganze Session kostet
+STM_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journals', 'stm_snapshot.bin')
+STM_CHECKPOINT_INTERVAL = 30.0
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - [%(name)s] - %(levelname)s - %(message)s'
@@ -30,18 +44,74 @@ def seed_emotion_test(memory_system: MemorySubsystem):
     logger.info("Seeding complete.")
 
 
+class StartupTimer:
+    """Collects the duration of each startup phase for the startup-time report."""
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self) -> str:
+        lines = [f"  {phase:<24} {seconds * 1000:8.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"  {'total':<24} {(self.last - self.started) * 1000:8.1f} ms")
+        return "Startup time report:\n" + "\n".join(lines)
+
+
+def _warm_up_in_background(memory_subsystem: MemorySubsystem, logger: logging.Logger) -> threading.Thread:
+    """Loads the LTM backend and the LLM client library while the REPL is already usable."""
+    def run():
+        started = time.perf_counter()
+        try:
+            memory_subsystem.warm_up(background=False)
+            # Baut den gemeinsamen, gepoolten Ollama-Client auf (importiert ollama/httpx)
+            get_gateway().client
+        except Exception as e:
+            logger.error(f"Background warm-up failed: {e}", exc_info=True)
+            return
+        logger.info(f"Background warm-up finished in {(time.perf_counter() - started) * 1000:.1f} ms "
+                    f"(LTM: {memory_subsystem.init_seconds * 1000:.1f} ms).")
+    thread = threading.Thread(target=run, name="ArenaWarmUp", daemon=True)
+    thread.start()
+    return thread
+
+
 def main():
     """
     The main entry point for the CAPA v3-R interactive arena.
     """
     logger = logging.getLogger("Arena")
     logger.info("--- Initializing CAPA v3-R ---")
+    timer = StartupTimer(_PROCESS_START)
+    timer.mark("imports")
 
-    cpp_core = capa_core.CPPCore()
-    memory_subsystem = MemorySubsystem()
+    cpp_core = capa_core.CPPCore(capacity=STM_CAPACITY, decay_per_step=STM_DECAY_PER_STEP)
+    os.makedirs(os.path.dirname(STM_SNAPSHOT_PATH), exist_ok=True)
+    if os.path.exists(STM_SNAPSHOT_PATH):
+        try:
+            cpp_core.load_snapshot(STM_SNAPSHOT_PATH)
+            logger.info(f"Restored STM snapshot with {cpp_core.node_count()} node(s) from '{STM_SNAPSHOT_PATH}'.")
+        except RuntimeError as e:
+            logger.error(f"Could not restore STM snapshot: {e}")
+    cpp_core.start_checkpointing(STM_SNAPSHOT_PATH, STM_CHECKPOINT_INTERVAL)
+    timer.mark("stm restore")
+    # Läuft der LTM-Service (im Listener-Prozess), teilen wir dessen Chroma-Client und Modell
+    memory_subsystem = connect_memory_subsystem()
+    # Chroma und das Embedding-Modell laden parallel zum restlichen Start
+    _warm_up_in_background(memory_subsystem, logger)
     man = MemoryAccessNetwork(memory_subsystem)
     context_enricher = ContextEnricher(man)
-    agent = Agent(cpp_core, man, context_enricher, memory_subsystem)
+    # CAPA_SPECULATIVE_L4=1: L4 plant parallel zum L3-Reflex (siehe Agent.speculative_l4)
+    # CAPA_STREAM_L3=1: L3 eskaliert, sobald seine niedrige Konfidenz im Stream steht
+    agent = Agent(cpp_core, man, context_enricher, memory_subsystem,
+                  speculative_l4=os.environ.get("CAPA_SPECULATIVE_L4") == "1",
+                  stream_l3=os.environ.get("CAPA_STREAM_L3") == "1")
+    timer.mark("agent construction")
+    logger.info(timer.report())
     
     print("\n--- CAPA v3-R Arena ---")
     print("Available commands: process_input <text>, initiate_training, seed_emotion_test, exit")
@@ -104,6 +174,7 @@ def main():
 
             elif command == "status":
                 print(agent.get_status())
+                print(f"LLM stats: {json.dumps(get_gateway().stats.stats(), indent=2)}")
 
             elif command == "logs":
                 all_logs = agent.action_logger.get_logs()
@@ -123,5 +194,8 @@ def main():
         except Exception as e:
             logger.error(f"An unexpected error occurred: {e}", exc_info=True)
 
+    # Schreibt einen letzten Snapshot des STM
+    cpp_core.stop_checkpointing()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+# bench_embeddings.py
+#
+# Vergleicht die Embedding-Backends des MemorySubsystem: Durchsatz (Texte/s) und
+# Recall@k der nächsten Nachbarn gegenüber dem Referenz-Backend.
+#
+#   python bench_embeddings.py --threads 4 --corpus 2000 --backends sentence-transformers onnx onnx-int8
+
+import argparse
+import itertools
+import random
+import time
+
+import numpy as np
+
+from memory.embedding_backends import EMBEDDING_BACKENDS, make_embedding_function
+
+_SUBJECTS = ["The user", "The agent", "My colleague", "A student", "The team", "Our customer", "The teacher", "A friend"]
+_EVENTS = ["was frustrated by", "was delighted with", "felt anxious about", "laughed about",
+           "struggled with", "quickly solved", "asked for help with", "gave up on"]
+_OBJECTS = ["a failing build", "the final exam", "a memory leak", "the quarterly report", "a difficult bug",
+            "the new onboarding flow", "a broken deployment", "the chess puzzle", "a long meeting", "the refactoring"]
+_CONTEXTS = ["this morning", "after lunch", "late at night", "during the demo", "before the deadline", "again"]
+
+
+def build_corpus(size: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    sentences = [" ".join(parts) + "." for parts in itertools.product(_SUBJECTS, _EVENTS, _OBJECTS, _CONTEXTS)]
+    rng.shuffle(sentences)
+    return sentences[:size]
+
+
+def embed_all(embedding_function, texts: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    # Aufwärmen (Sessionaufbau, Lazy-Init), nicht mitgemessen
+    embedding_function(texts[:batch_size])
+    started = time.perf_counter()
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embedding_function(texts[start:start + batch_size]))
+    seconds = time.perf_counter() - started
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True), seconds
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, queries: np.ndarray, k: int) -> float:
+    """Share of the reference top-k neighbours (by cosine) that the candidate also returns."""
+    ref_top = np.argsort(-(reference[queries] @ reference.T), axis=1)[:, 1:k + 1]
+    cand_top = np.argsort(-(candidate[queries] @ candidate.T), axis=1)[:, 1:k + 1]
+    hits = sum(len(set(r) & set(c)) for r, c in zip(ref_top, cand_top))
+    return hits / (len(queries) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare throughput and recall of the embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--corpus", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    texts = build_corpus(args.corpus)
+    queries = np.random.default_rng(0).choice(len(texts), size=min(args.queries, len(texts)), replace=False)
+
+    results = {}
+    for backend in args.backends:
+        try:
+            embedding_function = make_embedding_function(backend, num_threads=args.threads)
+            results[backend] = embed_all(embedding_function, texts, args.batch_size)
+        except Exception as e:
+            print(f"{backend:<22} skipped: {e}")
+
+    if not results:
+        return
+    reference_name = next(iter(results))
+    reference = results[reference_name][0]
+    print(f"\n{len(texts)} texts, batch size {args.batch_size}, threads {args.threads or 'default'}, "
+          f"reference: {reference_name}")
+    print(f"{'backend':<22} {'texts/s':>10} {'speedup':>8} {'recall@' + str(args.k):>10} {'cos(ref)':>9}")
+    reference_seconds = results[reference_name][1]
+    for backend, (vectors, seconds) in results.items():
+        agreement = float(np.mean(np.sum(vectors * reference, axis=1)))
+        print(f"{backend:<22} {len(texts) / seconds:>10.1f} {reference_seconds / seconds:>7.2f}x "
+              f"{recall_at_k(reference, vectors, queries, args.k):>10.3f} {agreement:>9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# cognitive/json_stream.py
+
+import json
+
+
+class StreamingJSONObject:
+    """
+    Incrementally decodes the top-level fields of a JSON object while it is being
+    generated. `fields` holds every key whose value is complete; text before the
+    opening brace (chatty models) is skipped. Values that are not valid JSON (e.g. an
+    unquoted placeholder) are kept as stripped raw text.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+
+    def feed(self, text: str) -> dict:
+        """Appends `text` and returns the fields completed so far."""
+        self.buffer += text
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            if self.complete:
+                break
+            c = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._key_start is not None:
+                        self._key = self._decode(buffer[self._key_start:i + 1])
+                        self._key_start = None
+                continue
+            if self._depth == 0:
+                if c == '{':
+                    self._depth = 1
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finish_value(i)
+                    self.complete = True
+            elif self._depth == 1 and c == ':':
+                self._expect_key = False
+                self._value_start = i + 1
+            elif self._depth == 1 and c == ',':
+                self._finish_value(i)
+                self._expect_key = True
+        self._pos = len(buffer)
+        return self.fields
+
+    def _finish_value(self, end: int):
+        if self._key is None or self._value_start is None:
+            return
+        raw = self.buffer[self._value_start:end].strip()
+        if raw:
+            self.fields[self._key] = self._decode(raw)
+        self._key = None
+        self._value_start = None
+
+    @staticmethod
+    def _decode(raw: str):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return raw.strip('"')
@@ -1,12 +1,13 @@
 # cognitive/layers.py (VOLLSTÄNDIG & KORRIGIERT)
 
+import asyncio
 import logging
 import json
 
-from psutil import users
-import msgpack
-import ollama
+from cognitive.json_stream import StreamingJSONObject
+from cognitive.llm_gateway import get_gateway
 from memory.man import MemoryAccessNetwork
+from memory.stm_view import STMGraphView, unpack_graph
 try:
     from capa_core import CPPCore
 except ImportError:
@@ -25,16 +26,60 @@ def _extract_json_from_response(response_text: str) -> str:
         logging.error(f"Could not find a JSON object in the LLM response: {response_text}")
         raise
 
+# Grobe Schätzung für Prompts, deren Token-Zahl Ollama nicht mehr meldet (abgebrochene Streams)
+CHARS_PER_TOKEN = 4
+
+
+def _partial_usage(full_prompt: str) -> dict:
+    """Usage of a stream before its last chunk: estimated prompt tokens, no completion tokens yet."""
+    return {"prompt_tokens": len(full_prompt) // CHARS_PER_TOKEN + 1, "completion_tokens": 0}
+
+
+def _count_chunk(usage: dict, chunk) -> None:
+    # Ollama streamt ein Token je Chunk und meldet die genauen Zahlen erst im letzten
+    if chunk.get('done'):
+        usage["prompt_tokens"] = chunk.get('prompt_eval_count') or 0
+        usage["completion_tokens"] = chunk.get('eval_count') or 0
+    else:
+        usage["completion_tokens"] += 1
+
+
+def _validate_json_response(response_text: str):
+    """Raises unless the response contains a JSON object; used before a response is cached."""
+    json.loads(_extract_json_from_response(response_text))
+
 class BaseThinkingLayer:
+    # Prompt-Budget für den STM-Kontext (siehe CPPCore.render_context)
+    stm_max_chars = 4000
+    stm_top_k = 50
+    stm_min_salience = 0.0
+    # Die Layer samplen mit Ollamas Standardtemperatur, daher standardmäßig kein Cache.
+    # Layer mit cache_responses = True fragen mit Temperatur 0 an (siehe _chat_kwargs).
+    cache_responses = False
+
     def __init__(self, model_name: str, cpp_core: CPPCore, man: MemoryAccessNetwork | None = None):
         self.logger = logging.getLogger(self.__class__.__name__)
         self.model_name = model_name
         self.cpp_core = cpp_core
         self.man = man
-        self.client = ollama.Client()
+        self._client = None
+        self._async_client = None
         self.system_prompt = "" # Wird in den Subklassen gesetzt
         self.logger.info(f"Initialized with dedicated LLM Model: {self.model_name}. MAN Access: {'Yes' if self.man else 'No'}")
 
+    @property
+    def client(self):
+        # Gemeinsamer, gepoolter Zugang zum Ollama-Server (siehe cognitive/llm_gateway.py)
+        if self._client is None:
+            self._client = get_gateway()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = get_gateway().aio
+        return self._async_client
+
 
     def _format_graph_for_prompt(self, nodes: list, edges: list) -> str:
         """Converts the graph data into a simple string for the LLM prompt."""
@@ -44,26 +89,169 @@ class BaseThinkingLayer:
         edge_str = ", ".join([f"Edge({e[0]}->{e[1]}, w={e[2]})" for e in edges])
         return f"Current STM State: Nodes=[{node_str}], Edges=[{edge_str}]"
 
-    def _execute_llm_call(self, dynamic_prompt_content: str) -> dict:
+    def _render_stm(self, graph_snapshot: bytes | STMGraphView) -> str:
+        """
+        Renders the STM for the prompt. The C++ core selects the most salient nodes
+        within this layer's budget; the full Python formatting is only a fallback.
+        """
+        if self.cpp_core is not None:
+            return self.cpp_core.render_context(self.stm_max_chars, self.stm_top_k, self.stm_min_salience)
+        if isinstance(graph_snapshot, STMGraphView) and graph_snapshot.cpp_core is not None:
+            graph_snapshot.sync()
+        nodes, edges = unpack_graph(graph_snapshot)
+        return self._format_graph_for_prompt(nodes, edges)
+
+    def _chat_kwargs(self) -> dict:
+        # Nur deterministische, parsebare Antworten dürfen aus dem Cache kommen
+        if not self.cache_responses:
+            return {"format": 'json', "cache": False}
+        return {"format": 'json', "cache": True, "validate": _validate_json_response, "options": {"temperature": 0}}
+
+    def _parse_llm_content(self, response_content: str) -> dict:
+        cleaned_json = _extract_json_from_response(response_content)
+        result = json.loads(cleaned_json)
+        self.logger.info(f"LLM ({self.model_name}) generated: {result}")
+        return result
+
+    def _error_result(self) -> dict:
+        return {"internal_monologue": "Error processing response.", "external_response": "Error.", "confidence_score": 0}
+
+    def _execute_llm_call_with_usage(self, dynamic_prompt_content: str) -> tuple[dict, dict]:
+        """Returns the parsed result and the token usage ({'prompt_tokens', 'completion_tokens'}) of the call."""
         full_prompt = f"{self.system_prompt}\n\n{dynamic_prompt_content}"
         try:
             self.logger.info(f"Sending request to dedicated LLM ({self.model_name})...")
-            response = self.client.chat(model=self.model_name, messages=[{'role': 'user', 'content': full_prompt}], format='json')
-            response_content = response['message']['content']
-            cleaned_json = _extract_json_from_response(response_content)
-            result = json.loads(cleaned_json)
-            self.logger.info(f"LLM ({self.model_name}) generated: {result}")
-            return result
+            response = self.client.chat(model=self.model_name, messages=[{'role': 'user', 'content': full_prompt}], **self._chat_kwargs())
+            usage = {
+                "prompt_tokens": response.get('prompt_eval_count') or 0,
+                "completion_tokens": response.get('eval_count') or 0,
+            }
+            return self._parse_llm_content(response['message']['content']), usage
+        except Exception as e:
+            self.logger.error(f"Error during LLM ({self.model_name}) interaction: {e}", exc_info=True)
+            return self._error_result(), {"prompt_tokens": 0, "completion_tokens": 0}
+
+    def _execute_llm_call(self, dynamic_prompt_content: str) -> dict:
+        return self._execute_llm_call_with_usage(dynamic_prompt_content)[0]
+
+    async def _execute_llm_call_async(self, dynamic_prompt_content: str) -> dict:
+        """Like `_execute_llm_call`, but on ollama.AsyncClient. Cancellation is propagated to the caller."""
+        full_prompt = f"{self.system_prompt}\n\n{dynamic_prompt_content}"
+        try:
+            self.logger.info(f"Sending async request to dedicated LLM ({self.model_name})...")
+            response = await self.async_client.chat(model=self.model_name, messages=[{'role': 'user', 'content': full_prompt}], **self._chat_kwargs())
+            return self._parse_llm_content(response['message']['content'])
+        except asyncio.CancelledError:
+            self.logger.info(f"LLM ({self.model_name}) request cancelled.")
+            raise
+        except Exception as e:
+            self.logger.error(f"Error during LLM ({self.model_name}) interaction: {e}", exc_info=True)
+            return self._error_result()
+
+    def _finish_stream(self, parser: StreamingJSONObject, stop_when, fields: dict) -> dict | None:
+        # Ergebnis, sobald `stop_when` greift; sonst None (weiterlesen)
+        if stop_when is not None and not parser.complete and stop_when(fields):
+            self.logger.info(f"LLM ({self.model_name}) stream stopped early after {len(parser.buffer)} chars: {fields}")
+            return {**fields, "stopped_early": True}
+        return None
+
+    def _execute_llm_call_streaming(self, dynamic_prompt_content: str, stop_when=None) -> dict:
+        """
+        Streams the completion and decodes its JSON fields while they arrive. Once
+        `stop_when(fields)` is true for the fields decoded so far, the stream is closed
+        (the server stops generating) and those fields are returned with "stopped_early".
+        """
+        return self._execute_llm_call_streaming_with_usage(dynamic_prompt_content, stop_when)[0]
+
+    def _execute_llm_call_streaming_with_usage(self, dynamic_prompt_content: str, stop_when=None) -> tuple[dict, dict]:
+        """
+        Like `_execute_llm_call_streaming`, plus the token usage. For a stream that was
+        stopped early the usage is estimated: prompt tokens from the prompt size, one
+        completion token per chunk received.
+        """
+        full_prompt = f"{self.system_prompt}\n\n{dynamic_prompt_content}"
+        parser = StreamingJSONObject()
+        usage = _partial_usage(full_prompt)
+        stream = None
+        try:
+            self.logger.info(f"Streaming request to dedicated LLM ({self.model_name})...")
+            stream = self.client.chat(model=self.model_name, messages=[{'role': 'user', 'content': full_prompt}], stream=True,
+                                      **self._chat_kwargs())
+            for chunk in stream:
+                _count_chunk(usage, chunk)
+                early = self._finish_stream(parser, stop_when, parser.feed(chunk['message']['content']))
+                if early is not None:
+                    return early, usage
+            return self._parse_llm_content(parser.buffer), usage
         except Exception as e:
             self.logger.error(f"Error during LLM ({self.model_name}) interaction: {e}", exc_info=True)
-            return {"internal_monologue": "Error processing response.", "external_response": "Error.", "confidence_score": 0}
+            return self._error_result(), usage
+        finally:
+            if stream is not None:
+                stream.close()
+
+    async def _execute_llm_call_streaming_async(self, dynamic_prompt_content: str, stop_when=None,
+                                                usage: dict | None = None) -> dict:
+        """
+        Async variant of `_execute_llm_call_streaming`. A given `usage` dict is updated
+        while chunks arrive (see `_execute_llm_call_streaming_with_usage`), so it also
+        holds the usage of a call that was cancelled.
+        """
+        full_prompt = f"{self.system_prompt}\n\n{dynamic_prompt_content}"
+        parser = StreamingJSONObject()
+        if usage is None:
+            usage = {}
+        usage.update(_partial_usage(full_prompt))
+        stream = None
+        try:
+            self.logger.info(f"Streaming async request to dedicated LLM ({self.model_name})...")
+            stream = await self.async_client.chat(model=self.model_name, messages=[{'role': 'user', 'content': full_prompt}],
+                                                  stream=True, **self._chat_kwargs())
+            async for chunk in stream:
+                _count_chunk(usage, chunk)
+                early = self._finish_stream(parser, stop_when, parser.feed(chunk['message']['content']))
+                if early is not None:
+                    return early
+            return self._parse_llm_content(parser.buffer)
+        except asyncio.CancelledError:
+            self.logger.info(f"LLM ({self.model_name}) request cancelled.")
+            raise
+        except Exception as e:
+            self.logger.error(f"Error during LLM ({self.model_name}) interaction: {e}", exc_info=True)
+            return self._error_result()
+        finally:
+            if stream is not None:
+                await stream.aclose()
+
+    def _build_prompt(self, **kwargs) -> str:
+        raise NotImplementedError("Each layer must implement its own prompt.")
 
     def think(self, **kwargs) -> dict:
-        raise NotImplementedError("Each layer must implement its own think method.")
+        return self._execute_llm_call(self._build_prompt(**kwargs))
+
+    def think_with_usage(self, **kwargs) -> tuple[dict, dict]:
+        return self._execute_llm_call_with_usage(self._build_prompt(**kwargs))
+
+    async def think_async(self, **kwargs) -> dict:
+        # Das Rendern des STM ist ein schneller C++-Aufruf und bleibt synchron
+        return await self._execute_llm_call_async(self._build_prompt(**kwargs))
+
+    def think_streaming(self, stop_when=None, **kwargs) -> dict:
+        return self._execute_llm_call_streaming(self._build_prompt(**kwargs), stop_when)
+
+    def think_streaming_with_usage(self, stop_when=None, **kwargs) -> tuple[dict, dict]:
+        return self._execute_llm_call_streaming_with_usage(self._build_prompt(**kwargs), stop_when)
+
+    async def think_streaming_async(self, stop_when=None, usage: dict | None = None, **kwargs) -> dict:
+        return await self._execute_llm_call_streaming_async(self._build_prompt(**kwargs), stop_when, usage)
 
 
 
 class ThinkingLayer3(BaseThinkingLayer):
+    # Der Reflex braucht nur den jüngsten, salientesten Kontext
+    stm_max_chars = 1500
+    stm_top_k = 15
+
     def __init__(self, cpp_core: CPPCore, man: MemoryAccessNetwork | None = None):
         super().__init__(model_name="gemma3:4b", cpp_core=cpp_core, man=None)
         self.system_prompt = """
@@ -72,9 +260,24 @@ class ThinkingLayer3(BaseThinkingLayer):
         If the question is complex, a riddle, or requires multiple steps, you MUST have a low confidence score (e.g., 30) to escalate it. Do not attempt to solve it. Your job is speed and efficiency.
         """
 
-    def think(self, graph_snapshot: bytes, emotion_context: str, internal_emotion_text: str, input_text: str) -> dict:
-        nodes, edges = msgpack.unpackb(graph_snapshot)
-        formatted_graph = self._format_graph_for_prompt(nodes, edges)
+    def _build_prompt(self, graph_snapshot: bytes | STMGraphView, emotion_context: str, internal_emotion_text: str, input_text: str,
+                      confidence_first: bool = False) -> str:
+        formatted_graph = self._render_stm(graph_snapshot)
+        if confidence_first:
+            # Gestreamt: die Konfidenz zuerst, damit früh eskaliert werden kann (siehe think_streaming)
+            json_template = """Fill out the following JSON structure, in this key order. Be brutally honest about your confidence level. Only awnser simple tasks directly. If there is a riddle or complex dialog or task, do NOT answer directly but reason it out in your internal monologue and lower your confidence below 40%.   
+        {
+            "confidence_score": Your confidence score (0-100),
+            "internal_monologue": "Your reasoning."(optional),
+            "external_response": "Your direct response.(do not forget your emotion)" (only if confident)
+        }"""
+        else:
+            json_template = """Fill out the following JSON structure. Be brutally honest about your confidence level. Only awnser simple tasks directly. If there is a riddle or complex dialog or task, do NOT answer directly but reason it out in your internal monologue and lower your confidence below 40%.   
+        {
+            "internal_monologue": "Your reasoning."(optional),
+            "external_response": "Your direct response.(do not forget your emotion)" (only if confident),
+            "confidence_score": Your confidence score (0-100) .
+        }"""
         dynamic_content = f"""
         **Data Provided:**
         - Your Emotion: {internal_emotion_text} (behave accordingly, this is your current sate)
@@ -83,14 +286,18 @@ class ThinkingLayer3(BaseThinkingLayer):
         -User's most recent input: {input_text}
 
         **Your Task:**
-        Fill out the following JSON structure. Be brutally honest about your confidence level. Only awnser simple tasks directly. If there is a riddle or complex dialog or task, do NOT answer directly but reason it out in your internal monologue and lower your confidence below 40%.   
-        {{
-            "internal_monologue": "Your reasoning."(optional),
-            "external_response": "Your direct response.(do not forget your emotion)" (only if confident),
-            "confidence_score": Your confidence score (0-100) .
-        }}
+        {json_template}
         """
-        return self._execute_llm_call(dynamic_content)
+        return dynamic_content
+
+    # Nur gestreamte Aufrufe (Agent.stream_l3) fragen die Konfidenz zuerst ab; der
+    # normale Reflex behält die ursprüngliche Reihenfolge (erst Begründung, dann Konfidenz).
+    def think_streaming(self, stop_when=None, **kwargs) -> dict:
+        return self._execute_llm_call_streaming(self._build_prompt(confidence_first=True, **kwargs), stop_when)
+
+    async def think_streaming_async(self, stop_when=None, usage: dict | None = None, **kwargs) -> dict:
+        return await self._execute_llm_call_streaming_async(self._build_prompt(confidence_first=True, **kwargs),
+                                                            stop_when, usage)
     #for reasoning: Is this a simple fact? Yes/No, because...
 
 
@@ -99,9 +306,8 @@ class ThinkingLayer4(BaseThinkingLayer):
         super().__init__(model_name="dolphin3", cpp_core=cpp_core, man=man)
         self.system_prompt = f"You are the 'Tactical Planner' layer. Your ONLY job is to create a reasoning plan for Layer 5. You do not respond to the user. Analyze the users's request and the STM state. Create a clear, step-by-step plan that the final strategic layer should follow to solve the problem. " if recursion_counter < 2 else "Look at the Input result given to you by layer 5 and look at the Input by the user and determine if what Layer 5 did was correct or not. If it was correct, give a nice output sentence and tell layer 5 to have a high confidence score. If it was not correct, analyze what went wrong and try to solve the problem.  "
     
-    def think(self, graph_snapshot: bytes,  active_plans: list[str], emotion_context: str, internal_emotion_text: str, recursion_info: str, recursion_counter: int, input_text: str) -> dict:
-        nodes, edges = msgpack.unpackb(graph_snapshot)
-        formatted_graph = self._format_graph_for_prompt(nodes, edges)
+    def _build_prompt(self, graph_snapshot: bytes | STMGraphView,  active_plans: list[str], emotion_context: str, internal_emotion_text: str, recursion_info: str, recursion_counter: int, input_text: str) -> str:
+        formatted_graph = self._render_stm(graph_snapshot)
         user_input_display = f"- User's most recent input: {input_text}" if recursion_counter < 2 else "- User's most recent input: {input_text} "
 
         dynamic_content = f"""
@@ -120,7 +326,7 @@ class ThinkingLayer4(BaseThinkingLayer):
             "plan_for_layer5": ["Step 1: ...", "Step 2: ...", "Step 3: ..., and so on"""if recursion_counter < 2 else "your new salution with a mistake analysis and a confidence of your own""]"
         "}}"
         """"""
-        return self._execute_llm_call(dynamic_content)
+        return dynamic_content
 
 
 class ThinkingLayer5(BaseThinkingLayer):
@@ -131,9 +337,8 @@ class ThinkingLayer5(BaseThinkingLayer):
         **CRITICAL RULE: The user's most recent input has absolute priority.**
         """
 
-    def think(self, graph_snapshot: bytes , active_plans: list[str], emotion_context: str, internal_emotion_text: str, l4_plan: list[str], recursion_info: str, recursion_counter: int, input_text: str) -> dict:
-        nodes, edges = msgpack.unpackb(graph_snapshot)
-        formatted_graph = self._format_graph_for_prompt(nodes, edges)
+    def _build_prompt(self, graph_snapshot: bytes | STMGraphView, active_plans: list[str], emotion_context: str, internal_emotion_text: str, l4_plan: list[str], recursion_info: str, recursion_counter: int, input_text: str) -> str:
+        formatted_graph = self._render_stm(graph_snapshot)
         dynamic_content = f"""
         **Data Provided:**
         - Your Internal Emotion: {internal_emotion_text} (behave accordingly, this is your current sate, do not hide it, it is part of you)
@@ -152,7 +357,7 @@ class ThinkingLayer5(BaseThinkingLayer):
             "confidence_score": "Your confidence score for this answer (0-100)."
         }}
         """
-        return self._execute_llm_call(dynamic_content)
+        return dynamic_content
 
     def create_training_data_for_layer1(self):
         self.logger.warning("BRIDGE MODE: Would analyze recent Layer 1 performance and generate a fine-tuning dataset (LoRAs).")
\ No newline at end of file
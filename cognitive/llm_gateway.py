@@ -0,0 +1,345 @@
+# cognitive/llm_gateway.py
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from cognitive.response_cache import LLMResponseCache, request_key
+
+DEFAULT_KEEP_ALIVE = os.environ.get("CAPA_LLM_KEEP_ALIVE", "30m")  # Modelle bleiben im Speicher des Servers
+DEFAULT_TIMEOUT = 300.0        # Sekunden je Anfrage (ollama.Client hat standardmäßig keins)
+DEFAULT_MAX_CONCURRENCY = 2    # gleichzeitige Anfragen je Modell
+DEFAULT_MAX_CONNECTIONS = 16
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BACKOFF = 0.5    # Sekunden, verdoppelt sich je Versuch
+# Pfad einer SQLite-Datei für den Antwort-Cache; ungesetzt = kein Cache
+DEFAULT_RESPONSE_CACHE_PATH = os.environ.get("CAPA_LLM_CACHE")
+
+
+def _is_retryable(error: Exception) -> bool:
+    import httpx
+    import ollama
+    # Ein Lese-/Schreib-Timeout heißt: das Modell rechnet noch. Eine Wiederholung würde den
+    # Slot des Modells für ein weiteres volles Timeout belegen, also nicht wiederholen.
+    if isinstance(error, (httpx.ReadTimeout, httpx.WriteTimeout)):
+        return False
+    if isinstance(error, (ConnectionError, httpx.TransportError)):
+        return True
+    # 429/5xx: Server überlastet oder Modell wird gerade geladen
+    return isinstance(error, ollama.ResponseError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def _token_counts(response) -> tuple[int, int]:
+    return (response.get('prompt_eval_count') or 0), (response.get('eval_count') or 0)
+
+
+def _response_dict(response) -> dict:
+    if hasattr(response, 'model_dump'):
+        return response.model_dump(mode='json', exclude_none=True)
+    return dict(response)
+
+
+def _cached_response(data: dict):
+    import ollama
+    # Ein Treffer kostet das Modell nichts: keine Tokens
+    return ollama.ChatResponse(**{**data, "prompt_eval_count": 0, "eval_count": 0})
+
+
+class LLMStats:
+    """Per-model call statistics of the gateway (latency, tokens, errors, retries)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, model: str, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+               retries: int = 0, error: bool = False, cancelled: bool = False):
+        with self._lock:
+            entry = self._entry_locked(model)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["cancelled"] += int(cancelled)
+            entry["retries"] += retries
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+
+    def record_cache_hit(self, model: str):
+        with self._lock:
+            self._entry_locked(model)["cache_hits"] += 1
+
+    def _entry_locked(self, model: str) -> dict:
+        return self._models.setdefault(model, {
+            "calls": 0, "cache_hits": 0, "errors": 0, "cancelled": 0, "retries": 0,
+            "total_seconds": 0.0, "max_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+        })
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                model: {**entry, "avg_seconds": entry["total_seconds"] / entry["calls"] if entry["calls"] else 0.0}
+                for model, entry in self._models.items()
+            }
+
+
+class LLMGateway:
+    """
+    The one way the agent talks to the Ollama server. Shares a pooled HTTP client
+    (sync and, per event loop, async) between all layers, keeps models resident via
+    `keep_alive`, limits concurrent requests per model, retries transient failures
+    and records latency and token counts. `chat` has the signature of ollama.Client.chat.
+
+    With a `response_cache`, byte-identical requests (model, messages, format, options)
+    are answered from the cache without contacting the server; pass `cache=False` for
+    calls whose sampling is meant to be non-deterministic. A response is only stored
+    once it is complete and `validate(content)` (if given) did not raise, so an
+    unparsable answer is not served again.
+    """
+    def __init__(self, host: str | None = None, keep_alive: str | float | None = DEFAULT_KEEP_ALIVE,
+                 timeout: float | None = DEFAULT_TIMEOUT, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 model_concurrency: dict | None = None, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 retries: int = DEFAULT_RETRIES, retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+                 response_cache: LLMResponseCache | None = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.host = host
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.model_concurrency = dict(model_concurrency or {})
+        self.max_connections = max_connections
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.stats = LLMStats()
+        self.response_cache = response_cache
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = {}   # Event-Loop -> (ollama.AsyncClient, {Modell: asyncio.Semaphore})
+        self._semaphores = {}
+        self.aio = AsyncLLMGateway(self)
+
+    def _client_kwargs(self) -> dict:
+        import httpx
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        return {"host": self.host, "timeout": self.timeout, "limits": limits}
+
+    @property
+    def client(self):
+        # ollama (httpx, pydantic) wird erst beim ersten LLM-Aufruf importiert
+        with self._lock:
+            if self._client is None:
+                import ollama
+                self._client = ollama.Client(**self._client_kwargs())
+            return self._client
+
+    def _semaphore(self, model: str) -> threading.Semaphore:
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.Semaphore(self.model_concurrency.get(model, self.max_concurrency))
+            return self._semaphores[model]
+
+    def _async_state(self) -> tuple:
+        # httpx.AsyncClient und asyncio.Semaphore sind an ihre Event-Loop gebunden
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for known in [l for l in self._async_clients if l.is_closed()]:
+                del self._async_clients[known]
+            if loop not in self._async_clients:
+                import ollama
+                self._async_clients[loop] = (ollama.AsyncClient(**self._client_kwargs()), {})
+            return self._async_clients[loop]
+
+    def _async_semaphore(self, model: str) -> asyncio.Semaphore:
+        _, semaphores = self._async_state()
+        if model not in semaphores:
+            semaphores[model] = asyncio.Semaphore(self.model_concurrency.get(model, self.max_concurrency))
+        return semaphores[model]
+
+    def _request_kwargs(self, kwargs: dict) -> dict:
+        if self.keep_alive is not None:
+            kwargs.setdefault("keep_alive", self.keep_alive)
+        return kwargs
+
+    def _cache_lookup(self, model: str, messages: list, cache: bool, kwargs: dict) -> tuple:
+        """Returns (cache key or None, cached response data or None)."""
+        if not cache or self.response_cache is None:
+            return None, None
+        key = request_key(model, messages, **kwargs)
+        data = self.response_cache.get(key)
+        if data is not None:
+            self.stats.record_cache_hit(model)
+            self.logger.info(f"LLM ({model}) response served from cache.")
+        return key, data
+
+    def _is_valid(self, model: str, content: str, validate) -> bool:
+        if validate is None:
+            return True
+        try:
+            validate(content)
+            return True
+        except Exception as e:
+            self.logger.info(f"LLM ({model}) response not cached, validation failed: {e}")
+            return False
+
+    def _cache_store(self, key: str | None, model: str, response, validate=None):
+        if key is not None and response.get('done', True) and self._is_valid(model, response['message']['content'], validate):
+            self.response_cache.put(key, _response_dict(response))
+
+    def _cache_store_stream(self, key: str | None, model: str, final_chunk, content: list, validate=None):
+        # Nur vollständig gelesene Streams landen im Cache
+        if key is None:
+            return
+        text = "".join(content)
+        if self._is_valid(model, text, validate):
+            final = _response_dict(final_chunk)
+            final['message'] = {**final.get('message', {}), 'content': text}
+            self.response_cache.put(key, final)
+
+    def chat(self, model: str, messages: list, stream: bool = False, cache: bool = True, validate=None, **kwargs):
+        kwargs = self._request_kwargs(kwargs)
+        key, cached = self._cache_lookup(model, messages, cache, kwargs)
+        if stream:
+            return self._chat_stream(model, messages, kwargs, key, cached, validate)
+        if cached is not None:
+            return _cached_response(cached)
+        started = time.perf_counter()
+        retries = 0
+        with self._semaphore(model):
+            while True:
+                try:
+                    response = self.client.chat(model=model, messages=messages, **kwargs)
+                    break
+                except Exception as e:
+                    if retries >= self.retries or not _is_retryable(e):
+                        self.stats.record(model, time.perf_counter() - started, retries=retries, error=True)
+                        raise
+                    self.logger.warning(f"LLM ({model}) request failed ({e}). Retrying...")
+                    time.sleep(self.retry_backoff * 2 ** retries)
+                    retries += 1
+        self.stats.record(model, time.perf_counter() - started, *_token_counts(response), retries=retries)
+        self._cache_store(key, model, response, validate)
+        return response
+
+    def _chat_stream(self, model: str, messages: list, kwargs: dict, key: str | None = None,
+                     cached: dict | None = None, validate=None):
+        if cached is not None:
+            # Treffer: die ganze Antwort als ein einziger, abschließender Chunk
+            yield _cached_response(cached)
+            return
+        # Der Slot des Modells bleibt belegt, bis der Stream gelesen oder geschlossen ist.
+        # Streams werden nicht wiederholt (der Aufrufer hat evtl. schon Chunks verarbeitet).
+        started = time.perf_counter()
+        counts = (0, 0)
+        error = cancelled = False
+        content = []
+        with self._semaphore(model):
+            stream = self.client.chat(model=model, messages=messages, stream=True, **kwargs)
+            try:
+                for chunk in stream:
+                    content.append(chunk['message']['content'])
+                    if chunk.get('done'):
+                        counts = _token_counts(chunk)
+                        self._cache_store_stream(key, model, chunk, content, validate)
+                    yield chunk
+            except GeneratorExit:
+                cancelled = True  # Der Aufrufer hat den Stream vorzeitig geschlossen
+                raise
+            except Exception:
+                error = True
+                raise
+            finally:
+                # Schließt die HTTP-Antwort sofort; Ollama bricht die Generierung dann ab
+                stream.close()
+                self.stats.record(model, time.perf_counter() - started, *counts, error=error, cancelled=cancelled)
+
+
+class AsyncLLMGateway:
+    """The asyncio side of an LLMGateway (`gateway.aio.chat` mirrors ollama.AsyncClient.chat)."""
+    def __init__(self, gateway: LLMGateway):
+        self.gateway = gateway
+
+    async def chat(self, model: str, messages: list, stream: bool = False, cache: bool = True, validate=None, **kwargs):
+        gateway = self.gateway
+        kwargs = gateway._request_kwargs(kwargs)
+        key, cached = gateway._cache_lookup(model, messages, cache, kwargs)
+        if stream:
+            return self._chat_stream(model, messages, kwargs, key, cached, validate)
+        if cached is not None:
+            return _cached_response(cached)
+        client, _ = gateway._async_state()
+        started = time.perf_counter()
+        retries = 0
+        async with gateway._async_semaphore(model):
+            while True:
+                try:
+                    response = await client.chat(model=model, messages=messages, **kwargs)
+                    break
+                except asyncio.CancelledError:
+                    gateway.stats.record(model, time.perf_counter() - started, retries=retries, cancelled=True)
+                    raise
+                except Exception as e:
+                    if retries >= gateway.retries or not _is_retryable(e):
+                        gateway.stats.record(model, time.perf_counter() - started, retries=retries, error=True)
+                        raise
+                    gateway.logger.warning(f"LLM ({model}) request failed ({e}). Retrying...")
+                    await asyncio.sleep(gateway.retry_backoff * 2 ** retries)
+                    retries += 1
+        gateway.stats.record(model, time.perf_counter() - started, *_token_counts(response), retries=retries)
+        gateway._cache_store(key, model, response, validate)
+        return response
+
+
+    async def _chat_stream(self, model: str, messages: list, kwargs: dict, key: str | None, cached: dict | None,
+                           validate=None):
+        if cached is not None:
+            yield _cached_response(cached)
+            return
+        gateway = self.gateway
+        client, _ = gateway._async_state()
+        started = time.perf_counter()
+        counts = (0, 0)
+        error = cancelled = False
+        content = []
+        async with gateway._async_semaphore(model):
+            stream = await client.chat(model=model, messages=messages, stream=True, **kwargs)
+            try:
+                async for chunk in stream:
+                    content.append(chunk['message']['content'])
+                    if chunk.get('done'):
+                        counts = _token_counts(chunk)
+                        gateway._cache_store_stream(key, model, chunk, content, validate)
+                    yield chunk
+            except (GeneratorExit, asyncio.CancelledError):
+                cancelled = True
+                raise
+            except Exception:
+                error = True
+                raise
+            finally:
+                await stream.aclose()
+                gateway.stats.record(model, time.perf_counter() - started, *counts, error=error, cancelled=cancelled)
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """
+    Returns the process-wide gateway (created with the defaults, host from OLLAMA_HOST,
+    response cache at CAPA_LLM_CACHE if set).
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            response_cache = LLMResponseCache(DEFAULT_RESPONSE_CACHE_PATH) if DEFAULT_RESPONSE_CACHE_PATH else None
+            _gateway = LLMGateway(response_cache=response_cache)
+        return _gateway
+
+
+def configure_gateway(**kwargs) -> LLMGateway:
+    """Replaces the process-wide gateway; call before the first LLM request (see LLMGateway for the options)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = LLMGateway(**kwargs)
+        return _gateway
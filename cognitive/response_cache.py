@@ -0,0 +1,90 @@
+# cognitive/response_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 10000
+# Nur diese Anfrage-Felder bestimmen die Antwort (keep_alive, stream usw. nicht)
+_KEY_FIELDS = ("format", "options", "tools", "think")
+
+
+def request_key(model: str, messages: list, **kwargs) -> str:
+    """Content address of a chat request: sha256 over model, full messages and the sampling-relevant options."""
+    payload = {"model": model, "messages": [dict(m) for m in messages]}
+    payload.update({field: kwargs.get(field) for field in _KEY_FIELDS})
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Content-addressed cache of LLM chat responses in SQLite (`path=None` keeps it in
+    memory). Holds at most `max_entries` responses; the least recently used ones are
+    evicted first.
+    """
+    def __init__(self, path: str | None = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._db.commit()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, response: dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False, default=str), time.time())
+            )
+            excess = self._count_locked() - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+                )
+            self._db.commit()
+
+    def _count_locked(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count_locked()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
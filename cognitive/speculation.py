@@ -0,0 +1,63 @@
+# cognitive/speculation.py
+
+import threading
+
+
+class SpeculationStats:
+    """
+    Counters for speculative L4 planning: a speculation is a hit when L3 escalates and
+    the plan is used, a miss when L3 is confident and the plan is discarded. A discarded
+    plan that is still generating is cancelled. The tokens of every discarded plan are
+    counted as waste: as reported by the model for finished plans, estimated (prompt
+    size, chunks received) for cancelled ones.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.speculated = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+        self.wasted_prompt_tokens = 0
+        self.wasted_completion_tokens = 0
+        self.saved_seconds = 0.0
+
+    def record_start(self):
+        with self._lock:
+            self.speculated += 1
+
+    def record_hit(self, saved_seconds: float):
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += saved_seconds
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_cancelled(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def record_waste(self, usage: dict):
+        # Kommt bei synchronen Aufrufen erst, wenn der verworfene Plan fertig oder abgebrochen ist
+        with self._lock:
+            self.wasted_prompt_tokens += usage.get("prompt_tokens", 0)
+            self.wasted_completion_tokens += usage.get("completion_tokens", 0)
+
+    @property
+    def hit_rate(self) -> float:
+        decided = self.hits + self.misses
+        return self.hits / decided if decided else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "speculated": self.speculated,
+                "hits": self.hits,
+                "misses": self.misses,
+                "cancelled": self.cancelled,
+                "hit_rate": self.hit_rate,
+                "wasted_prompt_tokens": self.wasted_prompt_tokens,
+                "wasted_completion_tokens": self.wasted_completion_tokens,
+                "saved_seconds": self.saved_seconds,
+            }
@@ -0,0 +1,192 @@
+// cpp_core/src/journal_writer.cpp
+
+#include "journal_writer.h"
+#include <chrono>
+#include <cstdio>
+#include <filesystem>
+#include <stdexcept>
+#include <system_error>
+
+#ifdef _WIN32
+#include <io.h>
+#else
+#include <unistd.h>
+#endif
+
+FsyncPolicy parse_fsync_policy(const std::string& name) {
+    if (name == "none") return FsyncPolicy::None;
+    if (name == "sync") return FsyncPolicy::OnSync;
+    if (name == "always") return FsyncPolicy::Always;
+    throw std::invalid_argument("fsync must be one of 'none', 'sync', 'always'.");
+}
+
+JournalWriter::JournalWriter(const std::string& path, size_t flush_bytes,
+                             int flush_interval_ms, FsyncPolicy fsync_policy,
+                             size_t max_segment_bytes)
+    : path_(path), flush_bytes_(flush_bytes),
+      flush_interval_ms_(flush_interval_ms), fsync_policy_(fsync_policy),
+      max_segment_bytes_(max_segment_bytes) {
+    file_ = std::fopen(path_.c_str(), "ab");
+    if (file_ == nullptr) {
+        throw std::runtime_error("C++ Core: Could not open journal file at path: " + path_);
+    }
+    std::error_code ec;
+    file_size_ = static_cast<size_t>(std::filesystem::file_size(path_, ec));
+    if (ec) file_size_ = 0;
+    if (flush_interval_ms_ > 0) {
+        flusher_ = std::thread([this] {
+            const auto interval = std::chrono::milliseconds(flush_interval_ms_);
+            std::unique_lock<std::mutex> lock(mutex_);
+            while (!cv_.wait_for(lock, interval, [this] { return closed_; })) {
+                if (buffer_.empty()) continue;
+                try {
+                    flush_locked(false);
+                } catch (const std::exception& e) {
+                    error_ = e.what();
+                }
+            }
+        });
+    }
+}
+
+JournalWriter::~JournalWriter() {
+    try {
+        close();
+    } catch (...) {
+        // Destruktoren dürfen nicht werfen; close() hat den Puffer bereits versucht
+    }
+}
+
+void JournalWriter::log(const std::string& line) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    append_locked(line);
+    if (buffer_.size() >= flush_bytes_) {
+        flush_locked(false);
+    }
+}
+
+void JournalWriter::log_many(const std::vector<std::string>& lines) {
+    std::lock_guard<std::mutex> lock(mutex_);
+    for (const auto& line : lines) {
+        append_locked(line);
+    }
+    if (buffer_.size() >= flush_bytes_) {
+        flush_locked(false);
+    }
+}
+
+void JournalWriter::sync() {
+    std::lock_guard<std::mutex> lock(mutex_);
+    raise_pending_error_locked();
+    if (closed_) return;
+    flush_locked(fsync_policy_ != FsyncPolicy::None);
+}
+
+void JournalWriter::close() {
+    {
+        std::lock_guard<std::mutex> lock(mutex_);
+        if (closed_) return;
+        closed_ = true;
+    }
+    cv_.notify_all();
+    if (flusher_.joinable()) {
+        flusher_.join();
+    }
+    std::lock_guard<std::mutex> lock(mutex_);
+    try {
+        flush_locked(fsync_policy_ != FsyncPolicy::None);
+    } catch (...) {
+        std::fclose(file_);
+        file_ = nullptr;
+        throw;
+    }
+    std::fclose(file_);
+    file_ = nullptr;
+    raise_pending_error_locked();
+}
+
+size_t JournalWriter::pending_bytes() const {
+    std::lock_guard<std::mutex> lock(mutex_);
+    return buffer_.size();
+}
+
+void JournalWriter::append_locked(const std::string& line) {
+    raise_pending_error_locked();
+    if (closed_) {
+        throw std::runtime_error("C++ Core: Journal writer is closed: " + path_);
+    }
+    buffer_ += line;
+    buffer_ += '\n';
+}
+
+void JournalWriter::flush_locked(bool durable) {
+    if (file_ == nullptr) return;
+    if (!buffer_.empty()) {
+        if (std::fwrite(buffer_.data(), 1, buffer_.size(), file_) != buffer_.size()) {
+            throw std::runtime_error("C++ Core: Could not write journal file at path: " + path_);
+        }
+        file_size_ += buffer_.size();
+        buffer_.clear();
+    }
+    // Nach dem Flush sieht der Listener die neuen Zeilen
+    if (std::fflush(file_) != 0) {
+        throw std::runtime_error("C++ Core: Could not flush journal file at path: " + path_);
+    }
+    if (durable || fsync_policy_ == FsyncPolicy::Always) {
+#ifdef _WIN32
+        int rc = _commit(_fileno(file_));
+#else
+        int rc = ::fsync(fileno(file_));
+#endif
+        if (rc != 0) {
+            throw std::runtime_error("C++ Core: Could not fsync journal file at path: " + path_);
+        }
+    }
+    if (max_segment_bytes_ > 0 && file_size_ >= max_segment_bytes_ && !closed_) {
+        rotate_locked();
+    }
+}
+
+void JournalWriter::rotate_locked() {
+    namespace fs = std::filesystem;
+    const fs::path active(path_);
+    const std::string prefix = active.filename().string() + ".";
+
+    // Nächste Segmentnummer: eins nach der höchsten vorhandenen
+    unsigned long next_seq = 1;
+    std::error_code ec;
+    fs::path directory = active.has_parent_path() ? active.parent_path() : fs::path(".");
+    for (const auto& entry : fs::directory_iterator(directory, ec)) {
+        const std::string name = entry.path().filename().string();
+        const std::string suffix = name.substr(std::min(name.size(), prefix.size()));
+        if (name.size() != prefix.size() + 6 || name.compare(0, prefix.size(), prefix) != 0 ||
+            suffix.find_first_not_of("0123456789") != std::string::npos) {
+            continue;
+        }
+        next_seq = std::max(next_seq, std::stoul(suffix) + 1);
+    }
+
+    char sealed_suffix[16];
+    std::snprintf(sealed_suffix, sizeof(sealed_suffix), "%06lu", next_seq);
+
+    std::fclose(file_);
+    file_ = nullptr;
+    fs::rename(active, fs::path(path_ + "." + sealed_suffix), ec);
+    // Scheitert das Umbenennen (z.B. Datei unter Windows gesperrt), wird beim
+    // nächsten Flush erneut rotiert; bis dahin wird weiter angehängt.
+    file_ = std::fopen(path_.c_str(), "ab");
+    if (file_ == nullptr) {
+        throw std::runtime_error("C++ Core: Could not open journal file at path: " + path_);
+    }
+    if (!ec) {
+        file_size_ = 0;
+    }
+}
+
+void JournalWriter::raise_pending_error_locked() {
+    if (!error_.empty()) {
+        std::string message;
+        message.swap(error_);
+        throw std::runtime_error(message);
+    }
+}
@@ -0,0 +1,70 @@
+// cpp_core/src/journal_writer.h
+
+#ifndef JOURNAL_WRITER_H
+#define JOURNAL_WRITER_H
+
+#include <condition_variable>
+#include <cstdio>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+// Wann nach dem Schreiben zusätzlich fsync aufgerufen wird
+enum class FsyncPolicy {
+    None,   // nie; das Betriebssystem entscheidet
+    OnSync, // nur bei explizitem sync() und close()
+    Always  // nach jedem Group-Commit
+};
+
+FsyncPolicy parse_fsync_policy(const std::string& name);
+
+// Hält die Journal-Datei offen und sammelt Zeilen in einem Puffer. Der Puffer
+// wird als Gruppe geschrieben, sobald er flush_bytes erreicht, spätestens nach
+// flush_interval_ms (Hintergrund-Thread) oder bei sync()/close().
+// flush_bytes = 0 schreibt jede Zeile sofort; flush_interval_ms = 0 deaktiviert den Timer.
+//
+// Segment-Rotation (max_segment_bytes > 0): Erreicht die Datei die Grenze, wird sie
+// zu `<path>.<NNNNNN>` versiegelt (fortlaufende, sechsstellige Nummer nach dem
+// höchsten vorhandenen Segment) und `<path>` neu begonnen. memory/listener.py
+// verwendet dieselbe Namenskonvention.
+class JournalWriter {
+public:
+    JournalWriter(const std::string& path, size_t flush_bytes = 64 * 1024,
+                  int flush_interval_ms = 200, FsyncPolicy fsync_policy = FsyncPolicy::None,
+                  size_t max_segment_bytes = 0);
+    ~JournalWriter();
+    JournalWriter(const JournalWriter&) = delete;
+    JournalWriter& operator=(const JournalWriter&) = delete;
+
+    void log(const std::string& line);
+    void log_many(const std::vector<std::string>& lines);
+    void sync();
+    void close();
+
+    size_t pending_bytes() const;
+    const std::string& path() const { return path_; }
+
+private:
+    std::string path_;
+    size_t flush_bytes_;
+    int flush_interval_ms_;
+    FsyncPolicy fsync_policy_;
+    size_t max_segment_bytes_;
+    size_t file_size_ = 0;
+
+    mutable std::mutex mutex_;
+    std::condition_variable cv_;
+    std::thread flusher_;
+    std::FILE* file_ = nullptr;
+    std::string buffer_;
+    std::string error_; // Fehler des Hintergrund-Flushs, beim nächsten Aufruf gemeldet
+    bool closed_ = false;
+
+    void append_locked(const std::string& line);
+    void flush_locked(bool durable);
+    void raise_pending_error_locked();
+    void rotate_locked();
+};
+
+#endif // JOURNAL_WRITER_H
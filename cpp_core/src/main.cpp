@@ -2,28 +2,186 @@
 
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h> // For automatic type conversion
+#include <pybind11/numpy.h>
 #include "short_term_memory.h"
+#include "session_registry.h"
+#include "journal_writer.h"
 
 namespace py = pybind11;
 
+// Akzeptiert NumPy-Arrays und Python-Listen gleichermaßen
+using IntArray = py::array_t<int, py::array::c_style | py::array::forcecast>;
+using FloatArray = py::array_t<float, py::array::c_style | py::array::forcecast>;
+
+// Reine C++-Aufrufe geben den GIL frei, damit andere Python-Threads weiterlaufen
+using release_gil = py::call_guard<py::gil_scoped_release>;
+
+// Ruft eine Serialisierungsfunktion ohne GIL auf und verpackt das Ergebnis als bytes
+template <typename Fn>
+static py::bytes serialize_without_gil(Fn&& fn) {
+    std::vector<char> result;
+    {
+        py::gil_scoped_release release;
+        result = fn();
+    }
+    return py::bytes(result.data(), result.size());
+}
+
+static void check_length(const py::array& array, size_t expected, const char* name) {
+    if (static_cast<size_t>(array.size()) != expected) {
+        throw py::value_error(std::string(name) + " must have the same length as the ids.");
+    }
+}
+
 PYBIND11_MODULE(capa_core, m) {
     m.doc() = "High-performance core module for CAPA v3-R";
 
-    py::class_<ShortTermMemory>(m, "CPPCore")
-        .def(py::init<>())
+    // shared_ptr-Holder, damit die SessionRegistry dieselben Instanzen herausgeben kann
+    py::class_<ShortTermMemory, std::shared_ptr<ShortTermMemory>>(m, "CPPCore")
+        .def(py::init<size_t, float>(), py::arg("capacity") = 0, py::arg("decay_per_step") = 1.0f,
+             "Creates an STM. capacity=0 means unbounded; decay_per_step < 1 lets salience decay with every new node.")
         .def("add_node", &ShortTermMemory::add_node, 
              py::arg("label"), py::arg("salience") = 1.0f, 
-             "Adds a node with a given salience.")
-        .def("add_edge", &ShortTermMemory::add_edge, py::arg("from_id"), py::arg("to_id"), py::arg("weight"), "Adds a directed edge between two nodes.")
-        .def("update_node_salience", &ShortTermMemory::update_node_salience, py::arg("id"), py::arg("salience"), "Updates the salience of a specific node.")
+             "Adds a node with a given salience.", release_gil())
+        .def("add_edge", &ShortTermMemory::add_edge, py::arg("from_id"), py::arg("to_id"), py::arg("weight"), "Adds a directed edge between two nodes.", release_gil())
+        .def("update_node_salience", &ShortTermMemory::update_node_salience, py::arg("id"), py::arg("salience"), "Updates the salience of a specific node.", release_gil())
+        .def("add_nodes", [](ShortTermMemory &self, const std::vector<std::string>& labels, py::object saliences) {
+            std::vector<int> ids;
+            // Ein default-konstruiertes array_t ist ein leeres Array, kein Null-Handle
+            FloatArray values;
+            const float* data = nullptr;
+            if (!saliences.is_none()) {
+                values = FloatArray::ensure(saliences);
+                if (!values) throw py::type_error("saliences must be a sequence of floats.");
+                check_length(values, labels.size(), "saliences");
+                data = values.data();
+            }
+            {
+                py::gil_scoped_release release;
+                ids = self.add_nodes(labels, data);
+            }
+            return IntArray(ids.size(), ids.data());
+        }, py::arg("labels"), py::arg("saliences") = py::none(),
+           "Adds many nodes in one call and returns their ids as a NumPy array (aligned with labels). With a capacity, nodes evicted again within the same call get the id -1.")
+        .def("add_edges", [](ShortTermMemory &self, IntArray from_ids, IntArray to_ids, FloatArray weights) {
+            size_t count = from_ids.size();
+            check_length(to_ids, count, "to_ids");
+            check_length(weights, count, "weights");
+            py::gil_scoped_release release;
+            self.add_edges(from_ids.data(), to_ids.data(), weights.data(), count);
+        }, py::arg("from_ids"), py::arg("to_ids"), py::arg("weights"),
+           "Adds many directed edges in one call. Nothing is added if any node id is unknown.")
+        .def("update_saliences", [](ShortTermMemory &self, IntArray ids, FloatArray saliences) {
+            check_length(saliences, ids.size(), "saliences");
+            py::gil_scoped_release release;
+            self.update_saliences(ids.data(), saliences.data(), ids.size());
+        }, py::arg("ids"), py::arg("saliences"),
+           "Updates the salience of many nodes in one call. Nothing is changed if any node id is unknown.")
         .def("serialize_graph", [](ShortTermMemory &self) {
-            std::vector<char> result = self.serialize_graph();
             // Return as Python bytes
-            return py::bytes(result.data(), result.size());
+            return serialize_without_gil([&] { return self.serialize_graph(); });
         }, "Serializes the entire graph using msgpack and returns it as bytes.")
-        .def("log_to_ltm", &ShortTermMemory::log_to_ltm, py::arg("journal_path"), py::arg("data"), "Appends a JSON string to the specified journal file for asynchronous processing.")
+        .def("serialize_since", [](ShortTermMemory &self, uint64_t since_version) {
+            return serialize_without_gil([&] { return self.serialize_since(since_version); });
+        }, py::arg("since_version"),
+           "Serializes only changes since the given graph version as msgpack (version, is_full, nodes, edges, removed_ids, step, decay_per_step). Decay does not mark nodes as changed; unchanged nodes decay by decay_per_step ** (step - previous step).")
+        .def("graph_version", &ShortTermMemory::graph_version, "Returns the current graph version counter.")
+        .def("render_context", &ShortTermMemory::render_context,
+             py::arg("max_chars") = 4000, py::arg("top_k") = 50, py::arg("min_salience") = 0.0f,
+             "Renders the most salient/recent nodes and the edges between them as a prompt string within a character (codepoint) budget.",
+             release_gil())
+        .def("log_to_ltm", &ShortTermMemory::log_to_ltm, py::arg("journal_path"), py::arg("data"), "Appends a JSON string to the specified journal file for asynchronous processing.", release_gil())
         .def("should_store_in_stm", &ShortTermMemory::should_store_in_stm, 
              py::arg("label"), py::arg("metadata"),
              "Checks if a node should be stored in STM based on a simple keyword filter.")
-             .def("clear_graph", &ShortTermMemory::clear_graph, "Clears all nodes and edges from the STM.");
-}
\ No newline at end of file
+             .def("clear_graph", &ShortTermMemory::clear_graph, "Clears all nodes and edges from the STM.", release_gil())
+        .def("set_capacity", &ShortTermMemory::set_capacity, py::arg("capacity"),
+             "Sets the maximum number of nodes (0 = unbounded) and evicts immediately if exceeded.", release_gil())
+        .def("set_decay", &ShortTermMemory::set_decay, py::arg("decay_per_step"),
+             "Sets the per-step salience decay factor in (0, 1].", release_gil())
+        .def("node_count", &ShortTermMemory::node_count, "Returns the number of nodes currently in the STM.")
+        .def("memory_usage", &ShortTermMemory::memory_usage, "Returns the estimated memory footprint of the STM in bytes.")
+        .def("drain_evicted", [](ShortTermMemory &self) {
+            return serialize_without_gil([&] { return self.drain_evicted(); });
+        }, "Returns the evicted nodes and edges as msgpack (nodes, edges) and empties the eviction buffer.")
+        .def("set_max_evicted", &ShortTermMemory::set_max_evicted, py::arg("max_evicted"),
+             "Bounds the eviction buffer to max_evicted nodes and edges (0 = unbounded); the oldest entries are dropped.", release_gil())
+        .def("evicted_dropped", &ShortTermMemory::evicted_dropped,
+             "Returns how many evicted nodes were dropped because the eviction buffer was full.")
+        .def("spread_activation", [](ShortTermMemory &self, const std::vector<int>& seed_ids, int steps, float decay, float min_activation) {
+            return serialize_without_gil([&] { return self.spread_activation(seed_ids, steps, decay, min_activation); });
+        }, py::arg("seed_ids"), py::arg("steps") = 2, py::arg("decay") = 0.5f, py::arg("min_activation") = 0.01f,
+           "Spreads activation from the seed nodes and returns the activated subgraph as msgpack (nodes, edges, activations).")
+        .def("neighbors", [](ShortTermMemory &self, int id, int depth) {
+            return serialize_without_gil([&] { return self.neighbors(id, depth); });
+        }, py::arg("id"), py::arg("depth") = 1,
+           "Returns all nodes within `depth` hops (ignoring edge direction) as msgpack (nodes, edges).")
+        .def("save_snapshot", &ShortTermMemory::save_snapshot, py::arg("path"),
+             "Atomically writes a compact binary snapshot of the STM (including the eviction buffer).", release_gil())
+        .def("load_snapshot", &ShortTermMemory::load_snapshot, py::arg("path"),
+             "Replaces the STM with a snapshot written by save_snapshot; the file is memory-mapped.", release_gil())
+        .def("start_checkpointing", &ShortTermMemory::start_checkpointing, py::arg("path"), py::arg("interval_seconds") = 30.0,
+             "Starts a background thread that snapshots the STM whenever it changed, every interval_seconds.", release_gil())
+        .def("stop_checkpointing", &ShortTermMemory::stop_checkpointing,
+             "Stops background checkpointing after writing a final snapshot.", release_gil())
+        .def("last_checkpoint_error", &ShortTermMemory::last_checkpoint_error,
+             "Returns the error message of the last failed background checkpoint, or an empty string.");
+
+    py::class_<JournalWriter>(m, "JournalWriter")
+        .def(py::init([](const std::string& path, size_t flush_bytes, int flush_interval_ms, const std::string& fsync,
+                         size_t max_segment_bytes) {
+                 return std::make_unique<JournalWriter>(path, flush_bytes, flush_interval_ms, parse_fsync_policy(fsync),
+                                                        max_segment_bytes);
+             }),
+             py::arg("path"), py::arg("flush_bytes") = 64 * 1024, py::arg("flush_interval_ms") = 200, py::arg("fsync") = "none",
+             py::arg("max_segment_bytes") = 0,
+             "Buffered journal writer with group commit. fsync is 'none', 'sync' (on sync/close) or 'always'. "
+             "max_segment_bytes > 0 seals the journal to '<path>.NNNNNN' segments once it grows beyond that size.")
+        .def("log", &JournalWriter::log, py::arg("data"),
+             "Buffers one journal line; flushes when the buffer reaches flush_bytes.", release_gil())
+        .def("log_many", &JournalWriter::log_many, py::arg("lines"),
+             "Buffers many journal lines in one call.", release_gil())
+        .def("sync", &JournalWriter::sync,
+             "Writes all buffered lines to the file (and fsyncs unless fsync='none').", release_gil())
+        .def("close", &JournalWriter::close, "Flushes and closes the journal file.", release_gil())
+        .def("pending_bytes", &JournalWriter::pending_bytes, "Returns the number of buffered, unwritten bytes.")
+        .def_property_readonly("path", &JournalWriter::path)
+        .def("__enter__", [](JournalWriter &self) -> JournalWriter& { return self; }, py::return_value_policy::reference)
+        .def("__exit__", [](JournalWriter &self, py::args) {
+            py::gil_scoped_release release;
+            self.close();
+        });
+
+    py::class_<SessionRegistry>(m, "SessionRegistry")
+        .def(py::init<size_t, size_t, double, size_t, float, size_t>(),
+             py::arg("max_sessions") = 0, py::arg("max_total_bytes") = 0, py::arg("idle_timeout_seconds") = 0.0,
+             py::arg("default_capacity") = 0, py::arg("default_decay_per_step") = 1.0f,
+             py::arg("max_evicted_sessions") = 64,
+             "Registry of per-session CPPCore instances with LRU eviction. 0 disables a limit. At most "
+             "max_evicted_sessions evicted sessions are kept for consolidation; older ones are released.")
+        .def("create", &SessionRegistry::create,
+             py::arg("session_id"), py::arg("capacity") = py::none(), py::arg("decay_per_step") = py::none(),
+             "Creates a new session STM. Raises ValueError if the session already exists.", release_gil())
+        .def("get", &SessionRegistry::get, py::arg("session_id"),
+             "Returns the session STM (or None) and marks it as most recently used.", release_gil())
+        .def("get_or_create", &SessionRegistry::get_or_create, py::arg("session_id"),
+             "Returns the session STM, creating it with the registry defaults if needed.", release_gil())
+        .def("drop", &SessionRegistry::drop, py::arg("session_id"),
+             "Removes a session without queueing it for consolidation. Returns False if unknown.", release_gil())
+        .def("session_ids", &SessionRegistry::session_ids, "Returns all session ids, most recently used first.")
+        .def("memory_usage", &SessionRegistry::memory_usage, py::arg("session_id"),
+             "Returns the estimated memory footprint of one session in bytes.", release_gil())
+        .def("total_memory_usage", &SessionRegistry::total_memory_usage,
+             "Returns the estimated memory footprint of all sessions in bytes.", release_gil())
+        .def("evict_idle", &SessionRegistry::evict_idle,
+             "Re-measures all sessions and evicts idle sessions and LRU sessions above the limits. Returns the evicted ids.", release_gil())
+        .def("start_sweeping", &SessionRegistry::start_sweeping, py::arg("interval_seconds") = 5.0,
+             "Starts a background thread that calls evict_idle every interval_seconds.", release_gil())
+        .def("stop_sweeping", &SessionRegistry::stop_sweeping, "Stops the background sweep thread.", release_gil())
+        .def("drain_evicted_sessions", &SessionRegistry::drain_evicted_sessions,
+             "Returns the evicted (session_id, CPPCore) pairs so they can still be consolidated.")
+        .def("dropped_evicted_sessions", &SessionRegistry::dropped_evicted_sessions,
+             "Returns how many evicted sessions were released unconsolidated because the eviction queue was full.")
+        .def("__contains__", &SessionRegistry::contains)
+        .def("__len__", &SessionRegistry::size);
+}
@@ -0,0 +1,239 @@
+// cpp_core/src/session_registry.cpp
+
+#include "session_registry.h"
+#include <stdexcept>
+
+SessionRegistry::SessionRegistry(size_t max_sessions, size_t max_total_bytes,
+                                 double idle_timeout_seconds,
+                                 size_t default_capacity, float default_decay_per_step,
+                                 size_t max_evicted_sessions)
+    : max_sessions(max_sessions), max_total_bytes(max_total_bytes),
+      idle_timeout_seconds(idle_timeout_seconds),
+      default_capacity(default_capacity), default_decay_per_step(default_decay_per_step),
+      max_evicted_sessions(max_evicted_sessions) {}
+
+SessionRegistry::~SessionRegistry() {
+    stop_sweeping();
+}
+
+std::shared_ptr<ShortTermMemory> SessionRegistry::create(const std::string& session_id,
+                                                         std::optional<size_t> capacity,
+                                                         std::optional<float> decay_per_step) {
+    // Das STM außerhalb des Locks bauen; der Konstruktor prüft die Parameter
+    auto stm = std::make_shared<ShortTermMemory>(capacity.value_or(default_capacity),
+                                                 decay_per_step.value_or(default_decay_per_step));
+    std::lock_guard<std::mutex> lock(mutex);
+    if (sessions.count(session_id)) {
+        throw std::invalid_argument("Session already exists: " + session_id);
+    }
+    return insert_locked(session_id, stm);
+}
+
+std::shared_ptr<ShortTermMemory> SessionRegistry::get(const std::string& session_id) {
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = sessions.find(session_id);
+    if (it == sessions.end()) {
+        return nullptr;
+    }
+    // Wachstum seit dem letzten Zugriff erfassen und das Speicherlimit sofort durchsetzen
+    touch(it->second);
+    set_bytes_locked(it->second, it->second.stm->memory_usage());
+    auto stm = it->second.stm;
+    enforce_limits_locked(session_id);
+    return stm;
+}
+
+std::shared_ptr<ShortTermMemory> SessionRegistry::get_or_create(const std::string& session_id) {
+    if (auto stm = get(session_id)) {
+        return stm;
+    }
+    auto stm = std::make_shared<ShortTermMemory>(default_capacity, default_decay_per_step);
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = sessions.find(session_id);
+    if (it != sessions.end()) {
+        // Ein anderer Thread war schneller
+        touch(it->second);
+        return it->second.stm;
+    }
+    return insert_locked(session_id, stm);
+}
+
+std::shared_ptr<ShortTermMemory> SessionRegistry::insert_locked(const std::string& session_id,
+                                                                std::shared_ptr<ShortTermMemory> stm) {
+    lru.push_front(session_id);
+    Entry& entry = sessions[session_id];
+    entry = {stm, lru.begin(), Clock::now(), 0};
+    set_bytes_locked(entry, stm->memory_usage());
+    enforce_limits_locked(session_id);
+    return stm;
+}
+
+bool SessionRegistry::drop(const std::string& session_id) {
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = sessions.find(session_id);
+    if (it == sessions.end()) {
+        return false;
+    }
+    total_bytes -= it->second.bytes;
+    lru.erase(it->second.lru_pos);
+    sessions.erase(it);
+    return true;
+}
+
+bool SessionRegistry::contains(const std::string& session_id) const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return sessions.count(session_id) > 0;
+}
+
+size_t SessionRegistry::size() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return sessions.size();
+}
+
+std::vector<std::string> SessionRegistry::session_ids() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return std::vector<std::string>(lru.begin(), lru.end());
+}
+
+size_t SessionRegistry::memory_usage(const std::string& session_id) {
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = sessions.find(session_id);
+    if (it == sessions.end()) {
+        throw std::out_of_range("Unknown session: " + session_id);
+    }
+    set_bytes_locked(it->second, it->second.stm->memory_usage());
+    return it->second.bytes;
+}
+
+size_t SessionRegistry::total_memory_usage() {
+    remeasure();
+    std::lock_guard<std::mutex> lock(mutex);
+    return total_bytes;
+}
+
+std::vector<std::string> SessionRegistry::evict_idle() {
+    remeasure();
+    std::lock_guard<std::mutex> lock(mutex);
+    return enforce_limits_locked("");
+}
+
+void SessionRegistry::remeasure() {
+    // Messen ohne den Registry-Lock, damit get()/create() nicht auf große STMs warten
+    std::vector<std::pair<std::string, std::shared_ptr<ShortTermMemory>>> snapshot;
+    {
+        std::lock_guard<std::mutex> lock(mutex);
+        snapshot.reserve(sessions.size());
+        for (const auto& pair : sessions) {
+            snapshot.emplace_back(pair.first, pair.second.stm);
+        }
+    }
+    std::vector<size_t> usage;
+    usage.reserve(snapshot.size());
+    for (const auto& pair : snapshot) {
+        usage.push_back(pair.second->memory_usage());
+    }
+
+    std::lock_guard<std::mutex> lock(mutex);
+    for (size_t i = 0; i < snapshot.size(); ++i) {
+        auto it = sessions.find(snapshot[i].first);
+        if (it != sessions.end() && it->second.stm == snapshot[i].second) {
+            set_bytes_locked(it->second, usage[i]);
+        }
+    }
+}
+
+void SessionRegistry::start_sweeping(double interval_seconds) {
+    if (interval_seconds <= 0.0) {
+        throw std::invalid_argument("interval_seconds must be positive.");
+    }
+    stop_sweeping();
+    {
+        std::lock_guard<std::mutex> lock(sweep_mutex);
+        sweep_stop = false;
+    }
+    sweep_thread = std::thread([this, interval_seconds] {
+        const auto interval = std::chrono::duration<double>(interval_seconds);
+        std::unique_lock<std::mutex> lock(sweep_mutex);
+        while (!sweep_cv.wait_for(lock, interval, [this] { return sweep_stop; })) {
+            lock.unlock();
+            evict_idle();
+            lock.lock();
+        }
+    });
+}
+
+void SessionRegistry::stop_sweeping() {
+    {
+        std::lock_guard<std::mutex> lock(sweep_mutex);
+        sweep_stop = true;
+    }
+    sweep_cv.notify_all();
+    if (sweep_thread.joinable()) {
+        sweep_thread.join();
+    }
+}
+
+std::vector<std::pair<std::string, std::shared_ptr<ShortTermMemory>>> SessionRegistry::drain_evicted_sessions() {
+    std::lock_guard<std::mutex> lock(mutex);
+    std::vector<std::pair<std::string, std::shared_ptr<ShortTermMemory>>> result(
+        std::make_move_iterator(evicted.begin()), std::make_move_iterator(evicted.end()));
+    evicted.clear();
+    return result;
+}
+
+size_t SessionRegistry::dropped_evicted_sessions() const {
+    std::lock_guard<std::mutex> lock(mutex);
+    return dropped_sessions;
+}
+
+void SessionRegistry::touch(Entry& entry) {
+    lru.splice(lru.begin(), lru, entry.lru_pos);
+    entry.last_access = Clock::now();
+}
+
+void SessionRegistry::set_bytes_locked(Entry& entry, size_t bytes) {
+    total_bytes = total_bytes - entry.bytes + bytes;
+    entry.bytes = bytes;
+}
+
+void SessionRegistry::evict_locked(const std::string& session_id) {
+    auto it = sessions.find(session_id);
+    evicted.emplace_back(session_id, it->second.stm);
+    total_bytes -= it->second.bytes;
+    lru.erase(it->second.lru_pos);
+    sessions.erase(it);
+    // Niemand holt den Puffer ab: die ältesten STMs freigeben statt sie unbegrenzt zu halten
+    if (max_evicted_sessions > 0 && evicted.size() > max_evicted_sessions) {
+        evicted.pop_front();
+        ++dropped_sessions;
+    }
+}
+
+std::vector<std::string> SessionRegistry::enforce_limits_locked(const std::string& keep_id) {
+    std::vector<std::string> victims;
+
+    // 1. Untätige Sessions (von hinten, also die am längsten unbenutzten zuerst)
+    if (idle_timeout_seconds > 0.0) {
+        auto now = Clock::now();
+        while (!lru.empty() && lru.back() != keep_id) {
+            const Entry& oldest = sessions.at(lru.back());
+            std::chrono::duration<double> idle = now - oldest.last_access;
+            if (idle.count() < idle_timeout_seconds) {
+                break;
+            }
+            victims.push_back(lru.back());
+            evict_locked(lru.back());
+        }
+    }
+
+    // 2. Anzahl- und Speicherlimit in LRU-Reihenfolge durchsetzen (laufende Summe, O(1) je Prüfung)
+    auto over_limits = [this]() {
+        return (max_sessions > 0 && sessions.size() > max_sessions) ||
+               (max_total_bytes > 0 && total_bytes > max_total_bytes);
+    };
+    while (!lru.empty() && lru.back() != keep_id && over_limits()) {
+        victims.push_back(lru.back());
+        evict_locked(lru.back());
+    }
+    return victims;
+}
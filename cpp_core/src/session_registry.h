@@ -0,0 +1,103 @@
+// cpp_core/src/session_registry.h
+
+#ifndef SESSION_REGISTRY_H
+#define SESSION_REGISTRY_H
+
+#include <chrono>
+#include <condition_variable>
+#include <deque>
+#include <list>
+#include <memory>
+#include <mutex>
+#include <optional>
+#include <string>
+#include <thread>
+#include <unordered_map>
+#include <utility>
+#include <vector>
+#include "short_term_memory.h"
+
+// Verwaltet ein STM pro Session-ID, damit ein Prozess viele Nutzer bedienen kann.
+// Sessions werden in LRU-Reihenfolge geführt; überzählige, zu große oder zu lange
+// untätige Sessions werden verdrängt und in einem Puffer zur Konsolidierung abgelegt.
+// Der Puffer hält höchstens max_evicted_sessions STMs; ältere werden freigegeben.
+class SessionRegistry {
+public:
+    // 0 bei max_sessions / max_total_bytes / idle_timeout_seconds / max_evicted_sessions
+    // bedeutet "unbegrenzt"
+    SessionRegistry(size_t max_sessions = 0, size_t max_total_bytes = 0,
+                    double idle_timeout_seconds = 0.0,
+                    size_t default_capacity = 0, float default_decay_per_step = 1.0f,
+                    size_t max_evicted_sessions = 64);
+    ~SessionRegistry();
+
+    // Legt eine neue Session an; wirft, wenn die ID bereits existiert
+    std::shared_ptr<ShortTermMemory> create(const std::string& session_id,
+                                            std::optional<size_t> capacity = std::nullopt,
+                                            std::optional<float> decay_per_step = std::nullopt);
+    // Liefert die Session (oder nullptr) und markiert sie als zuletzt benutzt
+    std::shared_ptr<ShortTermMemory> get(const std::string& session_id);
+    std::shared_ptr<ShortTermMemory> get_or_create(const std::string& session_id);
+    bool drop(const std::string& session_id);
+    bool contains(const std::string& session_id) const;
+    size_t size() const;
+
+    // IDs in LRU-Reihenfolge (zuletzt benutzt zuerst)
+    std::vector<std::string> session_ids() const;
+
+    // Geschätzter Speicherbedarf in Bytes (misst neu und aktualisiert die laufende Summe)
+    size_t memory_usage(const std::string& session_id);
+    size_t total_memory_usage();
+
+    // Misst alle Sessions neu und verdrängt untätige Sessions sowie LRU-Sessions
+    // über den Limits. Gibt die IDs der verdrängten Sessions zurück.
+    std::vector<std::string> evict_idle();
+
+    // Hintergrund-Thread, der alle interval_seconds evict_idle() aufruft. So wird das
+    // Speicherlimit auch für Sessions durchgesetzt, die wachsen, ohne erneut geholt zu werden.
+    void start_sweeping(double interval_seconds);
+    void stop_sweeping();
+
+    // Verdrängte Sessions (ID, STM), damit der Aufrufer sie noch konsolidieren kann
+    std::vector<std::pair<std::string, std::shared_ptr<ShortTermMemory>>> drain_evicted_sessions();
+    // Anzahl verdrängter Sessions, die wegen max_evicted_sessions ohne Konsolidierung freigegeben wurden
+    size_t dropped_evicted_sessions() const;
+
+private:
+    using Clock = std::chrono::steady_clock;
+
+    struct Entry {
+        std::shared_ptr<ShortTermMemory> stm;
+        std::list<std::string>::iterator lru_pos;
+        Clock::time_point last_access;
+        size_t bytes; // zuletzt gemessener Speicherbedarf
+    };
+
+    size_t max_sessions;
+    size_t max_total_bytes;
+    double idle_timeout_seconds;
+    size_t default_capacity;
+    float default_decay_per_step;
+    size_t max_evicted_sessions;
+
+    mutable std::mutex mutex;
+    std::unordered_map<std::string, Entry> sessions;
+    std::list<std::string> lru; // vorne: zuletzt benutzt
+    size_t total_bytes = 0;     // Summe der Entry::bytes, damit Limits in O(1) prüfbar sind
+    std::deque<std::pair<std::string, std::shared_ptr<ShortTermMemory>>> evicted;
+    size_t dropped_sessions = 0;
+
+    std::thread sweep_thread;
+    std::mutex sweep_mutex;
+    std::condition_variable sweep_cv;
+    bool sweep_stop = false;
+
+    std::shared_ptr<ShortTermMemory> insert_locked(const std::string& session_id, std::shared_ptr<ShortTermMemory> stm);
+    void touch(Entry& entry);
+    void set_bytes_locked(Entry& entry, size_t bytes);
+    void remeasure(); // alle Sessions neu messen (ohne Lock während der Messung)
+    void evict_locked(const std::string& session_id);
+    std::vector<std::string> enforce_limits_locked(const std::string& keep_id);
+};
+
+#endif // SESSION_REGISTRY_H
@@ -1,18 +1,130 @@
 // cpp_core/src/short_term_memory.cpp (FINAL KORRIGIERT)
 
 #include "short_term_memory.h"
+#include "stm_snapshot.h"
 #include <fstream>
 #include <stdexcept>
 #include <sstream>
+#include <algorithm>
+#include <charconv>
+#include <unordered_set>
+#include <cmath>
+#include <deque>
+#include <cstring>
+#include <limits>
 
-ShortTermMemory::ShortTermMemory() : next_node_id(0) {}
+namespace {
+
+// Obergrenze für Grabsteine, bevor alte Deltas auf volle Snapshots zurückfallen
+const size_t MAX_TOMBSTONES = 4096;
+
+// Standardgrenze des Verdrängungspuffers, damit capacity eine echte Speichergrenze ist
+const size_t DEFAULT_MAX_EVICTED = 4096;
+
+// Formatiert Floats wie Pythons repr ("1.0", "0.75") für den Prompt.
+std::string format_float(float value) {
+    char buf[32];
+    auto result = std::to_chars(buf, buf + sizeof(buf), value);
+    std::string text(buf, result.ptr);
+    if (text.find_first_of(".eni") == std::string::npos) {
+        text += ".0";
+    }
+    return text;
+}
+
+// Länge in Zeichen (Unicode-Codepoints) eines UTF-8-Strings, wie Pythons len()
+size_t utf8_length(const std::string& text) {
+    size_t length = 0;
+    for (unsigned char c : text) {
+        if ((c & 0xC0) != 0x80) ++length; // Folgebytes zählen nicht
+    }
+    return length;
+}
+
+} // namespace
+
+ShortTermMemory::ShortTermMemory(size_t capacity, float decay_per_step)
+    : next_node_id(0), version(0), base_version(0),
+      capacity(capacity), decay_per_step(decay_per_step), step(0), tombstone_floor(0),
+      max_evicted(DEFAULT_MAX_EVICTED), dropped_evictions(0) {
+    if (decay_per_step <= 0.0f || decay_per_step > 1.0f) {
+        throw std::invalid_argument("decay_per_step must be in (0, 1].");
+    }
+}
+
+ShortTermMemory::~ShortTermMemory() {
+    stop_checkpointing();
+}
 
 int ShortTermMemory::add_node(const std::string& label, float salience) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
     int id = next_node_id++;
-    nodes[id] = {id, label, salience}; // Verwende den übergebenen Salienz-Wert
+    ++step;
+    nodes[id] = {id, label, salience, ++version, step}; // Verwende den übergebenen Salienz-Wert
+    decay_pending = decay_per_step < 1.0f;
+    enforce_capacity(id);
     return id;
 }
 
+std::vector<int> ShortTermMemory::add_nodes(const std::vector<std::string>& labels, const float* saliences) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    std::vector<int> ids;
+    ids.reserve(labels.size());
+    nodes.reserve(nodes.size() + labels.size());
+    for (size_t i = 0; i < labels.size(); ++i) {
+        int id = next_node_id++;
+        ++step;
+        float salience = saliences ? saliences[i] : 1.0f;
+        nodes[id] = {id, labels[i], salience, ++version, step};
+        ids.push_back(id);
+    }
+    decay_pending = decay_per_step < 1.0f && !labels.empty();
+    // Kapazität erst nach dem ganzen Batch durchsetzen
+    enforce_capacity(-1);
+    // Schon im selben Batch wieder verdrängte Knoten haben keine gültige ID mehr;
+    // -1 statt Auslassen, damit ids[i] weiter zu labels[i] gehört
+    if (capacity != 0) {
+        for (int& id : ids) {
+            if (nodes.find(id) == nodes.end()) id = -1;
+        }
+    }
+    return ids;
+}
+
+void ShortTermMemory::add_edges(const int* from_ids, const int* to_ids, const float* weights, size_t count) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    for (size_t i = 0; i < count; ++i) {
+        if (nodes.find(from_ids[i]) == nodes.end() || nodes.find(to_ids[i]) == nodes.end()) {
+            throw std::runtime_error("Node ID not found.");
+        }
+    }
+    edges.reserve(edges.size() + count);
+    for (size_t i = 0; i < count; ++i) {
+        edges.push_back({from_ids[i], to_ids[i], weights[i], ++version});
+        out_links[from_ids[i]].push_back({to_ids[i], weights[i]});
+        in_links[to_ids[i]].push_back({from_ids[i], weights[i]});
+    }
+}
+
+void ShortTermMemory::update_saliences(const int* ids, const float* saliences, size_t count) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    std::vector<Node*> targets;
+    targets.reserve(count);
+    for (size_t i = 0; i < count; ++i) {
+        auto it = nodes.find(ids[i]);
+        if (it == nodes.end()) {
+            throw std::runtime_error("Node ID not found.");
+        }
+        targets.push_back(&it->second);
+    }
+    uint64_t stamp = ++version;
+    for (size_t i = 0; i < count; ++i) {
+        targets[i]->salience = saliences[i];
+        targets[i]->version = stamp;
+        targets[i]->decay_step = step;
+    }
+}
+
 bool ShortTermMemory::should_store_in_stm(const std::string& label, const pybind11::dict& metadata) {
     const std::vector<std::string> irrelevant_keywords = {"rauschen", "unwichtig", "irrelevant"};
 
@@ -40,56 +152,728 @@ bool ShortTermMemory::should_store_in_stm(const std::string& label, const pybind
 }
 
 void ShortTermMemory::add_edge(int from_id, int to_id, float weight) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
     if (nodes.find(from_id) == nodes.end() || nodes.find(to_id) == nodes.end()) {
         throw std::runtime_error("Node ID not found.");
     }
-    edges.push_back({from_id, to_id, weight});
+    edges.push_back({from_id, to_id, weight, ++version});
+    out_links[from_id].push_back({to_id, weight});
+    in_links[to_id].push_back({from_id, weight});
 }
 
 void ShortTermMemory::clear_graph() {
+    std::unique_lock<std::shared_mutex> lock(mutex);
     nodes.clear();
     edges.clear();
+    out_links.clear();
+    in_links.clear();
+    removed_nodes.clear();
     next_node_id = 0;
+    // Alle Deltas, die vor diesem Punkt angefordert wurden, werden zu vollen Snapshots.
+    base_version = ++version;
 }
 
 void ShortTermMemory::update_node_salience(int id, float salience) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    auto it = nodes.find(id);
+    if (it == nodes.end()) {
+        throw std::runtime_error("Node ID not found.");
+    }
+    it->second.salience = salience;
+    it->second.version = ++version;
+    it->second.decay_step = step;
+}
+
+void ShortTermMemory::set_capacity(size_t new_capacity) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    capacity = new_capacity;
+    enforce_capacity(-1);
+}
+
+void ShortTermMemory::set_decay(float new_decay_per_step) {
+    if (new_decay_per_step <= 0.0f || new_decay_per_step > 1.0f) {
+        throw std::invalid_argument("decay_per_step must be in (0, 1].");
+    }
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    // Bisher aufgelaufenen Zerfall noch mit der alten Rate abrechnen. Empfänger
+    // von Deltas kennen nur die neue Rate, daher bekommen sie alle Knoten neu.
+    apply_pending_decay();
+    uint64_t stamp = ++version;
+    for (auto& pair : nodes) {
+        pair.second.decay_step = step;
+        pair.second.version = stamp;
+    }
+    decay_per_step = new_decay_per_step;
+}
+
+size_t ShortTermMemory::node_count() const {
+    std::shared_lock<std::shared_mutex> lock(mutex);
+    return nodes.size();
+}
+
+size_t ShortTermMemory::memory_usage() const {
+    std::shared_lock<std::shared_mutex> lock(mutex);
+    // Hash-Map-Knoten: Schlüssel, Wert und etwa zwei Zeiger Verwaltungsaufwand
+    const size_t map_node_overhead = sizeof(int) + 2 * sizeof(void*);
+
+    size_t total = sizeof(ShortTermMemory);
+    total += nodes.bucket_count() * sizeof(void*);
+    for (const auto& pair : nodes) {
+        total += sizeof(Node) + map_node_overhead + pair.second.label.capacity();
+    }
+    total += edges.capacity() * sizeof(Edge);
+    for (const auto* links : {&out_links, &in_links}) {
+        total += links->bucket_count() * sizeof(void*);
+        for (const auto& pair : *links) {
+            total += sizeof(std::vector<Link>) + map_node_overhead + pair.second.capacity() * sizeof(Link);
+        }
+    }
+    total += removed_nodes.capacity() * sizeof(std::pair<uint64_t, int>);
+    for (const auto& node : evicted_nodes) {
+        total += sizeof(Node) + node.label.capacity();
+    }
+    total += evicted_edges.size() * sizeof(Edge);
+    return total;
+}
+
+std::shared_lock<std::shared_mutex> ShortTermMemory::read_lock() {
+    if (decay_pending) {
+        std::unique_lock<std::shared_mutex> lock(mutex);
+        apply_pending_decay();
+    }
+    return std::shared_lock<std::shared_mutex>(mutex);
+}
+
+void ShortTermMemory::apply_pending_decay() {
+    if (!decay_pending) {
+        return;
+    }
+    decay_pending = false;
+    // Keine neue Version: der Zerfall ist ein globaler Faktor, den serialize_since
+    // über (step, decay_per_step) mitliefert. Sonst enthielte jedes Delta alle Knoten.
+    for (auto& pair : nodes) {
+        Node& node = pair.second;
+        if (node.decay_step >= step) {
+            continue;
+        }
+        node.salience *= std::pow(decay_per_step, static_cast<float>(step - node.decay_step));
+        node.decay_step = step;
+    }
+}
+
+void ShortTermMemory::enforce_capacity(int protected_id) {
+    if (capacity == 0 || nodes.size() <= capacity) {
+        return;
+    }
+    apply_pending_decay();
+
+    // Die am wenigsten salienten (bei Gleichstand: ältesten) Knoten verdrängen.
+    // Der gerade hinzugefügte Knoten ist geschützt.
+    std::vector<const Node*> candidates;
+    candidates.reserve(nodes.size());
+    for (const auto& pair : nodes) {
+        if (pair.first != protected_id) {
+            candidates.push_back(&pair.second);
+        }
+    }
+    size_t excess = std::min(nodes.size() - capacity, candidates.size());
+    std::nth_element(candidates.begin(), candidates.begin() + (excess - 1), candidates.end(),
+        [](const Node* a, const Node* b) {
+            if (a->salience != b->salience) return a->salience < b->salience;
+            return a->id < b->id;
+        });
+
+    std::unordered_set<int> victims;
+    uint64_t stamp = ++version;
+    for (size_t i = 0; i < excess; ++i) {
+        victims.insert(candidates[i]->id);
+    }
+    for (int id : victims) {
+        auto it = nodes.find(id);
+        evicted_nodes.push_back(it->second);
+        removed_nodes.emplace_back(stamp, id);
+        nodes.erase(it);
+        unlink_node(id);
+    }
+
+    // Inzidente Kanten mitnehmen; erase/remove erhält die Versionsreihenfolge
+    auto is_incident = [&victims](const Edge& e) {
+        return victims.count(e.from_id) || victims.count(e.to_id);
+    };
+    for (const auto& edge : edges) {
+        if (is_incident(edge)) {
+            evicted_edges.push_back(edge);
+        }
+    }
+    edges.erase(std::remove_if(edges.begin(), edges.end(), is_incident), edges.end());
+    trim_evicted();
+
+    if (removed_nodes.size() > MAX_TOMBSTONES) {
+        size_t drop = removed_nodes.size() / 2;
+        tombstone_floor = removed_nodes[drop - 1].first;
+        removed_nodes.erase(removed_nodes.begin(), removed_nodes.begin() + drop);
+    }
+}
+
+void ShortTermMemory::trim_evicted() {
+    if (max_evicted == 0) {
+        return;
+    }
+    // Älteste zuerst verwerfen: sie sind am längsten nicht mehr im Kontext
+    while (evicted_nodes.size() > max_evicted) {
+        evicted_nodes.pop_front();
+        ++dropped_evictions;
+    }
+    while (evicted_edges.size() > max_evicted) {
+        evicted_edges.pop_front();
+    }
+}
+
+void ShortTermMemory::unlink_node(int id) {
+    // Rückverweise bei den Nachbarn entfernen, dann die eigenen Listen
+    auto drop_links_to = [id](std::vector<Link>& links) {
+        links.erase(std::remove_if(links.begin(), links.end(),
+                                   [id](const Link& l) { return l.node == id; }),
+                    links.end());
+    };
+    auto out_it = out_links.find(id);
+    if (out_it != out_links.end()) {
+        for (const Link& link : out_it->second) {
+            auto in_it = in_links.find(link.node);
+            if (in_it != in_links.end()) drop_links_to(in_it->second);
+        }
+        out_links.erase(out_it);
+    }
+    auto in_it = in_links.find(id);
+    if (in_it != in_links.end()) {
+        for (const Link& link : in_it->second) {
+            auto back_it = out_links.find(link.node);
+            if (back_it != out_links.end()) drop_links_to(back_it->second);
+        }
+        in_links.erase(in_it);
+    }
+}
+
+std::vector<Edge> ShortTermMemory::edges_within(const std::vector<int>& ids) const {
+    std::unordered_set<int> members(ids.begin(), ids.end());
+    std::vector<Edge> result;
+    for (int id : ids) {
+        auto it = out_links.find(id);
+        if (it == out_links.end()) continue;
+        for (const Link& link : it->second) {
+            if (members.count(link.node)) {
+                result.push_back({id, link.node, link.weight});
+            }
+        }
+    }
+    return result;
+}
+
+std::vector<char> ShortTermMemory::spread_activation(const std::vector<int>& seed_ids, int steps,
+                                                     float decay, float min_activation) {
+    auto lock = read_lock();
+
+    std::unordered_map<int, float> activation;
+    std::unordered_map<int, float> frontier;
+    for (int id : seed_ids) {
+        if (nodes.count(id)) {
+            activation[id] = 1.0f;
+            frontier[id] = 1.0f;
+        }
+    }
+
+    for (int s = 0; s < steps && !frontier.empty(); ++s) {
+        std::unordered_map<int, float> next;
+        for (const auto& pair : frontier) {
+            float outgoing = pair.second * decay;
+            for (const auto* links : {&out_links, &in_links}) {
+                auto it = links->find(pair.first);
+                if (it == links->end()) continue;
+                for (const Link& link : it->second) {
+                    next[link.node] += outgoing * link.weight;
+                }
+            }
+        }
+        frontier.clear();
+        for (const auto& pair : next) {
+            activation[pair.first] += pair.second;
+            // Nur weiterverbreiten, was noch nennenswert Energie trägt
+            if (pair.second >= min_activation) {
+                frontier.insert(pair);
+            }
+        }
+    }
+
+    std::vector<std::pair<int, float>> ranked;
+    for (const auto& pair : activation) {
+        if (pair.second >= min_activation) {
+            ranked.push_back(pair);
+        }
+    }
+    std::sort(ranked.begin(), ranked.end(), [](const auto& a, const auto& b) {
+        if (a.second != b.second) return a.second > b.second;
+        return a.first < b.first;
+    });
+
+    std::vector<int> ids;
+    std::vector<Node> node_list;
+    std::vector<float> activations;
+    for (const auto& pair : ranked) {
+        ids.push_back(pair.first);
+        node_list.push_back(nodes.at(pair.first));
+        activations.push_back(pair.second);
+    }
+
+    std::tuple<std::vector<Node>, std::vector<Edge>, std::vector<float>> subgraph = {
+        node_list, edges_within(ids), activations};
+    msgpack::sbuffer buffer;
+    msgpack::pack(buffer, subgraph);
+    return std::vector<char>(buffer.data(), buffer.data() + buffer.size());
+}
+
+std::vector<char> ShortTermMemory::neighbors(int id, int depth) {
+    auto lock = read_lock();
     if (nodes.find(id) == nodes.end()) {
         throw std::runtime_error("Node ID not found.");
     }
-    nodes[id].salience = salience;
+
+    // Breitensuche über beide Kantenrichtungen
+    std::unordered_map<int, int> distance = {{id, 0}};
+    std::vector<int> order = {id};
+    std::deque<int> queue = {id};
+    while (!queue.empty()) {
+        int current = queue.front();
+        queue.pop_front();
+        int d = distance[current];
+        if (d >= depth) continue;
+        for (const auto* links : {&out_links, &in_links}) {
+            auto it = links->find(current);
+            if (it == links->end()) continue;
+            for (const Link& link : it->second) {
+                if (distance.emplace(link.node, d + 1).second) {
+                    order.push_back(link.node);
+                    queue.push_back(link.node);
+                }
+            }
+        }
+    }
+
+    std::vector<Node> node_list;
+    node_list.reserve(order.size());
+    for (int node_id : order) {
+        node_list.push_back(nodes.at(node_id));
+    }
+
+    std::tuple<std::vector<Node>, std::vector<Edge>> subgraph = {node_list, edges_within(order)};
+    msgpack::sbuffer buffer;
+    msgpack::pack(buffer, subgraph);
+    return std::vector<char>(buffer.data(), buffer.data() + buffer.size());
+}
+
+std::vector<char> ShortTermMemory::drain_evicted() {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    std::tuple<const std::deque<Node>&, const std::deque<Edge>&> evicted = {evicted_nodes, evicted_edges};
+    msgpack::sbuffer buffer;
+    msgpack::pack(buffer, evicted);
+    if (!evicted_nodes.empty() || !evicted_edges.empty()) {
+        ++version; // der Puffer ist Teil des Snapshots
+    }
+    evicted_nodes.clear();
+    evicted_edges.clear();
+    return std::vector<char>(buffer.data(), buffer.data() + buffer.size());
+}
+
+void ShortTermMemory::set_max_evicted(size_t new_max_evicted) {
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    max_evicted = new_max_evicted;
+    trim_evicted();
+}
+
+size_t ShortTermMemory::evicted_dropped() const {
+    std::shared_lock<std::shared_mutex> lock(mutex);
+    return dropped_evictions;
+}
+
+uint64_t ShortTermMemory::graph_version() const {
+    std::shared_lock<std::shared_mutex> lock(mutex);
+    return version;
 }
 
 std::vector<char> ShortTermMemory::serialize_graph() {
+    auto lock = read_lock();
     std::vector<Node> node_list;
+    node_list.reserve(nodes.size());
     for (const auto& pair : nodes) {
         node_list.push_back(pair.second);
     }
 
     std::tuple<std::vector<Node>, std::vector<Edge>> graph_data = {node_list, edges};
     
-    std::stringstream buffer;
+    // sbuffer statt stringstream: spart eine Kopie des gepackten Puffers
+    msgpack::sbuffer buffer;
     msgpack::pack(buffer, graph_data);
 
-    const std::string& str = buffer.str();
-    return std::vector<char>(str.begin(), str.end());
+    return std::vector<char>(buffer.data(), buffer.data() + buffer.size());
+}
+
+std::vector<char> ShortTermMemory::serialize_since(uint64_t since_version) {
+    auto lock = read_lock();
+
+    // Ein Empfänger, der älter als das letzte clear_graph() (oder die ältesten
+    // noch bekannten Grabsteine) ist, bekommt alles.
+    bool is_full = since_version < base_version || since_version < tombstone_floor;
+    uint64_t threshold = is_full ? 0 : since_version;
+
+    std::vector<Node> changed_nodes;
+    for (const auto& pair : nodes) {
+        if (pair.second.version > threshold) {
+            changed_nodes.push_back(pair.second);
+        }
+    }
+
+    // Kanten werden nur angehängt, daher sind sie nach Version sortiert.
+    auto first_new = std::upper_bound(
+        edges.begin(), edges.end(), threshold,
+        [](uint64_t v, const Edge& e) { return v < e.version; });
+    std::vector<Edge> new_edges(first_new, edges.end());
+
+    std::vector<int> removed_ids;
+    if (!is_full) {
+        for (const auto& tombstone : removed_nodes) {
+            if (tombstone.first > threshold) {
+                removed_ids.push_back(tombstone.second);
+            }
+        }
+    }
+
+    std::tuple<uint64_t, bool, std::vector<Node>, std::vector<Edge>, std::vector<int>, uint64_t, float> delta = {
+        version, is_full, changed_nodes, new_edges, removed_ids, step, decay_per_step};
+
+    msgpack::sbuffer buffer;
+    msgpack::pack(buffer, delta);
+    return std::vector<char>(buffer.data(), buffer.data() + buffer.size());
 }
 
 void ShortTermMemory::log_to_ltm(const std::string& journal_path, const std::string& json_data) {
-    // Open the exact path provided by the Python caller
+    // Mehrere Threads dürfen ihre Zeilen nicht ineinander schreiben
+    std::lock_guard<std::mutex> lock(journal_mutex);
+    // Die Datei bleibt offen, solange derselbe Pfad verwendet wird. flush_bytes = 0:
+    // jede Zeile wird sofort geflusht, damit der Listener sie direkt bemerkt.
+    // Ab 64 MiB wird das Journal zu einem Segment versiegelt (siehe journal_writer.h).
+    if (!journal || journal->path() != journal_path) {
+        journal = std::make_unique<JournalWriter>(journal_path, 0, 0, FsyncPolicy::None, 64 * 1024 * 1024);
+    }
+    journal->log(json_data);
+}
+std::string ShortTermMemory::render_context(int max_chars, int top_k, float min_salience) {
+    auto lock = read_lock();
+    if (nodes.empty()) {
+        return "The short-term memory is currently empty.";
+    }
+
+    // 1. Kandidaten nach Salienz (absteigend), dann Aktualität ordnen
+    std::vector<const Node*> ranked;
+    ranked.reserve(nodes.size());
+    for (const auto& pair : nodes) {
+        if (pair.second.salience >= min_salience) {
+            ranked.push_back(&pair.second);
+        }
+    }
+    std::sort(ranked.begin(), ranked.end(), [](const Node* a, const Node* b) {
+        if (a->salience != b->salience) return a->salience > b->salience;
+        return a->version > b->version;
+    });
+    if (top_k > 0 && ranked.size() > static_cast<size_t>(top_k)) {
+        ranked.resize(top_k);
+    }
+
+    // 2. Knoten in Rangfolge aufnehmen, solange das Zeichenbudget reicht.
+    // Gezählt werden Codepoints, nicht Bytes; Knoten werden nie angeschnitten.
+    const std::string prefix = "Current STM State: Nodes=[";
+    const std::string middle = "], Edges=[";
+    const std::string suffix = "]";
+    const size_t budget = max_chars > 0 ? static_cast<size_t>(max_chars) : std::string::npos;
+    size_t used = prefix.size() + middle.size() + suffix.size();
+
+    std::vector<std::pair<int, std::string>> selected;
+    std::unordered_set<int> selected_ids;
+    for (const Node* node : ranked) {
+        std::string text = "Node(" + std::to_string(node->id) + ", '" + node->label +
+                           "', salience=" + format_float(node->salience) + ")";
+        size_t cost = utf8_length(text) + (selected.empty() ? 0 : 2);
+        if (used + cost > budget) {
+            continue; // Kleinere, weniger saliente Knoten passen evtl. noch
+        }
+        used += cost;
+        selected_ids.insert(node->id);
+        selected.emplace_back(node->id, std::move(text));
+    }
+    // Für das LLM in chronologischer Reihenfolge ausgeben
+    std::sort(selected.begin(), selected.end(),
+              [](const auto& a, const auto& b) { return a.first < b.first; });
+
+    // 3. Kanten zwischen ausgewählten Knoten mit dem Restbudget auffüllen
+    std::vector<std::string> edge_texts;
+    for (const auto& edge : edges) {
+        if (!selected_ids.count(edge.from_id) || !selected_ids.count(edge.to_id)) {
+            continue;
+        }
+        std::string text = "Edge(" + std::to_string(edge.from_id) + "->" +
+                           std::to_string(edge.to_id) + ", w=" + format_float(edge.weight) + ")";
+        size_t cost = text.size() + (edge_texts.empty() ? 0 : 2);
+        if (used + cost > budget) {
+            break;
+        }
+        used += cost;
+        edge_texts.push_back(std::move(text));
+    }
+
+    std::string out;
+    out += prefix;
+    for (size_t i = 0; i < selected.size(); ++i) {
+        if (i) out += ", ";
+        out += selected[i].second;
+    }
+    out += middle;
+    for (size_t i = 0; i < edge_texts.size(); ++i) {
+        if (i) out += ", ";
+        out += edge_texts[i];
+    }
+    out += suffix;
+    return out;
+}
+
+std::string ShortTermMemory::build_snapshot() const {
+    SnapshotHeader header = {};
+    std::memcpy(header.magic, SNAPSHOT_MAGIC, sizeof(header.magic));
+    header.format_version = SNAPSHOT_FORMAT_VERSION;
+    header.next_node_id = next_node_id;
+    header.graph_version = version;
+    header.step = step;
+    header.node_count = nodes.size();
+    header.evicted_node_count = evicted_nodes.size();
+    header.edge_count = edges.size();
+    header.evicted_edge_count = evicted_edges.size();
+    for (const auto& pair : nodes) header.label_bytes += pair.second.label.size();
+    for (const auto& node : evicted_nodes) header.label_bytes += node.label.size();
+
+    const size_t node_records = header.node_count + header.evicted_node_count;
+    const size_t edge_records = header.edge_count + header.evicted_edge_count;
+    std::string bytes(sizeof(SnapshotHeader) + node_records * sizeof(SnapshotNode) +
+                      edge_records * sizeof(SnapshotEdge) + header.label_bytes, '\0');
+    std::memcpy(&bytes[0], &header, sizeof(header));
+
+    char* node_out = &bytes[sizeof(SnapshotHeader)];
+    char* edge_out = node_out + node_records * sizeof(SnapshotNode);
+    char* label_out = edge_out + edge_records * sizeof(SnapshotEdge);
+    uint64_t label_offset = 0;
+
+    auto write_node = [&](const Node& node) {
+        SnapshotNode record = {node.id, node.salience, node.decay_step, label_offset,
+                               static_cast<uint32_t>(node.label.size()), 0};
+        std::memcpy(node_out, &record, sizeof(record));
+        node_out += sizeof(record);
+        std::memcpy(label_out + label_offset, node.label.data(), node.label.size());
+        label_offset += node.label.size();
+    };
+    auto write_edge = [&](const Edge& edge) {
+        SnapshotEdge record = {edge.from_id, edge.to_id, edge.weight, 0};
+        std::memcpy(edge_out, &record, sizeof(record));
+        edge_out += sizeof(record);
+    };
+
+    for (const auto& pair : nodes) write_node(pair.second);
+    for (const auto& node : evicted_nodes) write_node(node);
+    for (const auto& edge : edges) write_edge(edge);
+    for (const auto& edge : evicted_edges) write_edge(edge);
+    return bytes;
+}
+
+uint64_t ShortTermMemory::write_snapshot(const std::string& path) {
+    std::string bytes;
+    uint64_t snapshot_version;
     {
-        std::ofstream journal_file(journal_path, std::ios::app);
-        if (!journal_file.is_open()) {
-            throw std::runtime_error("C++ Core: Could not open journal file at path: " + journal_path);
+        auto lock = read_lock();
+        bytes = build_snapshot();
+        snapshot_version = version;
+    }
+    // Die Datei wird ohne Graph-Lock geschrieben; Mutationen laufen weiter
+    std::lock_guard<std::mutex> lock(snapshot_mutex);
+    write_file_atomically(path, bytes);
+    return snapshot_version;
+}
+
+void ShortTermMemory::save_snapshot(const std::string& path) {
+    write_snapshot(path);
+}
+
+void ShortTermMemory::load_snapshot(const std::string& path) {
+    MappedFile file(path);
+    auto invalid = [&path](const std::string& reason) {
+        return std::runtime_error("C++ Core: Invalid snapshot file '" + path + "': " + reason);
+    };
+
+    SnapshotHeader header;
+    if (file.size() < sizeof(header)) {
+        throw invalid("file is too small");
+    }
+    std::memcpy(&header, file.data(), sizeof(header));
+    if (std::memcmp(header.magic, SNAPSHOT_MAGIC, sizeof(header.magic)) != 0) {
+        throw invalid("bad magic");
+    }
+    if (header.format_version != SNAPSHOT_FORMAT_VERSION) {
+        throw invalid("unsupported format version " + std::to_string(header.format_version));
+    }
+    // Größen gegen die Dateigröße prüfen, bevor irgendetwas multipliziert wird
+    const uint64_t max_records = file.size() / sizeof(SnapshotEdge);
+    if (header.node_count > max_records || header.evicted_node_count > max_records ||
+        header.edge_count > max_records || header.evicted_edge_count > max_records ||
+        header.label_bytes > file.size()) {
+        throw invalid("record counts exceed file size");
+    }
+    const uint64_t node_records = header.node_count + header.evicted_node_count;
+    const uint64_t edge_records = header.edge_count + header.evicted_edge_count;
+    const uint64_t expected = sizeof(SnapshotHeader) + node_records * sizeof(SnapshotNode) +
+                              edge_records * sizeof(SnapshotEdge) + header.label_bytes;
+    if (file.size() != expected) {
+        throw invalid("size mismatch");
+    }
+
+    // Die Datensätze liegen ausgerichtet in der Abbildung und werden direkt gelesen
+    const auto* node_records_ptr = reinterpret_cast<const SnapshotNode*>(file.data() + sizeof(SnapshotHeader));
+    const auto* edge_records_ptr = reinterpret_cast<const SnapshotEdge*>(node_records_ptr + node_records);
+    const char* labels = reinterpret_cast<const char*>(edge_records_ptr + edge_records);
+
+    auto to_node = [&](const SnapshotNode& record) {
+        if (record.label_offset > header.label_bytes ||
+            record.label_length > header.label_bytes - record.label_offset) {
+            throw invalid("label out of range");
         }
-    
-    journal_file << json_data << std::endl; // std::endl flushes, but we'll be more explicit.
-    
-    // --- DIE KORREKTUR ---
-    // Zwingt den Stream, seinen Puffer sofort auf die Festplatte zu schreiben.
-    // Das ist der entscheidende Schritt, damit watchdog die Änderung bemerkt.
-    journal_file.flush();
+        return Node{record.id, std::string(labels + record.label_offset, record.label_length),
+                    record.salience, 0, record.decay_step};
+    };
+
+    // IDs müssen eindeutig sein (lebend und verdrängt), und neue Knoten dürfen
+    // keine geladene ID wiederverwenden, auch wenn next_node_id im Header zu klein ist.
+    std::unordered_set<int> seen_ids;
+    seen_ids.reserve(node_records);
+    int64_t min_next_id = 0;
+    auto check_id = [&](int id) {
+        if (!seen_ids.insert(id).second) {
+            throw invalid("duplicate node id " + std::to_string(id));
+        }
+        min_next_id = std::max<int64_t>(min_next_id, static_cast<int64_t>(id) + 1);
+    };
+
+    std::unordered_map<int, Node> new_nodes;
+    new_nodes.reserve(header.node_count);
+    for (uint64_t i = 0; i < header.node_count; ++i) {
+        Node node = to_node(node_records_ptr[i]);
+        check_id(node.id);
+        new_nodes.emplace(node.id, std::move(node));
     }
-    
-    // Die Datei wird automatisch geschlossen, wenn journal_file am Ende der Funktion
-    // zerstört wird (RAII-Prinzip).
-}
\ No newline at end of file
+    std::deque<Node> new_evicted_nodes;
+    for (uint64_t i = header.node_count; i < node_records; ++i) {
+        new_evicted_nodes.push_back(to_node(node_records_ptr[i]));
+        check_id(new_evicted_nodes.back().id);
+    }
+    if (min_next_id > std::numeric_limits<int>::max()) {
+        throw invalid("node ids exhausted");
+    }
+    std::vector<Edge> new_edges;
+    new_edges.reserve(header.edge_count);
+    std::deque<Edge> new_evicted_edges;
+    for (uint64_t i = 0; i < edge_records; ++i) {
+        const SnapshotEdge& record = edge_records_ptr[i];
+        Edge edge{record.from_id, record.to_id, record.weight, 0};
+        if (i < header.edge_count) {
+            if (!new_nodes.count(edge.from_id) || !new_nodes.count(edge.to_id)) {
+                throw invalid("edge references unknown node");
+            }
+            new_edges.push_back(edge);
+        } else {
+            new_evicted_edges.push_back(edge);
+        }
+    }
+
+    std::unique_lock<std::shared_mutex> lock(mutex);
+    // Neue Version, die älter als jede bisher ausgegebene ist: alle Views bekommen
+    // beim nächsten serialize_since einen vollen Snapshot.
+    version = std::max(version, header.graph_version) + 1;
+    base_version = version;
+    tombstone_floor = 0;
+    removed_nodes.clear();
+    for (auto& pair : new_nodes) pair.second.version = version;
+    for (auto& edge : new_edges) edge.version = version;
+
+    nodes = std::move(new_nodes);
+    edges = std::move(new_edges);
+    evicted_nodes = std::move(new_evicted_nodes);
+    evicted_edges = std::move(new_evicted_edges);
+    trim_evicted();
+    next_node_id = static_cast<int>(std::max<int64_t>(header.next_node_id, min_next_id));
+    step = header.step;
+
+    out_links.clear();
+    in_links.clear();
+    for (const auto& edge : edges) {
+        out_links[edge.from_id].push_back({edge.to_id, edge.weight});
+        in_links[edge.to_id].push_back({edge.from_id, edge.weight});
+    }
+
+    bool stale = false;
+    for (const auto& pair : nodes) stale = stale || pair.second.decay_step < step;
+    decay_pending = decay_per_step < 1.0f && stale;
+    enforce_capacity(-1);
+}
+
+void ShortTermMemory::start_checkpointing(const std::string& path, double interval_seconds) {
+    if (interval_seconds <= 0.0) {
+        throw std::invalid_argument("interval_seconds must be positive.");
+    }
+    stop_checkpointing();
+    {
+        std::lock_guard<std::mutex> lock(checkpoint_mutex);
+        checkpoint_stop = false;
+        checkpoint_error.clear();
+    }
+    checkpoint_thread = std::thread([this, path, interval_seconds] {
+        const auto interval = std::chrono::duration<double>(interval_seconds);
+        uint64_t saved_version = std::numeric_limits<uint64_t>::max();
+        auto checkpoint = [&] {
+            try {
+                if (graph_version() != saved_version) {
+                    saved_version = write_snapshot(path);
+                }
+            } catch (const std::exception& e) {
+                std::lock_guard<std::mutex> lock(checkpoint_mutex);
+                checkpoint_error = e.what();
+            }
+        };
+
+        std::unique_lock<std::mutex> lock(checkpoint_mutex);
+        while (!checkpoint_cv.wait_for(lock, interval, [this] { return checkpoint_stop; })) {
+            lock.unlock();
+            checkpoint();
+            lock.lock();
+        }
+        lock.unlock();
+        checkpoint(); // letzter Stand beim Herunterfahren
+    });
+}
+
+void ShortTermMemory::stop_checkpointing() {
+    {
+        std::lock_guard<std::mutex> lock(checkpoint_mutex);
+        checkpoint_stop = true;
+    }
+    checkpoint_cv.notify_all();
+    if (checkpoint_thread.joinable()) {
+        checkpoint_thread.join();
+    }
+}
+
+std::string ShortTermMemory::last_checkpoint_error() const {
+    std::lock_guard<std::mutex> lock(checkpoint_mutex);
+    return checkpoint_error;
+}
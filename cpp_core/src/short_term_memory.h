@@ -5,10 +5,18 @@
 
 #include <string>
 #include <vector>
+#include <deque>
 #include <unordered_map>
+#include <shared_mutex>
+#include <mutex>
+#include <atomic>
+#include <thread>
+#include <condition_variable>
+#include <memory>
 #include <msgpack.hpp>
 #include <pybind11/pybind11.h> 
 #include <pybind11/stl.h>
+#include "journal_writer.h"
 
 namespace pybind11 { class dict; }
 
@@ -16,6 +24,8 @@ struct Node {
     int id;
     std::string label;
     float salience;
+    uint64_t version = 0;    // Graph-Version der letzten Änderung (wird nicht serialisiert)
+    uint64_t decay_step = 0; // Schritt, bis zu dem der Salienz-Zerfall angewendet ist
 
     MSGPACK_DEFINE(id, label, salience);
 };
@@ -24,20 +34,54 @@ struct Edge {
     int from_id;
     int to_id;
     float weight;
+    uint64_t version = 0; // Graph-Version, in der die Kante hinzugefügt wurde
 
     MSGPACK_DEFINE(from_id, to_id, weight);
 };
 
+// Eintrag einer Adjazenzliste: Nachbarknoten und Kantengewicht
+struct Link {
+    int node;
+    float weight;
+};
+
+// Thread-sicher: Mutationen nehmen den Schreib-, Abfragen den Lese-Lock.
+// Private Hilfsfunktionen setzen voraus, dass der Aufrufer den Lock hält.
 class ShortTermMemory {
 public:
-    ShortTermMemory();
+    // capacity = 0: unbegrenzt; decay_per_step = 1.0: kein Zerfall
+    explicit ShortTermMemory(size_t capacity = 0, float decay_per_step = 1.0f);
+    ~ShortTermMemory();
     int add_node(const std::string& label, float salience = 1.0f);
     void add_edge(int from_id, int to_id, float weight);
     void update_node_salience(int id, float salience);
+
+    // Batch-Varianten: ein Aufruf für viele Mutationen. Alle IDs werden vorab
+    // geprüft, sodass bei einem Fehler nichts angewendet wird. add_nodes liefert
+    // je Label die ID oder -1, wenn der Knoten wegen der Kapazität schon im selben
+    // Aufruf wieder verdrängt wurde.
+    std::vector<int> add_nodes(const std::vector<std::string>& labels, const float* saliences);
+    void add_edges(const int* from_ids, const int* to_ids, const float* weights, size_t count);
+    void update_saliences(const int* ids, const float* saliences, size_t count);
     
     // Serialisiert den Graphen zu einem Byte-Vektor
     std::vector<char> serialize_graph();
 
+    // Aktuelle Graph-Version; wird bei jeder Änderung erhöht
+    uint64_t graph_version() const;
+
+    // Serialisiert nur die Änderungen seit `since_version` als
+    // (version, is_full, nodes, edges, removed_ids, step, decay_per_step). is_full
+    // ist true, wenn der Graph seitdem geleert wurde und der Empfänger seinen
+    // Zustand verwerfen muss. Zerfall ändert keine Versionen: unveränderte Knoten
+    // rechnet der Empfänger selbst mit decay_per_step^(step - letzter step) ab.
+    std::vector<char> serialize_since(uint64_t since_version);
+
+    // Rendert die salientesten (bei Gleichstand: neuesten) Knoten und die Kanten
+    // zwischen ihnen als Prompt-Text, begrenzt auf max_chars Zeichen (Codepoints,
+    // nicht UTF-8-Bytes) und top_k Knoten. Werte <= 0 bedeuten "unbegrenzt".
+    std::string render_context(int max_chars, int top_k, float min_salience);
+
     // Schreibt einen JSON-String in die Journal-Datei (Aufgabe 2)
     void log_to_ltm(const std::string& journal_path, const std::string& json_data);
     bool should_store_in_stm(const std::string& label, const pybind11::dict& metadata);
@@ -45,10 +89,91 @@ public:
     // Löscht den gesamten Graphen
     void clear_graph();
 
+    // Kapazität und Zerfall. Ein neuer Knoten ist ein Schritt; der Zerfall
+    // (salience *= decay_per_step pro Schritt) wird erst beim Lesen angewendet.
+    void set_capacity(size_t capacity);
+    void set_decay(float decay_per_step);
+    size_t node_count() const;
+
+    // Geschätzter Speicherbedarf des STM in Bytes (inkl. Index und Puffer)
+    size_t memory_usage() const;
+
+    // Gibt die verdrängten Knoten/Kanten als msgpack (nodes, edges) zurück
+    // und leert den Verdrängungspuffer.
+    std::vector<char> drain_evicted();
+
+    // Obergrenze des Verdrängungspuffers (je max_evicted Knoten und Kanten,
+    // 0 = unbegrenzt). Darüber fallen die ältesten Einträge weg und werden gezählt.
+    void set_max_evicted(size_t max_evicted);
+    size_t evicted_dropped() const;
+
+    // Spreading Activation: startet mit Aktivierung 1.0 an den Saatknoten und
+    // gibt pro Schritt activation * weight * decay an alle Nachbarn (in beide
+    // Kantenrichtungen) weiter. Liefert msgpack (nodes, edges, activations) mit
+    // allen Knoten >= min_activation, absteigend nach Aktivierung sortiert.
+    std::vector<char> spread_activation(const std::vector<int>& seed_ids, int steps,
+                                        float decay, float min_activation);
+
+    // Alle Knoten im Abstand <= depth (ungerichtet) als msgpack (nodes, edges).
+    std::vector<char> neighbors(int id, int depth);
+
+    // Binärer Snapshot (Format siehe stm_snapshot.h). save schreibt atomar,
+    // load mappt die Datei und ersetzt den gesamten Graphen inkl. Verdrängungspuffer.
+    void save_snapshot(const std::string& path);
+    void load_snapshot(const std::string& path);
+
+    // Hintergrund-Thread, der alle interval_seconds einen Snapshot schreibt,
+    // sofern sich der Graph geändert hat (und ein letztes Mal beim Stoppen).
+    void start_checkpointing(const std::string& path, double interval_seconds);
+    void stop_checkpointing();
+    std::string last_checkpoint_error() const;
+
 private:
     std::unordered_map<int, Node> nodes;
-    std::vector<Edge> edges;
+    std::vector<Edge> edges; // nach Version sortiert (nur Anhängen)
     int next_node_id;
+    uint64_t version;      // erhöht bei jeder Mutation
+    uint64_t base_version; // Version des letzten clear_graph()
+
+    size_t capacity;
+    float decay_per_step;
+    uint64_t step;         // Anzahl der bisher hinzugefügten Knoten
+
+    // Grabsteine verdrängter Knoten (version, id) für serialize_since
+    std::vector<std::pair<uint64_t, int>> removed_nodes;
+    uint64_t tombstone_floor; // ältere Deltas brauchen einen vollen Snapshot
+
+    std::deque<Node> evicted_nodes;
+    std::deque<Edge> evicted_edges;
+    size_t max_evicted;
+    size_t dropped_evictions; // wegen max_evicted verworfene Knoten
+
+    // Adjazenzindex über `edges`: ausgehende und eingehende Kanten je Knoten
+    std::unordered_map<int, std::vector<Link>> out_links;
+    std::unordered_map<int, std::vector<Link>> in_links;
+
+    mutable std::shared_mutex mutex;
+    std::atomic<bool> decay_pending{false}; // neue Schritte seit dem letzten Zerfall
+    std::mutex journal_mutex;
+    std::unique_ptr<JournalWriter> journal; // bleibt zwischen log_to_ltm-Aufrufen offen
+
+    // Wendet ausstehenden Zerfall an und liefert danach einen Lese-Lock
+    std::shared_lock<std::shared_mutex> read_lock();
+    void apply_pending_decay();
+    void enforce_capacity(int protected_id);
+    void trim_evicted();
+    void unlink_node(int id);
+    std::vector<Edge> edges_within(const std::vector<int>& ids) const;
+
+    std::mutex snapshot_mutex; // serialisiert Schreibvorgänge auf die Snapshot-Datei
+    std::thread checkpoint_thread;
+    mutable std::mutex checkpoint_mutex;
+    std::condition_variable checkpoint_cv;
+    bool checkpoint_stop = false;
+    std::string checkpoint_error;
+
+    std::string build_snapshot() const;
+    uint64_t write_snapshot(const std::string& path);
 };
 
 #endif // SHORT_TERM_MEMORY_H
\ No newline at end of file
@@ -0,0 +1,158 @@
+// cpp_core/src/stm_snapshot.cpp
+
+#include "stm_snapshot.h"
+#include <algorithm>
+#include <cerrno>
+#include <filesystem>
+#include <stdexcept>
+
+#ifdef _WIN32
+#define NOMINMAX
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+#ifdef _WIN32
+
+MappedFile::MappedFile(const std::string& path) {
+    HANDLE file = CreateFileA(path.c_str(), GENERIC_READ, FILE_SHARE_READ, nullptr,
+                              OPEN_EXISTING, FILE_ATTRIBUTE_NORMAL, nullptr);
+    if (file == INVALID_HANDLE_VALUE) {
+        throw std::runtime_error("C++ Core: Could not open snapshot file at path: " + path);
+    }
+    file_handle_ = file;
+    LARGE_INTEGER file_size;
+    if (!GetFileSizeEx(file, &file_size)) {
+        CloseHandle(file);
+        throw std::runtime_error("C++ Core: Could not stat snapshot file at path: " + path);
+    }
+    size_ = static_cast<size_t>(file_size.QuadPart);
+    if (size_ == 0) {
+        return; // Leere Dateien lassen sich nicht mappen; die Formatprüfung schlägt fehl
+    }
+    HANDLE mapping = CreateFileMappingA(file, nullptr, PAGE_READONLY, 0, 0, nullptr);
+    if (mapping == nullptr) {
+        CloseHandle(file);
+        throw std::runtime_error("C++ Core: Could not map snapshot file at path: " + path);
+    }
+    mapping_handle_ = mapping;
+    data_ = static_cast<const char*>(MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0));
+    if (data_ == nullptr) {
+        CloseHandle(mapping);
+        CloseHandle(file);
+        throw std::runtime_error("C++ Core: Could not map snapshot file at path: " + path);
+    }
+}
+
+MappedFile::~MappedFile() {
+    if (data_) UnmapViewOfFile(data_);
+    if (mapping_handle_) CloseHandle(static_cast<HANDLE>(mapping_handle_));
+    if (file_handle_) CloseHandle(static_cast<HANDLE>(file_handle_));
+}
+
+#else
+
+MappedFile::MappedFile(const std::string& path) {
+    fd_ = ::open(path.c_str(), O_RDONLY);
+    if (fd_ < 0) {
+        throw std::runtime_error("C++ Core: Could not open snapshot file at path: " + path);
+    }
+    struct stat info;
+    if (::fstat(fd_, &info) != 0) {
+        ::close(fd_);
+        throw std::runtime_error("C++ Core: Could not stat snapshot file at path: " + path);
+    }
+    size_ = static_cast<size_t>(info.st_size);
+    if (size_ == 0) {
+        return; // Leere Dateien lassen sich nicht mappen; die Formatprüfung schlägt fehl
+    }
+    void* mapped = ::mmap(nullptr, size_, PROT_READ, MAP_PRIVATE, fd_, 0);
+    if (mapped == MAP_FAILED) {
+        ::close(fd_);
+        throw std::runtime_error("C++ Core: Could not map snapshot file at path: " + path);
+    }
+    data_ = static_cast<const char*>(mapped);
+}
+
+MappedFile::~MappedFile() {
+    if (data_) ::munmap(const_cast<char*>(data_), size_);
+    if (fd_ >= 0) ::close(fd_);
+}
+
+#endif
+
+#ifdef _WIN32
+
+void write_file_atomically(const std::string& path, const std::string& bytes) {
+    const std::string tmp_path = path + ".tmp";
+    HANDLE file = CreateFileA(tmp_path.c_str(), GENERIC_WRITE, 0, nullptr,
+                              CREATE_ALWAYS, FILE_ATTRIBUTE_NORMAL, nullptr);
+    if (file == INVALID_HANDLE_VALUE) {
+        throw std::runtime_error("C++ Core: Could not open snapshot file at path: " + tmp_path);
+    }
+    size_t written = 0;
+    bool ok = true;
+    while (ok && written < bytes.size()) {
+        DWORD chunk = 0;
+        DWORD to_write = static_cast<DWORD>(std::min<size_t>(bytes.size() - written, 1u << 30));
+        ok = WriteFile(file, bytes.data() + written, to_write, &chunk, nullptr) != 0;
+        written += chunk;
+    }
+    // Erst auf die Platte, dann umbenennen: sonst kann nach einem Absturz ein leerer Snapshot übrig bleiben
+    ok = ok && FlushFileBuffers(file) != 0;
+    CloseHandle(file);
+    if (!ok) {
+        throw std::runtime_error("C++ Core: Could not write snapshot file at path: " + tmp_path);
+    }
+    // MOVEFILE_WRITE_THROUGH kehrt erst zurück, wenn die Umbenennung geschrieben ist
+    if (!MoveFileExA(tmp_path.c_str(), path.c_str(), MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH)) {
+        throw std::runtime_error("C++ Core: Could not replace snapshot file at path: " + path);
+    }
+}
+
+#else
+
+void write_file_atomically(const std::string& path, const std::string& bytes) {
+    const std::string tmp_path = path + ".tmp";
+    int fd = ::open(tmp_path.c_str(), O_WRONLY | O_CREAT | O_TRUNC, 0644);
+    if (fd < 0) {
+        throw std::runtime_error("C++ Core: Could not open snapshot file at path: " + tmp_path);
+    }
+    size_t written = 0;
+    while (written < bytes.size()) {
+        ssize_t chunk = ::write(fd, bytes.data() + written, bytes.size() - written);
+        if (chunk < 0) {
+            if (errno == EINTR) continue;
+            ::close(fd);
+            throw std::runtime_error("C++ Core: Could not write snapshot file at path: " + tmp_path);
+        }
+        written += static_cast<size_t>(chunk);
+    }
+    // Erst auf die Platte, dann umbenennen: sonst kann nach einem Absturz ein leerer Snapshot übrig bleiben
+    if (::fsync(fd) != 0) {
+        ::close(fd);
+        throw std::runtime_error("C++ Core: Could not sync snapshot file at path: " + tmp_path);
+    }
+    ::close(fd);
+    // Umbenennen ersetzt den alten Snapshot in einem Schritt
+    if (::rename(tmp_path.c_str(), path.c_str()) != 0) {
+        throw std::runtime_error("C++ Core: Could not replace snapshot file at path: " + path);
+    }
+    // Das Verzeichnis synchronisieren, damit die Umbenennung selbst dauerhaft ist
+    std::string directory = std::filesystem::path(path).parent_path().string();
+    int dir_fd = ::open(directory.empty() ? "." : directory.c_str(), O_RDONLY | O_DIRECTORY);
+    if (dir_fd < 0) {
+        throw std::runtime_error("C++ Core: Could not open snapshot directory: " + directory);
+    }
+    int synced = ::fsync(dir_fd);
+    ::close(dir_fd);
+    if (synced != 0) {
+        throw std::runtime_error("C++ Core: Could not sync snapshot directory: " + directory);
+    }
+}
+
+#endif
@@ -0,0 +1,85 @@
+// cpp_core/src/stm_snapshot.h
+
+#ifndef STM_SNAPSHOT_H
+#define STM_SNAPSHOT_H
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+
+// Binäres Snapshot-Format des STM. Alle Datensätze haben eine feste Größe,
+// sodass die gemappte Datei direkt als Arrays gelesen werden kann:
+//
+//   SnapshotHeader
+//   SnapshotNode[node_count]          (lebende Knoten)
+//   SnapshotNode[evicted_node_count]  (noch nicht konsolidierte, verdrängte Knoten)
+//   SnapshotEdge[edge_count]
+//   SnapshotEdge[evicted_edge_count]
+//   char labels[label_bytes]          (alle Labels hintereinander, ohne Terminator)
+//
+// Die Werte werden in nativer Byte-Reihenfolge geschrieben; ein Snapshot ist
+// für denselben Rechner gedacht, nicht als Austauschformat.
+
+constexpr char SNAPSHOT_MAGIC[8] = {'C', 'A', 'P', 'A', 'S', 'T', 'M', '1'};
+constexpr uint32_t SNAPSHOT_FORMAT_VERSION = 1;
+
+struct SnapshotHeader {
+    char magic[8];
+    uint32_t format_version;
+    int32_t next_node_id;
+    uint64_t graph_version;
+    uint64_t step;
+    uint64_t node_count;
+    uint64_t evicted_node_count;
+    uint64_t edge_count;
+    uint64_t evicted_edge_count;
+    uint64_t label_bytes;
+};
+
+struct SnapshotNode {
+    int32_t id;
+    float salience;
+    uint64_t decay_step;
+    uint64_t label_offset;
+    uint32_t label_length;
+    uint32_t reserved;
+};
+
+struct SnapshotEdge {
+    int32_t from_id;
+    int32_t to_id;
+    float weight;
+    uint32_t reserved;
+};
+
+static_assert(sizeof(SnapshotHeader) == 72, "unexpected SnapshotHeader padding");
+static_assert(sizeof(SnapshotNode) == 32, "unexpected SnapshotNode padding");
+static_assert(sizeof(SnapshotEdge) == 16, "unexpected SnapshotEdge padding");
+
+// Schreibgeschützte Speicherabbildung einer Datei (RAII), POSIX und Windows
+class MappedFile {
+public:
+    explicit MappedFile(const std::string& path);
+    ~MappedFile();
+    MappedFile(const MappedFile&) = delete;
+    MappedFile& operator=(const MappedFile&) = delete;
+
+    const char* data() const { return data_; }
+    size_t size() const { return size_; }
+
+private:
+    const char* data_ = nullptr;
+    size_t size_ = 0;
+#ifdef _WIN32
+    void* file_handle_ = nullptr;
+    void* mapping_handle_ = nullptr;
+#else
+    int fd_ = -1;
+#endif
+};
+
+// Schreibt die Bytes atomar und dauerhaft: erst in `<path>.tmp` (fsync), dann
+// Umbenennen und fsync des Verzeichnisses
+void write_file_atomically(const std::string& path, const std::string& bytes);
+
+#endif // STM_SNAPSHOT_H
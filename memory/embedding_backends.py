@@ -0,0 +1,106 @@
+# memory/embedding_backends.py
+
+import logging
+import os
+from functools import cached_property
+
+import numpy as np
+
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2, SentenceTransformerEmbeddingFunction
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+# "sentence-transformers": PyTorch fp32 (bisheriges Verhalten)
+# "onnx": ONNX Runtime fp32; "onnx-int8": ONNX Runtime mit dynamisch int8-quantisierten Gewichten
+EMBEDDING_BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+DEFAULT_EMBEDDING_BACKEND = os.environ.get("CAPA_EMBEDDING_BACKEND", "sentence-transformers")
+
+
+class ONNXMiniLMEmbeddingFunction(ONNXMiniLM_L6_V2):
+    """
+    all-MiniLM-L6-v2 on ONNX Runtime (the model files chromadb downloads), optionally
+    with int8-quantized weights and a fixed number of intra-op threads. Batches are
+    padded to their longest text instead of always to 256 tokens.
+    """
+    def __init__(self, quantized: bool = True, num_threads: int | None = None,
+                 preferred_providers: list[str] | None = None):
+        super().__init__(preferred_providers=preferred_providers)
+        self.quantized = quantized
+        self.num_threads = num_threads
+
+    @cached_property
+    def tokenizer(self):
+        tokenizer = self.Tokenizer.from_file(
+            os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "tokenizer.json")
+        )
+        tokenizer.enable_truncation(max_length=256)
+        # Mean-Pooling ist durch die Attention-Maske unabhängig vom Padding
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        return tokenizer
+
+    def _forward(self, documents: list[str], batch_size: int = 32) -> np.ndarray:
+        all_embeddings = []
+        for start in range(0, len(documents), batch_size):
+            # encode_batch paddet auf den längsten Text des Batches
+            encoded = self.tokenizer.encode_batch(list(documents[start:start + batch_size]))
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            last_hidden_state = self.model.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            })[0]
+            # Mean-Pooling über die echten Tokens
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            embeddings = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            all_embeddings.append(self._normalize(embeddings).astype(np.float32))
+        return np.concatenate(all_embeddings)
+
+    @cached_property
+    def model(self):
+        self._download_model_if_not_exists()
+        model_path = os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx")
+        if self.quantized:
+            model_path = quantize_model(model_path)
+
+        options = self.ort.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+            options.inter_op_num_threads = 1
+        return self.ort.InferenceSession(
+            model_path,
+            providers=self._preferred_providers or ["CPUExecutionProvider"],
+            sess_options=options,
+        )
+
+
+def quantize_model(model_path: str) -> str:
+    """
+    Returns the path of an int8 (dynamic, weight-only) quantized copy of the ONNX
+    model, creating it next to the original on first use.
+    """
+    root, ext = os.path.splitext(model_path)
+    quantized_path = f"{root}_int8{ext}"
+    if os.path.exists(quantized_path):
+        return quantized_path
+    # onnx wird nur für die einmalige Quantisierung gebraucht
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logging.info(f"Quantizing '{model_path}' to int8...")
+    tmp_path = f"{root}_int8.tmp{ext}"
+    quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+def make_embedding_function(backend: str = DEFAULT_EMBEDDING_BACKEND, num_threads: int | None = None):
+    """Creates the embedding function for `backend` (see EMBEDDING_BACKENDS)."""
+    if backend == "sentence-transformers":
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        return SentenceTransformerEmbeddingFunction(model_name=MODEL_NAME)
+    if backend in ("onnx", "onnx-int8"):
+        return ONNXMiniLMEmbeddingFunction(quantized=backend == "onnx-int8", num_threads=num_threads)
+    raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
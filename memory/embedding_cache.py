@@ -0,0 +1,145 @@
+# memory/embedding_cache.py
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+DEFAULT_MEMORY_ENTRIES = 4096
+
+# Dateiformat: 16-Byte-Header (Magic, Dimension), danach Datensätze fester Länge
+# aus SHA-256 des Textes und dem float32-Vektor. Neue Datensätze werden mit einem
+# einzigen write() angehängt, daher können sich Prozesse (Agent, Listener) eine
+# Datei teilen.
+_MAGIC = b"CAPAEMB1"
+_HEADER = struct.Struct("<8sI4x")
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Wraps an embedding function with a content-hash -> vector cache: an in-memory
+    LRU in front of an append-only, memory-mapped float32 store on disk. Only texts
+    that were never embedded before reach the wrapped model.
+    """
+    def __init__(self, embedding_function, cache_path: str | None = None,
+                 max_memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.embedding_function = embedding_function
+        self.cache_path = cache_path
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._rows = {}     # Digest -> Zeile in der Datei
+        self._indexed = 0   # Anzahl der bereits indizierten Datensätze
+        self._dim = None
+        self._records = None  # np.memmap über alle bisher bekannten Datensätze
+        self._lock = threading.Lock()
+        if cache_path and os.path.exists(cache_path):
+            self._refresh()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        keys = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+        with self._lock:
+            vectors = [self._lookup(key) for key in keys]
+            missing = {key: text for key, text, vector in zip(keys, texts, vectors) if vector is None}
+            if missing and self.cache_path:
+                # Ein anderer Prozess hat die Datei eventuell erweitert
+                self._refresh()
+                vectors = [vector if vector is not None else self._lookup(key) for key, vector in zip(keys, vectors)]
+                missing = {key: text for key, text, vector in zip(keys, texts, vectors) if vector is None}
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = self.embedding_function(list(missing.values()))
+            computed = dict(zip(missing, (np.asarray(v, dtype=np.float32) for v in computed)))
+            with self._lock:
+                self._store(computed)
+            vectors = [vector if vector is not None else computed[key] for key, vector in zip(keys, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def _lookup(self, key: bytes):
+        vector = self._lru.get(key)
+        if vector is not None:
+            self._lru.move_to_end(key)
+            return vector
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        vector = np.array(self._records['vector'][row])
+        self._remember(key, vector)
+        return vector
+
+    def _remember(self, key: bytes, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def _record_dtype(self, dim: int) -> np.dtype:
+        return np.dtype([('key', 'S32'), ('vector', '<f4', (dim,))])
+
+    def _refresh(self):
+        """(Re)maps the store and indexes the records appended since the last refresh."""
+        try:
+            with open(self.cache_path, 'rb') as f:
+                header = f.read(_HEADER.size)
+        except FileNotFoundError:
+            return
+        if len(header) < _HEADER.size:
+            return
+        magic, dim = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            raise ValueError(f"'{self.cache_path}' is not an embedding cache file.")
+        self._dim = dim
+        dtype = self._record_dtype(dim)
+        count = (os.path.getsize(self.cache_path) - _HEADER.size) // dtype.itemsize
+        if count == self._indexed:
+            return
+        self._records = np.memmap(self.cache_path, dtype=dtype, mode='r', offset=_HEADER.size, shape=(count,))
+        for row, key in enumerate(self._records['key'][self._indexed:], start=self._indexed):
+            self._rows.setdefault(bytes(key), row)
+        self._indexed = count
+
+    def _store(self, computed: dict):
+        for key, vector in computed.items():
+            self._remember(key, vector)
+        if not self.cache_path:
+            return
+        dim = len(next(iter(computed.values())))
+        if self._dim is None:
+            self._create_file(dim)
+        if dim != self._dim:
+            self.logger.warning(f"Embedding dimension {dim} does not match cache file ({self._dim}). Not persisting.")
+            return
+        records = np.empty(len(computed), dtype=self._record_dtype(dim))
+        records['key'] = list(computed)
+        records['vector'] = list(computed.values())
+        fd = os.open(self.cache_path, os.O_WRONLY | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+        try:
+            os.write(fd, records.tobytes())
+        finally:
+            os.close(fd)
+        self._refresh()
+
+    def _create_file(self, dim: int):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        try:
+            fd = os.open(self.cache_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+        except FileExistsError:
+            pass  # Ein anderer Prozess war schneller
+        else:
+            try:
+                os.write(fd, _HEADER.pack(_MAGIC, dim))
+            finally:
+                os.close(fd)
+        self._refresh()
+        if self._dim is None:
+            self._dim = dim
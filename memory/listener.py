@@ -1,84 +1,407 @@
-# memory/listener.py (FINAL, POLLING VERSION)
+# memory/listener.py (EVENT-DRIVEN VERSION)
 
 import time
 import json
 import logging
 import os
-# --- DIE ÄNDERUNG: Wir importieren den PollingObserver ---
-from watchdog.observers.polling import PollingObserver as Observer 
+import re
+import threading
+# Nativer Observer (inotify unter Linux, FSEvents/ReadDirectoryChangesW sonst),
+# der PollingObserver bleibt als Fallback.
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
-from memory.subsystem import MemorySubsystem
+from memory.subsystem import MemorySubsystem, content_id
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [LTM Listener] - %(message)s')
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 DEFAULT_JOURNAL_PATH = os.path.join(PROJECT_ROOT, 'journals', 'ltm_journal.wal')
 
-# ... (Der Rest der Datei ist identisch und korrekt) ...
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 64
+# Nach so vielen Fehlversuchen am selben Checkpoint landen nicht speicherbare Einträge in `<journal>.rejected`
+MAX_BATCH_ATTEMPTS = 5
+
+
+# --- Journal-Segmente ---
+# Der C++ JournalWriter (max_segment_bytes) versiegelt volle Journale zu
+# `<journal>.000001`, `<journal>.000002`, ...; die aktive Datei `<journal>` hat
+# implizit die Nummer "höchstes versiegeltes Segment + 1".
+
+def segment_path(journal_path: str, segment: int) -> str:
+    return f"{journal_path}.{segment:06d}"
+
+
+def sealed_segments(journal_path: str) -> list[int]:
+    """Numbers of all sealed segments of the journal, ascending."""
+    directory, base = os.path.split(journal_path)
+    pattern = re.compile(re.escape(base) + r"\.(\d{6})$")
+    try:
+        names = os.listdir(directory or '.')
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(pattern.match, names) if m)
+
+
+def compact_segments(journal_path: str, consumed_before: int):
+    """
+    Removes sealed segments with a number below `consumed_before`. The newest
+    sealed segment is only truncated, because its name carries the sequence
+    number the writer continues from.
+    """
+    sealed = sealed_segments(journal_path)
+    for segment in sealed:
+        if segment >= consumed_before:
+            break
+        path = segment_path(journal_path, segment)
+        try:
+            if segment == sealed[-1]:
+                if os.path.getsize(path) > 0:
+                    open(path, 'wb').close()
+            else:
+                os.remove(path)
+        except OSError as e:
+            logging.warning(f"Could not compact journal segment '{path}': {e}")
+
+
+class JournalCheckpoint:
+    """
+    The durable read position of the listener: {"segment": n, "offset": bytes}.
+    It is replaced atomically (temp file + fsync + os.replace), so a crash leaves
+    either the old or the new position, never a torn file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> tuple[int, int] | None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return int(data['segment']), int(data['offset'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Ignoring unreadable journal checkpoint '{self.path}': {e}")
+            return None
+
+    def save(self, segment: int, offset: int):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class JournalTailer:
+    """
+    Follows an append-only, segmented journal. Each call to `read_records` reads only
+    the bytes written since the last call, in fixed-size chunks, and returns the complete
+    lines as parsed records. An incomplete trailing line is kept until its newline arrives.
+    Sealed segments are read to their end before moving on to the next one.
+
+    The read position is (`segment`, `position`); pass both to resume from a checkpoint.
+    """
+    def __init__(self, journal_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, start_at_end: bool = True,
+                 segment: int | None = None, position: int = 0):
+        self.journal_path = journal_path
+        self.chunk_size = chunk_size
+        self._file = None
+        self._partial = b""
+        if segment is not None:
+            self.segment, self.position = segment, position
+        elif start_at_end:
+            self.segment = self._active_segment()
+            self.position = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+        else:
+            sealed = sealed_segments(journal_path)
+            self.segment = sealed[0] if sealed else self._active_segment()
+            self.position = 0
+
+    def _active_segment(self) -> int:
+        sealed = sealed_segments(self.journal_path)
+        return sealed[-1] + 1 if sealed else 1
+
+    def seek(self, segment: int, position: int):
+        """Moves the read position, e.g. back to the last committed checkpoint."""
+        self.close()
+        self.segment, self.position, self._partial = segment, position, b""
+
+    def _locate(self) -> tuple[str | None, bool]:
+        """Path of the current segment and whether it is sealed; skips segments that no longer exist."""
+        sealed = sealed_segments(self.journal_path)
+        active = sealed[-1] + 1 if sealed else 1
+        if self.segment in sealed:
+            return segment_path(self.journal_path, self.segment), True
+        if self.segment != active:
+            # Segment wurde entfernt (oder die Nummer passt nicht mehr): beim nächsten vorhandenen weiterlesen
+            later = [s for s in sealed if s > self.segment]
+            logging.warning(f"Journal segment {self.segment} is missing. Continuing with segment {later[0] if later else active}.")
+            self.seek(later[0] if later else active, 0)
+            return self._locate()
+        if not os.path.exists(self.journal_path):
+            return None, False
+        return self.journal_path, False
+
+    def _ensure_open(self, path: str):
+        """Opens the segment (again) if it is new, was replaced or was truncated."""
+        stat = os.stat(path)
+        if self._file is not None and os.fstat(self._file.fileno()).st_ino != stat.st_ino:
+            self.close()
+        if stat.st_size < self.position:
+            logging.warning(f"Journal '{path}' shrank below the read position. Restarting from the beginning.")
+            self.close()
+            self.position = 0
+            self._partial = b""
+        if self._file is None:
+            self._file = open(path, 'rb')
+        return self._file
+
+    def read_entries(self, limit: int | None = None) -> list[tuple[int, int, dict]]:
+        """
+        Returns (segment, end_position, record) for the complete journal records appended
+        since the last call, at most `limit` of them. (segment, end_position) is the
+        checkpoint just after the record; the next call continues right there.
+        """
+        entries = []
+        try:
+            while True:
+                path, sealed = self._locate()
+                if path is None:
+                    break
+                try:
+                    f = self._ensure_open(path)
+                except FileNotFoundError:
+                    continue  # Während des Lesens rotiert: erneut auflösen
+                f.seek(self.position + len(self._partial))
+                while True:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    lines = (self._partial + chunk).split(b"\n")
+                    self._partial = lines.pop()
+                    for raw_line in lines:
+                        self.position += len(raw_line) + 1
+                        record = self._parse_line(raw_line)
+                        if record is not None:
+                            entries.append((self.segment, self.position, record))
+                            if limit is not None and len(entries) >= limit:
+                                # Der Rest des Chunks wird beim nächsten Aufruf ab `position` neu gelesen
+                                self._partial = b""
+                                return entries
+                if not sealed:
+                    break
+                if self._partial:
+                    logging.warning(f"Discarding incomplete last line of sealed segment {self.segment}.")
+                self.seek(self.segment + 1, 0)
+        finally:
+            # Kein Handle offen lassen, damit der Writer die aktive Datei umbenennen kann (Windows)
+            self.close()
+        return entries
+
+    def read_records(self) -> list[dict]:
+        """Returns all complete journal records appended since the last call."""
+        return [record for _, _, record in self.read_entries()]
+
+    def _parse_line(self, raw_line: bytes) -> dict | None:
+        line = raw_line.strip()
+        if not line:
+            return None
+        try:
+            data = json.loads(line)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            logging.error(f"Error processing line '{line!r}': {e}")
+            return None
+        if not isinstance(data, dict) or 'text' not in data or 'metadata' not in data:
+            logging.warning(f"Invalid journal entry (missing keys): {line!r}")
+            return None
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class IngestError(RuntimeError):
+    """Some records of a batch could not be stored in the LTM (`records`)."""
+    def __init__(self, records: list[dict]):
+        super().__init__(f"{len(records)} journal record(s) were not stored")
+        self.records = records
+
+
 class JournalEventHandler(FileSystemEventHandler):
-    def __init__(self, memory_subsystem: MemorySubsystem, journal_path: str):
+    """
+    Ingests new journal records in batches. After every batch the read position is
+    stored in the checkpoint file (default `<journal>.offset`), and a restarted
+    listener resumes from there. Delivery is at-least-once: a crash between ingesting
+    a batch and saving its checkpoint replays that batch. Without a checkpoint the
+    listener starts at the current end of the journal; `replay=True` ingests the
+    existing journal from its first segment instead.
+
+    A batch only counts as ingested when every record is in the LTM afterwards
+    (stored now or already present). Otherwise it is retried from the checkpoint;
+    records that still fail after MAX_BATCH_ATTEMPTS are appended to the
+    dead-letter file `<journal>.rejected` so that they cannot block the journal.
+    """
+    def __init__(self, memory_subsystem: MemorySubsystem, journal_path: str,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, batch_size: int = DEFAULT_BATCH_SIZE,
+                 checkpoint_path: str | None = None, compact: bool = True, replay: bool = False):
         self.memory_subsystem = memory_subsystem
-        self.journal_path = journal_path
-        
+        self.journal_path = os.path.abspath(journal_path)
+        self.batch_size = batch_size
+        self.compact = compact
+        self.dedup = getattr(memory_subsystem, 'dedup', None)
+        self.rejected_path = self.journal_path + '.rejected'
+        self._failed_attempts = 0
+        # Events vom Observer und der Sicherheits-Poll der Hauptschleife dürfen sich nicht überholen
+        self._lock = threading.Lock()
+
         if not os.path.exists(self.journal_path):
             open(self.journal_path, 'a').close()
 
-        with open(self.journal_path, 'r') as f:
-            f.seek(0, 2)
-            self.last_pos = f.tell()
-            
+        self.checkpoint = JournalCheckpoint(checkpoint_path or self.journal_path + '.offset')
+        resume = self.checkpoint.load()
+        if resume is not None:
+            logging.info(f"Resuming journal at segment {resume[0]}, offset {resume[1]}.")
+            self.tailer = JournalTailer(self.journal_path, chunk_size=chunk_size, segment=resume[0], position=resume[1])
+        elif replay:
+            # Ausdrücklich gewünscht: das ganze vorhandene Journal erneut einlesen
+            logging.info("No journal checkpoint found. Replaying the whole journal.")
+            self.tailer = JournalTailer(self.journal_path, chunk_size=chunk_size, start_at_end=False)
+        else:
+            # Erster Start (auch nach dem Upgrade): ältere Listener haben das Journal bereits
+            # unter anderen IDs gespeichert, ein Replay würde das LTM duplizieren.
+            self.tailer = JournalTailer(self.journal_path, chunk_size=chunk_size, start_at_end=True)
+            logging.info(f"No journal checkpoint found. Starting at the end of the journal "
+                         f"(segment {self.tailer.segment}, offset {self.tailer.position}).")
+            self.checkpoint.save(self.tailer.segment, self.tailer.position)
+        self.committed = (self.tailer.segment, self.tailer.position)
+
+    def _is_journal_event(self, event) -> bool:
+        path = os.path.abspath(event.src_path)
+        return path == self.journal_path or path.startswith(self.journal_path + '.0')
+
     def on_modified(self, event):
-        if event.src_path == self.journal_path:
+        if self._is_journal_event(event):
+            self._process_new_lines()
+
+    def on_created(self, event):
+        if self._is_journal_event(event):
             self._process_new_lines()
-            
+
     def _process_new_lines(self):
-        try:
-            with open(self.journal_path, 'r') as f:
-                f.seek(self.last_pos)
-                new_lines = f.readlines()
-                if not new_lines:
-                    return
-
-                for line in new_lines:
-                    line = line.strip()
-                    if not line: continue
-                    
-                    try:
-                        data = json.loads(line)
-                        if 'text' in data and 'metadata' in data:
-                            self.memory_subsystem.add_experience(data['text'], data['metadata'])
-                        else:
-                            logging.warning(f"Invalid journal entry (missing keys): {line}")
-                    except Exception as e:
-                        logging.error(f"Error processing line '{line}': {e}")
-                
-                self.last_pos = f.tell()
-        except FileNotFoundError:
-             logging.error(f"Journal file not found at {self.journal_path}")
+        with self._lock:
+            # Batchweise lesen: auch ein großer Rückstand nach einem Neustart liegt nie ganz im Speicher
+            while True:
+                batch = self.tailer.read_entries(limit=self.batch_size)
+                if not batch:
+                    break
+                records = [record for _, _, record in batch]
+                try:
+                    self._ingest(records)
+                except Exception as e:
+                    self._failed_attempts += 1
+                    if self._failed_attempts < MAX_BATCH_ATTEMPTS:
+                        # Zurück zum letzten Checkpoint; der Rest wird beim nächsten Aufruf erneut versucht
+                        logging.error(f"Ingesting journal batch failed (attempt {self._failed_attempts}), "
+                                      f"retrying from checkpoint {self.committed}: {e}")
+                        self.tailer.seek(*self.committed)
+                        return
+                    logging.error(f"Ingesting journal batch failed {self._failed_attempts} times ({e}). "
+                                  f"Moving unstored records to '{self.rejected_path}'.")
+                    self._reject(getattr(e, 'records', records))
+                self._failed_attempts = 0
+                self._commit(batch[-1][0], batch[-1][1])
+                if len(batch) < self.batch_size:
+                    break
+            # Auch übersprungene (ungültige) Zeilen und Segmentwechsel festhalten
+            self._commit(self.tailer.segment, self.tailer.position)
 
+    def _commit(self, segment: int, offset: int):
+        if (segment, offset) == self.committed:
+            return
+        self.checkpoint.save(segment, offset)
+        if self.compact and segment != self.committed[0]:
+            compact_segments(self.journal_path, segment)
+        self.committed = (segment, offset)
 
-def run_ltm_listener(journal_path: str = DEFAULT_JOURNAL_PATH):
+    def _ingest(self, batch: list[dict]):
+        """
+        Hands one batch of journal records to the memory subsystem (one embedding call,
+        one insert). Raises IngestError if any record is not in the LTM afterwards.
+        """
+        ids = [content_id(data['text'], self.dedup) for data in batch]
+        stored = set(self.memory_subsystem.add_experiences(
+            [data['text'] for data in batch],
+            [data['metadata'] for data in batch],
+            batch_size=self.batch_size,
+            ids=ids
+        ) or [])
+        missing = [doc_id for doc_id in dict.fromkeys(ids) if doc_id not in stored]
+        if missing:
+            # Im Dedup-Modus übersprungene Einträge sind bereits gespeichert
+            present = set(self.memory_subsystem.collection.get(ids=missing, include=[])['ids'])
+            lost = {doc_id for doc_id in missing if doc_id not in present}
+            if lost:
+                raise IngestError([data for doc_id, data in zip(ids, batch) if doc_id in lost])
+
+    def _reject(self, records: list[dict]):
+        with open(self.rejected_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _start_observer(event_handler: JournalEventHandler, journal_dir: str):
+    """Starts the native (event-driven) observer and falls back to polling if it is unavailable."""
+    try:
+        observer = Observer()
+        observer.schedule(event_handler, path=journal_dir, recursive=False)
+        observer.start()
+        return observer, "native events"
+    except OSError as e:
+        logging.warning(f"Native file events unavailable ({e}). Falling back to polling.")
+    observer = PollingObserver(timeout=0.25)
+    observer.schedule(event_handler, path=journal_dir, recursive=False)
+    observer.start()
+    return observer, "polling"
+
+
+def run_ltm_listener(journal_path: str = DEFAULT_JOURNAL_PATH, serve: bool = True, replay: bool = False):
+    """
+    Ingests the journal into the LTM. With `serve`, this process also hosts the LTM
+    service (memory/service.py), so agents share its Chroma client and embedding
+    model instead of loading their own. `replay` re-ingests an existing journal that
+    has no checkpoint yet (see JournalEventHandler).
+    """
     logging.info("Starting LTM Listener Process...")
     journal_dir = os.path.dirname(journal_path)
     os.makedirs(journal_dir, exist_ok=True)
-    
-    memory_system = MemorySubsystem()
-    event_handler = JournalEventHandler(memory_system, journal_path)
-    
-    # Hier wird jetzt der PollingObserver verwendet.
-    observer = Observer() 
-    observer.schedule(event_handler, path=journal_dir, recursive=False)
-    observer.start()
-    
-    logging.info(f"Now monitoring '{journal_path}' for changes via Polling.")
-    
+
+    # Nach einem Neustart wird ab dem letzten Checkpoint erneut gelesen; bereits gespeicherte Einträge überspringen
+    memory_system = MemorySubsystem(dedup="exact")
+    if serve:
+        from memory.service import start_ltm_service
+        memory_system.warm_up(background=False)
+        # Auch die eigenen Schreibzugriffe laufen über den Writer des Service (ein Writer pro DB)
+        memory_system = start_ltm_service(memory_system)
+    event_handler = JournalEventHandler(memory_system, journal_path, replay=replay)
+
+    observer, mode = _start_observer(event_handler, journal_dir)
+
+    logging.info(f"Now monitoring '{journal_path}' for changes via {mode}.")
+
     try:
         while True:
             time.sleep(1)
+            # Sicherheitsnetz für verlorene Events (z.B. Netzlaufwerke); ohne neue Daten billig
+            event_handler._process_new_lines()
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    event_handler.tailer.close()
     logging.info("LTM Listener Process stopped.")
 
 if __name__ == "__main__":
-    run_ltm_listener()
\ No newline at end of file
+    run_ltm_listener()
@@ -1,8 +1,12 @@
 # memory/man.py
 
+import json
 import logging
+import time
+import uuid
 from memory.subsystem import MemorySubsystem
-from chromadb.api.types import QueryResult
+from memory.plans import PLAN_TYPE, STATUS_ACTIVE, STATUS_COMPLETED
+from memory.query_cache import QueryCache, DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS
 
 
 class MemoryAccessNetwork:
@@ -10,54 +14,121 @@ class MemoryAccessNetwork:
     The Memory Access Network (MAN) acts as an intelligent interface 
     to the long-term memory (LTM).
     """
-    def __init__(self, memory_subsystem: MemorySubsystem):
+    def __init__(self, memory_subsystem: MemorySubsystem, cache_size: int = DEFAULT_MAX_ENTRIES,
+                 cache_ttl_seconds: float = DEFAULT_TTL_SECONDS):
         """
         Initializes the MAN with a reference to the core memory subsystem.
+        Query results are cached (`cache_size` = 0 disables the cache) until they
+        expire or the subsystem's write generation changes. Writes from other
+        processes (the LTM listener) are only picked up after the TTL.
         """
         self.memory_subsystem = memory_subsystem
+        self.cache = QueryCache(max_entries=cache_size, ttl_seconds=cache_ttl_seconds) if cache_size > 0 else None
         logging.info("Memory Access Network (MAN) initialized.")
 
-    def request(self, query_text: str, search_type: str = 'quick') -> dict:
+    @staticmethod
+    def _cache_key(search_type: str, query_text: str, n_results: int, where: dict | None,
+                   reformulations: list[str] | None = None) -> tuple:
+        # all-MiniLM-L6-v2 ist uncased und ignoriert Leerraum: diese Normalisierung ändert das Ergebnis nicht
+        normalized = " ".join(query_text.casefold().split())
+        return (search_type, normalized, n_results, json.dumps(where, sort_keys=True), tuple(reformulations or ()))
+
+    def request(self, query_text: str, search_type: str = 'quick', n_results: int = 5, where: dict | None = None,
+                latency_budget: float | None = None, reformulations: list[str] | None = None) -> dict:
         """
         Processes a memory request.
 
         Args:
             query_text: The natural language query.
             search_type: 'quick' for a direct vector search, 
-                         'slow' for a (future) more complex analysis.
+                         'slow' for a fan-out over several query reformulations,
+                         re-ranked with maximal marginal relevance.
+            n_results: Number of memories to return.
+            where: Optional ChromaDB metadata filter.
+            latency_budget: Slow search only: seconds to wait for the sub-queries
+                            (the original query is always awaited).
+            reformulations: Slow search only: additional query variants, e.g. from an LLM.
 
         Returns:
             A dictionary containing the query results from ChromaDB.
+            Cached results are shared between callers and must not be modified.
         """
+        if self.cache is None:
+            return self._execute(query_text, search_type, n_results, where, latency_budget, reformulations)[0]
+
+        started = time.perf_counter()
+        key = self._cache_key(search_type, query_text, n_results, where, reformulations)
+        generation = self.memory_subsystem.generation
+        results = self.cache.get(key, generation)
+        if results is not None:
+            self.cache.record(hit=True, seconds=time.perf_counter() - started)
+            logging.info(f"MAN: Cache hit for: '{query_text}'")
+            return results
+
+        results, complete = self._execute(query_text, search_type, n_results, where, latency_budget, reformulations)
+        # Fehlerergebnisse (leere 'ids') und unvollständige Slow Searches (Teilanfragen über dem
+        # Latenzbudget) werden nicht gecacht, sonst bekämen Aufrufer mit größerem Budget das Teilergebnis
+        if results.get('ids') and complete:
+            self.cache.put(key, results, generation)
+        self.cache.record(hit=False, seconds=time.perf_counter() - started)
+        return results
+
+    def _execute(self, query_text: str, search_type: str, n_results: int, where: dict | None,
+                 latency_budget: float | None = None, reformulations: list[str] | None = None) -> tuple[dict, bool]:
+        """Returns the results and whether they are complete (and may be cached)."""
         if search_type == 'slow':
-            # Platzhalter-Logik für Slow Search
-            logging.warning(
-                "MAN: 'Slow Search' requested. "
-                "BRIDGE-MODE: Executing 'Quick Search' logic as a placeholder."
-            )
-            # Führt die gleiche Logik wie Quick Search aus
-            return self.memory_subsystem.query_memories(query_text)
+            return self._slow_search(query_text, n_results, where, latency_budget, reformulations)
         
         # Logik für Quick Search
         logging.info(f"MAN: Executing Quick Search for: '{query_text}'")
-        return self.memory_subsystem.query_memories(query_text)
+        return self.memory_subsystem.query_memories(query_text, n_results=n_results, where=where), True
+
+    def _slow_search(self, query_text: str, n_results: int, where: dict | None,
+                     latency_budget: float | None, reformulations: list[str] | None) -> tuple[dict, bool]:
+        """
+        Runs the query and its reformulations concurrently, merges the candidates and
+        re-ranks them with MMR. Sub-queries that miss the latency budget are left out;
+        the result is then reported as incomplete (second return value False).
+        """
+        from memory import slow_search
+
+        if latency_budget is None:
+            latency_budget = slow_search.DEFAULT_LATENCY_BUDGET
+        subqueries = slow_search.reformulate(query_text)
+        for extra in reformulations or []:
+            if extra not in subqueries:
+                subqueries.append(extra)
+        logging.info(f"MAN: Executing Slow Search with {len(subqueries)} sub-queries for: '{query_text}'")
+        started = time.perf_counter()
+        try:
+            query_embeddings, results = self.memory_subsystem.query_many(
+                subqueries,
+                n_results=n_results * slow_search.CANDIDATES_PER_RESULT,
+                where=where,
+                timeout=latency_budget
+            )
+        except Exception as e:
+            logging.error(f"MAN: Slow Search failed, falling back to Quick Search: {e}")
+            return self.memory_subsystem.query_memories(query_text, n_results=n_results, where=where), False
+
+        answered = [i for i, result in enumerate(results) if result is not None]
+        merged = slow_search.merge_and_rerank([query_embeddings[i] for i in answered],
+                                              [results[i] for i in answered], n_results)
+        logging.info(f"MAN: Slow Search used {len(answered)}/{len(subqueries)} sub-queries "
+                     f"in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        return merged, len(answered) == len(subqueries)
+
+    def cache_stats(self) -> dict:
+        """Hit rate and average hit/miss latency of the query cache."""
+        return self.cache.stats() if self.cache is not None else {}
     
     def find_active_plans(self) -> list[str]:
         """
-        Specifically queries the LTM for documents flagged as an active future plan.
+        Returns the texts of all active future plans. They come from the plan index of
+        the memory subsystem, so the cost grows with the number of active plans, not the LTM.
         """
-        logging.info("MAN: Searching for active future plans in LTM...")
         try:
-            # --- KORREKTUR: Korrekte 'where' Syntax mit $and Operator ---
-            results = self.memory_subsystem.collection.get(
-                where={
-                    "$and": [
-                        {"type": "future_plan"},
-                        {"status": "active"}
-                    ]
-                }
-            )
-            plans = results.get('documents', [])
+            plans = list(self.memory_subsystem.active_plans().values())
             if plans:
                 logging.info(f"Found {len(plans)} active plan(s): {plans}")
             else:
@@ -65,4 +136,18 @@ class MemoryAccessNetwork:
             return plans
         except Exception as e:
             logging.error(f"Error while querying for plans in LTM: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def create_plan(self, text: str, metadata: dict | None = None) -> str:
+        """Stores a new active future plan in the LTM and returns its id."""
+        plan_id = f"plan_{uuid.uuid4().hex}"
+        plan_metadata = {**(metadata or {}), "type": PLAN_TYPE, "status": STATUS_ACTIVE}
+        if not self.memory_subsystem.add_experiences([text], [plan_metadata], ids=[plan_id]):
+            raise RuntimeError(f"Could not store plan '{text}' in LTM.")
+        logging.info(f"MAN: Created plan {plan_id}: '{text}'")
+        return plan_id
+
+    def complete_plan(self, plan_id: str, status: str = STATUS_COMPLETED):
+        """Marks a plan as no longer active (completed by default)."""
+        self.memory_subsystem.update_metadatas([plan_id], [{"status": status}])
+        logging.info(f"MAN: Plan {plan_id} is now '{status}'.")
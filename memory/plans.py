@@ -0,0 +1,66 @@
+# memory/plans.py
+
+import logging
+import threading
+
+PLAN_TYPE = "future_plan"
+STATUS_ACTIVE = "active"
+STATUS_COMPLETED = "completed"
+
+
+def is_plan(metadata: dict | None) -> bool:
+    return bool(metadata) and metadata.get("type") == PLAN_TYPE
+
+
+class PlanIndex:
+    """
+    In-memory index of the active future plans stored in the LTM. It is filled with a
+    single metadata query on first use and afterwards kept up to date by the memory
+    subsystem on every plan write, so listing plans costs O(active plans).
+
+    The index remembers the (write generation, document count) it is current for.
+    Writes it did not observe - e.g. plans the LTM listener stores from another
+    process - change that stamp and make the next `ensure_current` reload it.
+    """
+    def __init__(self):
+        self._active = {}  # id -> Plan-Text, in Einfügereihenfolge
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def ensure_current(self, collection, generation: int):
+        stamp = (generation, collection.count())
+        if self._stamp == stamp:
+            return
+        with self._lock:
+            if self._stamp == stamp:
+                return
+            results = collection.get(
+                where={"$and": [{"type": PLAN_TYPE}, {"status": STATUS_ACTIVE}]},
+                include=["documents"]
+            )
+            self._active = {plan_id: text for plan_id, text in zip(results.get('ids', []), results.get('documents', []))
+                            if text is not None}
+            self._stamp = stamp
+            logging.info(f"Plan index loaded with {len(self._active)} active plan(s).")
+
+    def observe(self, plans: list[tuple], generation: int, added: int):
+        """
+        Applies the plans (id, text, metadata) of a write that produced `generation` and
+        stored `added` new documents. If the index was current right before the write,
+        it stays current; otherwise the stamp no longer matches and it is reloaded.
+        """
+        with self._lock:
+            if self._stamp is None:
+                return  # Das erste Laden liest den aktuellen Stand ohnehin aus der DB
+            for plan_id, text, metadata in plans:
+                if metadata.get("status") == STATUS_ACTIVE and text is not None:
+                    self._active[plan_id] = text
+                else:
+                    self._active.pop(plan_id, None)
+            previous_generation, count = self._stamp
+            if previous_generation == generation - 1:
+                self._stamp = (generation, count + added)
+
+    def active(self) -> dict:
+        with self._lock:
+            return dict(self._active)
@@ -0,0 +1,83 @@
+# memory/query_cache.py
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL_SECONDS = 60.0
+
+
+class QueryCache:
+    """
+    LRU cache with a time-to-live for LTM query results. Every entry remembers the
+    write generation of the memory subsystem it was computed at; once the generation
+    moves on, the whole cache is stale and is dropped on the next access.
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+
+    def get(self, key, generation: int):
+        """Returns the cached value, or None if it is missing, expired or from an older generation."""
+        with self._lock:
+            if generation != self._generation:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._generation = generation
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if self.ttl_seconds > 0 and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, generation: int):
+        """Stores a value computed at `generation`; results of an outdated generation are discarded."""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool, seconds: float):
+        """Accounts one lookup (hit or miss) and its end-to-end latency."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._hit_seconds += seconds
+            else:
+                self.misses += 1
+                self._miss_seconds += seconds
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "avg_hit_ms": 1000 * self._hit_seconds / self.hits if self.hits else 0.0,
+                "avg_miss_ms": 1000 * self._miss_seconds / self.misses if self.misses else 0.0,
+            }
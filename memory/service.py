@@ -0,0 +1,289 @@
+# memory/service.py
+
+import logging
+import os
+import queue
+import secrets
+import stat
+import sys
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+from memory.subsystem import MemorySubsystem, content_id, DEFAULT_BATCH_SIZE
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Unix-Socket neben dem Journal; unter Windows eine Named Pipe
+if sys.platform == 'win32':
+    DEFAULT_SERVICE_ADDRESS = r'\\.\pipe\capa_ltm_service'
+else:
+    DEFAULT_SERVICE_ADDRESS = os.path.join(PROJECT_ROOT, 'journals', 'ltm_service.sock')
+# Der Manager spricht pickle: ohne geheimen Schlüssel könnte jeder lokale Prozess Code einschleusen.
+# Daher ein zufälliger Schlüssel je Installation (nur für den Besitzer lesbar) statt eines festen Werts.
+DEFAULT_AUTHKEY_PATH = os.environ.get('CAPA_LTM_AUTHKEY_FILE', os.path.join(PROJECT_ROOT, 'journals', 'ltm_service.key'))
+# So lange wartet der Writer auf weitere Schreibaufträge, bevor er einen Batch schreibt
+DEFAULT_WRITE_DELAY = 0.01
+
+
+def load_authkey(path: str = DEFAULT_AUTHKEY_PATH, create: bool = False) -> bytes:
+    """
+    Returns the per-install key of the LTM service. With `create`, a random key is
+    generated into `path` (mode 0600) if it does not exist yet. A key file that other
+    users can read or write is rejected.
+    """
+    if create and not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # Ein anderer Prozess war schneller
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_hex(32).encode())
+            logging.info(f"Generated LTM service key at {path}.")
+    if sys.platform != 'win32' and stat.S_IMODE(os.stat(path).st_mode) & 0o077:
+        raise PermissionError(f"LTM service key {path} must only be accessible by its owner (chmod 600).")
+    with open(path, 'rb') as f:
+        key = f.read().strip()
+    if not key:
+        raise ValueError(f"LTM service key {path} is empty.")
+    return key
+
+
+class _WriteRequest:
+    def __init__(self, texts: list, metadatas: list, ids: list, update: bool = False):
+        self.texts = texts
+        self.metadatas = metadatas
+        self.ids = ids
+        self.update = update  # True: Metadaten-Update statt neuer Einträge
+        self.stored = []
+        self.error = None
+        self.done = threading.Event()
+
+
+class LTMService:
+    """
+    Owns the one MemorySubsystem (Chroma client and embedding model) of a machine and
+    serves it to several processes. Writes from all clients (inserts and metadata
+    updates) go through a single writer thread that groups concurrent inserts into one
+    embedding call and one insert; queries are answered directly.
+    """
+    def __init__(self, memory_subsystem: MemorySubsystem, batch_size: int = DEFAULT_BATCH_SIZE,
+                 write_delay: float = DEFAULT_WRITE_DELAY):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.memory_subsystem = memory_subsystem
+        self.batch_size = batch_size
+        self.write_delay = write_delay
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="LTMServiceWriter", daemon=True)
+        self._writer.start()
+
+    def add_experiences(self, texts: list, metadatas: list, batch_size: int | None = None,
+                        ids: list | None = None) -> list:
+        """
+        Stores the experiences and returns once they are committed (with the stored IDs).
+        The batch size of the service applies; `batch_size` is accepted for MemorySubsystem compatibility.
+        """
+        if len(texts) != len(metadatas) or (ids is not None and len(ids) != len(texts)):
+            raise ValueError("texts, metadatas and ids must have the same length")
+        if ids is None:
+            ids = [content_id(text, self.memory_subsystem.dedup) for text in texts]
+        return self._submit(_WriteRequest(list(texts), list(metadatas), list(ids)))
+
+    def _submit(self, request: _WriteRequest) -> list:
+        self._writes.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.stored
+
+    def add_experience(self, text: str, metadata: dict):
+        self.add_experiences([text], [metadata])
+
+    @property
+    def dedup(self):
+        return self.memory_subsystem.dedup
+
+    @property
+    def collection(self):
+        return self.memory_subsystem.collection
+
+    def query_memories(self, query_text: str, n_results: int = 5, where: dict | None = None) -> dict:
+        return self.memory_subsystem.query_memories(query_text, n_results=n_results, where=where)
+
+    def query_many(self, query_texts: list, n_results: int = 5, where: dict | None = None,
+                   timeout: float | None = None) -> tuple:
+        return self.memory_subsystem.query_many(query_texts, n_results=n_results, where=where, timeout=timeout)
+
+    def collection_get(self, **kwargs) -> dict:
+        return self.memory_subsystem.collection.get(**kwargs)
+
+    def collection_count(self) -> int:
+        return self.memory_subsystem.collection.count()
+
+    def generation(self) -> int:
+        return self.memory_subsystem.generation
+
+    def update_metadatas(self, ids: list, metadatas: list):
+        # Über den Writer, damit Updates nicht mit gruppierten Inserts (und deren Generation) konkurrieren
+        self._submit(_WriteRequest([], list(metadatas), list(ids), update=True))
+
+    def active_plans(self) -> dict:
+        return self.memory_subsystem.active_plans()
+
+    def warm_up(self):
+        self.memory_subsystem.warm_up(background=False)
+
+    def _write_loop(self):
+        pending = None
+        while True:
+            request = pending or self._writes.get()
+            pending = None
+            if request.update:
+                self._apply_update(request)
+                continue
+            batch = [request]
+            # Gruppen-Commit: Aufträge sammeln, die kurz nacheinander eintreffen.
+            # Ein Update beendet die Gruppe, damit die Reihenfolge erhalten bleibt.
+            deadline = time.monotonic() + self.write_delay
+            while sum(len(r.texts) for r in batch) < self.batch_size:
+                try:
+                    request = self._writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if request.update:
+                    pending = request
+                    break
+                batch.append(request)
+            try:
+                stored = set(self.memory_subsystem.add_experiences(
+                    [text for r in batch for text in r.texts],
+                    [metadata for r in batch for metadata in r.metadatas],
+                    ids=[doc_id for r in batch for doc_id in r.ids]
+                ))
+                for request in batch:
+                    request.stored = [doc_id for doc_id in request.ids if doc_id in stored]
+            except Exception as e:
+                self.logger.error(f"LTM service write of {len(batch)} request(s) failed: {e}", exc_info=True)
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
+
+    def _apply_update(self, request: _WriteRequest):
+        try:
+            self.memory_subsystem.update_metadatas(request.ids, request.metadatas)
+        except Exception as e:
+            self.logger.error(f"LTM service metadata update failed: {e}", exc_info=True)
+            request.error = e
+        request.done.set()
+
+
+class LTMManager(BaseManager):
+    pass
+
+
+class RemoteCollection:
+    """The part of the Chroma collection API that callers of MemorySubsystem use, served by the LTM service."""
+    def __init__(self, service):
+        self._service = service
+
+    def get(self, **kwargs) -> dict:
+        return self._service.collection_get(**kwargs)
+
+    def count(self) -> int:
+        return self._service.collection_count()
+
+
+class RemoteMemorySubsystem:
+    """Client for an LTMService with the interface of MemorySubsystem (see `connect_memory_subsystem`)."""
+    def __init__(self, address=DEFAULT_SERVICE_ADDRESS, authkey: bytes | None = None):
+        manager = LTMManager(address=address, authkey=authkey if authkey is not None else load_authkey())
+        manager.connect()
+        self._manager = manager
+        self._service = manager.ltm_service()
+        self.collection = RemoteCollection(self._service)
+        self.init_seconds = 0.0
+        self.is_ready = True
+
+    @property
+    def generation(self) -> int:
+        return self._service.generation()
+
+    def add_experience(self, text: str, metadata: dict):
+        self._service.add_experiences([text], [metadata])
+
+    def add_experiences(self, texts: list[str], metadatas: list[dict], batch_size: int | None = None,
+                        ids: list[str] | None = None) -> list[str]:
+        # Die Batch-Größe bestimmt der Service
+        return self._service.add_experiences(list(texts), list(metadatas), None, ids)
+
+    def query_memories(self, query_text: str, n_results: int = 5, where: dict | None = None) -> dict:
+        return self._service.query_memories(query_text, n_results, where)
+
+    def query_many(self, query_texts: list[str], n_results: int = 5, where: dict | None = None,
+                   timeout: float | None = None) -> tuple[list, list]:
+        return self._service.query_many(list(query_texts), n_results, where, timeout)
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict]):
+        self._service.update_metadatas(list(ids), list(metadatas))
+
+    def active_plans(self) -> dict:
+        return self._service.active_plans()
+
+    def warm_up(self, background: bool = True):
+        if not background:
+            self._service.warm_up()
+        return None
+
+
+def start_ltm_service(memory_subsystem: MemorySubsystem, address=DEFAULT_SERVICE_ADDRESS,
+                      authkey: bytes | None = None) -> LTMService:
+    """
+    Serves `memory_subsystem` to other processes from a background thread of this process.
+    Without an explicit `authkey`, the per-install key file is used (and created on first start).
+    """
+    if authkey is None:
+        authkey = load_authkey(create=True)
+    service = LTMService(memory_subsystem, batch_size=memory_subsystem.batch_size)
+    if isinstance(address, str) and sys.platform != 'win32':
+        os.makedirs(os.path.dirname(address), exist_ok=True)
+        if os.path.exists(address):
+            os.remove(address)  # Überbleibsel eines abgestürzten Service
+    class ServiceManager(BaseManager):
+        pass
+    ServiceManager.register('ltm_service', callable=lambda: service)
+    server = ServiceManager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name="LTMServiceServer", daemon=True).start()
+    logging.info(f"LTM service listening on {address}.")
+    return service
+
+
+def connect_memory_subsystem(address=DEFAULT_SERVICE_ADDRESS, authkey: bytes | None = None, **local_kwargs):
+    """
+    Connects to a running LTM service (authenticated with `authkey`, default: the
+    per-install key file). Without one, falls back to a process-local MemorySubsystem
+    (constructed with `local_kwargs`).
+    """
+    try:
+        subsystem = RemoteMemorySubsystem(address, authkey)
+        logging.info(f"Connected to the LTM service at {address}.")
+        return subsystem
+    except (OSError, EOFError) as e:
+        logging.info(f"No LTM service at {address} ({e}). Using a local Memory Subsystem.")
+        return MemorySubsystem(**local_kwargs)
+
+
+LTMManager.register('ltm_service')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [LTM Service] - %(message)s')
+    service_subsystem = MemorySubsystem(dedup="exact")
+    service_subsystem.warm_up()
+    start_ltm_service(service_subsystem)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logging.info("LTM service stopped.")
@@ -0,0 +1,109 @@
+# memory/slow_search.py
+
+import re
+
+import numpy as np
+
+DEFAULT_LATENCY_BUDGET = 0.5  # Sekunden für alle Teilanfragen zusammen
+DEFAULT_MMR_LAMBDA = 0.7      # 1.0 = nur Relevanz, 0.0 = nur Vielfalt
+DEFAULT_MAX_SUBQUERIES = 4
+CANDIDATES_PER_RESULT = 3     # Kandidaten je Teilanfrage = n_results * CANDIDATES_PER_RESULT
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "about",
+    "is", "are", "was", "were", "be", "been", "it", "this", "that", "these", "those", "my", "your",
+    "i", "you", "we", "me", "do", "does", "did", "how", "what", "why", "when", "where", "which",
+    "can", "could", "should", "would", "will", "not", "no", "so", "as", "by", "from", "if", "then",
+}
+
+
+def reformulate(query_text: str, max_subqueries: int = DEFAULT_MAX_SUBQUERIES) -> list[str]:
+    """
+    Cheap, model-free reformulations of a query: the query itself, its content
+    words, and its individual clauses. The original query always comes first.
+    """
+    candidates = [query_text.strip()]
+    words = re.findall(r"\w+", query_text.lower())
+    keywords = [w for w in words if w not in _STOPWORDS]
+    if keywords and len(keywords) < len(words):
+        candidates.append(" ".join(keywords))
+    clauses = [c.strip() for c in re.split(r"[.;:!?,]|\band\b|\bbut\b", query_text) if len(c.strip().split()) >= 2]
+    if len(clauses) > 1:
+        candidates.extend(clauses)
+
+    subqueries, seen = [], set()
+    for candidate in candidates:
+        key = " ".join(candidate.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            subqueries.append(candidate)
+    return subqueries[:max_subqueries]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def mmr(query_embeddings: np.ndarray, candidate_embeddings: np.ndarray, k: int,
+        lambda_mult: float = DEFAULT_MMR_LAMBDA) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Maximal marginal relevance over cosine similarity. The relevance of a candidate
+    is its best similarity to any of the query embeddings. Returns the indices of
+    the selected candidates (in selection order) and their relevance.
+    """
+    candidates = _normalize_rows(np.asarray(candidate_embeddings, dtype=np.float32))
+    queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+    relevance = (candidates @ queries.T).max(axis=1)
+    k = min(k, len(candidates))
+
+    selected = np.empty(k, dtype=np.int64)
+    # Höchste Ähnlichkeit jedes Kandidaten zu den bereits gewählten (anfangs keine)
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    for i in range(k):
+        penalty = np.where(np.isinf(redundancy), 0.0, redundancy)
+        scores = np.where(available, lambda_mult * relevance - (1.0 - lambda_mult) * penalty, -np.inf)
+        best = int(np.argmax(scores))
+        selected[i] = best
+        available[best] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+    return selected, relevance[selected]
+
+
+def merge_and_rerank(query_embeddings: list, results: list, n_results: int,
+                     lambda_mult: float = DEFAULT_MMR_LAMBDA) -> dict:
+    """
+    Merges the results of several sub-queries (duplicates by id are dropped) and
+    re-ranks them with MMR. Returns a dict in the shape of a single ChromaDB query
+    result. `distances` stay in the collection's metric (like a quick search): each
+    document keeps its smallest distance among the sub-queries that returned it.
+    """
+    ids, documents, metadatas, embeddings, distances = [], [], [], [], []
+    position = {}
+    for result in results:
+        if not result or not result.get('ids'):
+            continue
+        for doc_id, document, metadata, embedding, distance in zip(
+                result['ids'][0], result['documents'][0], result['metadatas'][0],
+                result['embeddings'][0], result['distances'][0]):
+            if doc_id in position:
+                i = position[doc_id]
+                distances[i] = min(distances[i], distance)
+                continue
+            position[doc_id] = len(ids)
+            ids.append(doc_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            embeddings.append(embedding)
+            distances.append(distance)
+
+    if not ids:
+        return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'distances': [[]]}
+    order, _ = mmr(np.asarray(query_embeddings), np.asarray(embeddings), n_results, lambda_mult)
+    return {
+        'ids': [[ids[i] for i in order]],
+        'documents': [[documents[i] for i in order]],
+        'metadatas': [[metadatas[i] for i in order]],
+        'distances': [[float(distances[i]) for i in order]],
+    }
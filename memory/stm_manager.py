@@ -1,9 +1,10 @@
 # memory/stm_manager.py (FINAL KORRIGIERT)
 
 import logging
-import ollama
 import json
 
+from cognitive.llm_gateway import get_gateway
+
 class STMManager:
     """
     The intelligent "Memory Consolidator". It analyzes the entire content of the STM
@@ -12,7 +13,7 @@ class STMManager:
     """
     def __init__(self, memory_subsystem):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.client = ollama.Client()
+        self._client = None
         self.model_name = "granite4:3b"
         self.memory_subsystem = memory_subsystem
         
@@ -40,10 +41,23 @@ class STMManager:
         """
         self.logger.info(f"STM Manager (Consolidator) initialized with LLM: {self.model_name}.")
 
-    def consolidate_and_learn(self, stm_nodes: list, final_emotion_text: str):
+    @property
+    def client(self):
+        # Gemeinsamer, gepoolter Zugang zum Ollama-Server (siehe cognitive/llm_gateway.py)
+        if self._client is None:
+            self._client = get_gateway()
+        return self._client
+
+    def consolidate_and_learn(self, stm_nodes: list, final_emotion_text: str, evicted_nodes: list | None = None):
         """
         Analyzes all STM nodes, generates a list of learned lessons, and archives them.
+        Nodes that were evicted from the bounded STM during the session (see
+        `CPPCore.drain_evicted`) are merged back in chronological order.
         """
+        if evicted_nodes:
+            self.logger.info(f"Including {len(evicted_nodes)} evicted node(s) in the consolidation.")
+            stm_nodes = sorted(list(stm_nodes) + list(evicted_nodes), key=lambda n: n[0])
+
         if not any("FEEDBACK:" in node[1] for node in stm_nodes):
             self.logger.info("No feedback nodes found in STM. No new lessons to learn.")
             return
@@ -71,11 +85,10 @@ class STMManager:
 
             self.logger.info(f"Generated {len(learned_lessons)} new individual Learned Lesson(s).")
             
-            for lesson in learned_lessons:
-                self.memory_subsystem.add_experience(
-                    text=lesson,
-                    metadata={"source": "learned_lesson"}
-                )
+            self.memory_subsystem.add_experiences(
+                learned_lessons,
+                [{"source": "learned_lesson"} for _ in learned_lessons]
+            )
             self.logger.info("Successfully archived all individual lessons to LTM.")
 
             if len(learned_lessons) > 1:
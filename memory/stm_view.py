@@ -0,0 +1,80 @@
+# memory/stm_view.py
+
+import logging
+import msgpack
+
+
+class STMGraphView:
+    """
+    A Python-side mirror of the C++ short-term memory graph.
+
+    Instead of re-serializing the whole STM after every mutation, the view asks
+    the core only for what changed since the last known graph version
+    (`CPPCore.serialize_since`) and applies that delta locally.
+    """
+    def __init__(self, cpp_core=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.cpp_core = cpp_core
+        self.version = 0
+        self.step = 0
+        self._nodes = {}
+        self._edges = []
+
+    def sync(self) -> "STMGraphView":
+        """Pulls the delta since the last synced version from the C++ core."""
+        if self.cpp_core is None:
+            raise RuntimeError("STMGraphView has no CPPCore to sync from.")
+        self.apply_delta(self.cpp_core.serialize_since(self.version))
+        return self
+
+    def apply_delta(self, delta: bytes):
+        """
+        Applies a msgpack delta of the form (version, is_full, nodes, edges, removed_ids,
+        step, decay_per_step). A full delta replaces the local state completely; removed
+        (evicted) nodes are dropped together with their incident edges.
+
+        Salience decay does not mark nodes as changed in the core, so nodes missing
+        from the delta are decayed here by one global factor for the steps since the
+        last sync.
+        """
+        version, is_full, nodes, edges, removed_ids, step, decay_per_step = msgpack.unpackb(delta)
+        if is_full:
+            self._nodes.clear()
+            self._edges.clear()
+        elif step > self.step and decay_per_step < 1.0:
+            factor = decay_per_step ** (step - self.step)
+            for node in self._nodes.values():
+                node[2] *= factor
+        if removed_ids:
+            removed = set(removed_ids)
+            for node_id in removed:
+                self._nodes.pop(node_id, None)
+            self._edges = [e for e in self._edges if e[0] not in removed and e[1] not in removed]
+        for node in nodes:
+            self._nodes[node[0]] = node
+        self._edges.extend(edges)
+        self.version = version
+        self.step = step
+        self.logger.debug(f"Applied STM delta (full={is_full}, nodes={len(nodes)}, edges={len(edges)}, removed={len(removed_ids)}) -> version {version}")
+
+    @property
+    def nodes(self) -> list:
+        """All nodes as [id, label, salience], ordered by id."""
+        return [self._nodes[node_id] for node_id in sorted(self._nodes)]
+
+    @property
+    def edges(self) -> list:
+        """All edges as [from_id, to_id, weight], in insertion order."""
+        return list(self._edges)
+
+    def to_bytes(self) -> bytes:
+        """Packs the view in the same (nodes, edges) layout as `CPPCore.serialize_graph`."""
+        return msgpack.packb([self.nodes, self.edges])
+
+
+def unpack_graph(graph_snapshot) -> tuple[list, list]:
+    """Returns (nodes, edges) from either a serialized snapshot or an STMGraphView."""
+    if isinstance(graph_snapshot, STMGraphView):
+        return graph_snapshot.nodes, graph_snapshot.edges
+    nodes, edges = msgpack.unpackb(graph_snapshot)
+    return nodes, edges
@@ -1,61 +1,347 @@
 # memory/subsystem.py
 
-import chromadb
-from chromadb.utils import embedding_functions
+# chromadb und das Embedding-Modell werden erst in _initialize() importiert bzw.
+# geladen, damit der Import dieses Moduls den Start nicht verzögert.
+import hashlib
 import logging
+import os
+import re
+import threading
 import time
+import unicodedata
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from memory.plans import PlanIndex, is_plan
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - [MemorySubsystem] - %(message)s')
 
+DEFAULT_BATCH_SIZE = 64
+# None: jeder Aufruf speichert; "exact": identischer Text nur einmal;
+# "normalized": auch bei abweichender Groß-/Kleinschreibung, Leerzeichen und Satzzeichen
+DEDUP_MODES = (None, "exact", "normalized")
+# Worker für die Teilanfragen von query_many; mehr Teilanfragen laufen nie gleichzeitig
+QUERY_WORKERS = 4
+
+
+def _normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"[^\w\s]", "", text)
+    return " ".join(text.split())
+
+
+def content_id(text: str, dedup: str | None = "exact") -> str:
+    """
+    The content-addressed LTM id of `text`: a SHA-256 digest of the (normalized)
+    text. Without dedup a random suffix keeps repeated texts apart.
+    """
+    key = _normalize_text(text) if dedup == "normalized" else text
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    if dedup is None:
+        return f"exp_{digest}_{uuid.uuid4().hex[:8]}"
+    return f"exp_{digest}"
+
+
+def _model_identity(embedding_function) -> str | None:
+    """The model name of an injected embedding function (`model_name` or `name()`), if it has one."""
+    for attribute in ("model_name", "name"):
+        value = getattr(embedding_function, attribute, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        if isinstance(value, str) and value:
+            return value
+    return None
+
+
 class MemorySubsystem:
-    def __init__(self, db_path="./db", collection_name="ltm_collection"):
+    def __init__(self, db_path="./db", collection_name="ltm_collection", batch_size: int = DEFAULT_BATCH_SIZE,
+                 embedding_function=None, dedup: str | None = None, embedding_cache: bool = True,
+                 embedding_backend: str | None = None, embedding_threads: int | None = None,
+                 embedding_cache_key: str | None = None):
         """
-        Initializes the persistent ChromaDB backend and the sentence transformer model.
+        Configures the persistent ChromaDB backend and the sentence transformer model.
+        Both are initialized lazily on first use, or ahead of time with `warm_up`.
+        `batch_size` is the number of documents embedded and inserted per call in
+        `add_experiences`; `embedding_function` replaces the default sentence transformer.
+        `embedding_backend` selects the model runtime instead ("sentence-transformers", "onnx"
+        or "onnx-int8", default from CAPA_EMBEDDING_BACKEND) with `embedding_threads` CPU threads.
+        `dedup` ("exact" or "normalized") skips texts that are already stored, before embedding them.
+        With `embedding_cache`, vectors are cached by text hash in `<db_path>/embeddings_<collection>_<backend>.bin`.
+        For an injected `embedding_function` the file is named after `embedding_cache_key`, or else the
+        function's `model_name`/`name()`; without either, its vectors are not cached.
         """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"dedup must be one of {DEDUP_MODES}, got {dedup!r}")
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.dedup = dedup
+        self.embedding_cache = embedding_cache
+        self.embedding_cache_key = embedding_cache_key
+        # Wird bei jedem Schreibzugriff erhöht; Caches (z.B. im MAN) erkennen daran veraltete Ergebnisse
+        self.generation = 0
+        self.init_seconds = None
+        self._embedding_function = embedding_function
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self._collection = None
+        self._init_lock = threading.Lock()
+        self.plans = PlanIndex()
+        self._query_pool = None
+        self._queries_in_flight = 0 # auch Nachzügler früherer Aufrufe, die noch laufen
+        self._query_lock = threading.Lock()
+
+    @property
+    def collection(self):
+        self._ensure_initialized()
+        return self._collection
+
+    @property
+    def sentence_transformer(self):
+        self._ensure_initialized()
+        return self._embedding_function
+
+    @property
+    def is_ready(self) -> bool:
+        return self._collection is not None
+
+    def warm_up(self, background: bool = True) -> threading.Thread | None:
+        """
+        Initializes the backend ahead of the first request. In the background variant
+        callers that need the LTM earlier simply wait for the warm-up to finish.
+        """
+        if not background:
+            self._ensure_initialized()
+            return None
+        def run():
+            try:
+                self._ensure_initialized()
+            except Exception as e:
+                logging.error(f"Background warm-up of the Memory Subsystem failed: {e}", exc_info=True)
+        thread = threading.Thread(target=run, name="MemorySubsystemWarmUp", daemon=True)
+        thread.start()
+        return thread
+
+    def _ensure_initialized(self):
+        if self._collection is not None:
+            return
+        with self._init_lock:
+            if self._collection is None:
+                self._initialize()
+
+    def _initialize(self):
         logging.info("Initializing Memory Subsystem...")
-        # Use a standard sentence transformer model
-        self.sentence_transformer = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
+        started = time.perf_counter()
+        import chromadb
+        from memory.embedding_cache import CachedEmbeddingFunction
+
+        embedding_function = self._embedding_function
+        if embedding_function is None:
+            from memory.embedding_backends import make_embedding_function, DEFAULT_EMBEDDING_BACKEND
+            # Standard: all-MiniLM-L6-v2 über das gewählte Backend
+            backend = self.embedding_backend or DEFAULT_EMBEDDING_BACKEND
+            embedding_function = make_embedding_function(backend, num_threads=self.embedding_threads)
+        else:
+            # Verschiedene eigene Modelle dürfen sich keine Cache-Datei teilen (andere Vektoren, evtl. andere Dimension)
+            identity = self.embedding_cache_key or _model_identity(embedding_function)
+            backend = "custom-" + re.sub(r"[^\w.-]+", "_", identity) if identity else None
+            if self.embedding_cache and backend is None:
+                logging.info("Embedding cache disabled: the injected embedding function has no model name "
+                             "(pass embedding_cache_key to enable it).")
+        if self.embedding_cache and backend is not None:
+            # Wiederholte Anfragen und Texte kosten einen Lookup statt eines Modell-Durchlaufs.
+            # Je Backend bzw. Modell eine eigene Datei, da sich die Vektoren unterscheiden.
+            embedding_function = CachedEmbeddingFunction(
+                embedding_function,
+                cache_path=os.path.join(self.db_path, f"embeddings_{self.collection_name}_{backend}.bin")
+            )
         
         # Initialize ChromaDB client with persistence
-        client = chromadb.PersistentClient(path=db_path)
+        client = chromadb.PersistentClient(path=self.db_path)
         
-        self.collection = client.get_or_create_collection(
-            name=collection_name,
-            embedding_function=self.sentence_transformer # type: ignore
+        collection = client.get_or_create_collection(
+            name=self.collection_name,
+            embedding_function=embedding_function # type: ignore
         )
-        logging.info(f"ChromaDB collection '{collection_name}' loaded/created.")
+        self._embedding_function = embedding_function
+        self._collection = collection
+        self.init_seconds = time.perf_counter() - started
+        logging.info(f"ChromaDB collection '{self.collection_name}' loaded/created in {self.init_seconds:.2f}s.")
 
     def add_experience(self, text: str, metadata: dict):
         """
         Adds a new experience (text) with its metadata to the LTM.
         """
-        # ChromaDB requires unique IDs for each document
-        # We'll use a timestamp-based ID for simplicity
-        doc_id = f"exp_{int(time.time() * 1000)}"
-        
+        self.add_experiences([text], [metadata])
+
+    def add_experiences(self, texts: list[str], metadatas: list[dict], batch_size: int | None = None,
+                        ids: list[str] | None = None) -> list[str]:
+        """
+        Adds many experiences at once. Each batch of `batch_size` texts (default: the
+        subsystem's batch size) is embedded in a single model call and stored with a
+        single `collection.add`. Returns the IDs that were stored.
+
+        IDs are derived from the text content (see `content_id`) unless precomputed
+        `ids` are passed. In dedup mode, texts whose id is already stored (or repeated
+        within the call) are skipped without being embedded.
+        """
+        if len(texts) != len(metadatas) or (ids is not None and len(ids) != len(texts)):
+            raise ValueError("texts, metadatas and ids must have the same length")
+        batch_size = batch_size or self.batch_size
+
+        if ids is None:
+            ids = [content_id(text, self.dedup) for text in texts]
+        entries = list(zip(ids, texts, metadatas))
+        if self.dedup is not None:
+            entries = self._skip_known(entries)
+
+        stored_ids = []
+        for start in range(0, len(entries), batch_size):
+            batch_ids, batch_texts, batch_metadatas = (list(column) for column in zip(*entries[start:start + batch_size]))
+            try:
+                embeddings = self.sentence_transformer(batch_texts)
+            except Exception as e:
+                logging.error(f"Failed to embed {len(batch_texts)} experience(s): {e}")
+                continue
+            try:
+                self.collection.add(
+                    documents=batch_texts,
+                    metadatas=batch_metadatas,
+                    embeddings=embeddings,
+                    ids=batch_ids
+                )
+                stored_ids.extend(batch_ids)
+            except Exception as e:
+                # Ein ungültiger Eintrag soll nicht den ganzen Batch kosten: einzeln nachholen
+                logging.error(f"Failed to add batch of {len(batch_texts)} experience(s) to ChromaDB ({e}). Retrying one by one.")
+                for doc_id, text, metadata, embedding in zip(batch_ids, batch_texts, batch_metadatas, embeddings):
+                    try:
+                        self.collection.add(documents=[text], metadatas=[metadata], embeddings=[embedding], ids=[doc_id])
+                        stored_ids.append(doc_id)
+                    except Exception as item_error:
+                        logging.error(f"Failed to add experience to ChromaDB: {item_error}")
+        if stored_ids:
+            self.generation += 1
+            stored = set(stored_ids)
+            self.plans.observe([entry for entry in entries if entry[0] in stored and is_plan(entry[2])],
+                               self.generation, len(stored_ids))
+            logging.info(f"Added {len(stored_ids)} experience(s) to LTM (IDs {stored_ids[0]} .. {stored_ids[-1]}).")
+        return stored_ids
+
+    def update_metadatas(self, ids: list[str], metadatas: list[dict]):
+        """Merges the given metadata keys into the stored metadata of the documents."""
+        existing = self.collection.get(ids=list(ids), include=["metadatas", "documents"])
+        current = dict(zip(existing['ids'], existing['metadatas']))
+        documents = dict(zip(existing['ids'], existing['documents']))
+        missing = [doc_id for doc_id in ids if doc_id not in current]
+        if missing:
+            raise KeyError(f"Unknown LTM id(s): {missing}")
+        merged = [{**(current[doc_id] or {}), **metadata} for doc_id, metadata in zip(ids, metadatas)]
+        self.collection.update(ids=list(ids), metadatas=merged)
+        self.generation += 1
+        # Der Text wird mitgegeben, damit ein reaktivierter Plan nicht ohne Text im Index landet
+        self.plans.observe([(doc_id, documents[doc_id], metadata) for doc_id, metadata in zip(ids, merged)
+                            if is_plan(metadata)], self.generation, 0)
+
+    def active_plans(self) -> dict:
+        """
+        All active future plans as {id: text}, served from the in-memory plan index.
+        The index is reloaded once the LTM changed behind its back (see `PlanIndex`).
+        """
+        self.plans.ensure_current(self.collection, self.generation)
+        return self.plans.active()
+
+    def _skip_known(self, entries: list[tuple]) -> list[tuple]:
+        """Drops entries whose id repeats within the call or already exists in the collection."""
+        unique = {}
+        for entry in entries:
+            unique.setdefault(entry[0], entry)
+        if not unique:
+            return []
         try:
-            self.collection.add(
-                documents=[text],
-                metadatas=[metadata],
-                ids=[doc_id]
-            )
-            logging.info(f"Added experience to LTM with ID: {doc_id}")
+            existing = set(self.collection.get(ids=list(unique), include=[])['ids'])
         except Exception as e:
-            logging.error(f"Failed to add experience to ChromaDB: {e}")
+            logging.error(f"Failed to look up existing experiences, storing all: {e}")
+            existing = set()
+        skipped = len(entries) - len(unique) + len(existing)
+        if skipped:
+            logging.info(f"Skipped {skipped} duplicate experience(s).")
+        return [entry for entry_id, entry in unique.items() if entry_id not in existing]
 
-    def query_memories(self, query_text: str, n_results: int = 5) -> dict: # Was 'list'
+    def query_memories(self, query_text: str, n_results: int = 5, where: dict | None = None) -> dict: # Was 'list'
         """
-        Queries the LTM for relevant memories based on a query text.
+        Queries the LTM for relevant memories based on a query text,
+        optionally restricted by a metadata filter (`where`).
         """
         try:
             results = self.collection.query(
                 query_texts=[query_text],
-                n_results=n_results
+                n_results=n_results,
+                where=where
             )
             return results # type: ignore
         except Exception as e:
             logging.error(f"Failed to query ChromaDB: {e}")
             # Return a dict with empty lists to maintain type consistency
-            return {'ids': [], 'documents': [], 'metadatas': []}
\ No newline at end of file
+            return {'ids': [], 'documents': [], 'metadatas': []}
+
+    def query_many(self, query_texts: list[str], n_results: int = 5, where: dict | None = None,
+                   timeout: float | None = None) -> tuple[list, list]:
+        """
+        Runs several queries concurrently and returns (query_embeddings, results). All
+        query texts are embedded in one call; `results[i]` holds the documents, metadatas,
+        distances and embeddings of query i, or None if it did not finish within `timeout`
+        seconds. The first query is always awaited and runs on the calling thread.
+
+        The other queries share QUERY_WORKERS pool threads. Queries that time out keep
+        their worker until Chroma returns, so while all workers are busy (e.g. with
+        stragglers of earlier calls) further queries are skipped instead of queued.
+        """
+        query_embeddings = self.sentence_transformer(list(query_texts))
+        if self._query_pool is None:
+            self._query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="LTMQuery")
+        include = ["documents", "metadatas", "distances", "embeddings"]
+
+        futures = []
+        for i, embedding in enumerate(query_embeddings[1:], start=1):
+            with self._query_lock:
+                if self._queries_in_flight >= QUERY_WORKERS:
+                    logging.warning(f"All {QUERY_WORKERS} query workers are busy. Skipping sub-query '{query_texts[i]}'.")
+                    futures.append(None)
+                    continue
+                self._queries_in_flight += 1
+            future = self._query_pool.submit(self.collection.query, query_embeddings=[embedding],
+                                             n_results=n_results, where=where, include=include)
+            future.add_done_callback(self._query_finished)
+            futures.append(future)
+
+        results = [None] * len(query_embeddings)
+        started = time.perf_counter()
+        try:
+            results[0] = self.collection.query(query_embeddings=[query_embeddings[0]], n_results=n_results,
+                                               where=where, include=include)
+        except Exception as e:
+            logging.error(f"Failed to query ChromaDB for '{query_texts[0]}': {e}")
+        remaining = None if timeout is None else max(0.0, timeout - (time.perf_counter() - started))
+        wait([f for f in futures if f is not None], timeout=remaining)
+
+        for i, future in enumerate(futures, start=1):
+            if future is None:
+                continue
+            if not future.done():
+                # Noch nicht gestartete Anfragen geben ihren Platz sofort frei
+                future.cancel()
+                continue
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                logging.error(f"Failed to query ChromaDB for '{query_texts[i]}': {e}")
+        return query_embeddings, results
+
+    def _query_finished(self, future):
+        with self._query_lock:
+            self._queries_in_flight -= 1
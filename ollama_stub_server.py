@@ -0,0 +1,187 @@
+# ollama_stub_server.py
+#
+# Deterministischer Ersatz für den Ollama-Server (/api/chat, auch gestreamt), um den
+# Agenten offline und reproduzierbar unter Last zu testen:
+#
+#   python ollama_stub_server.py --port 11500 --latency 0.2 --token-latency 0.005
+#   OLLAMA_HOST=http://127.0.0.1:11500 python arena_v3.py
+#
+# Die Antwort hängt nur von Modell und Prompt ab. Für format='json' enthält sie alle
+# Felder, die die Layer und der STMManager erwarten.
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_reply(model: str, messages: list, fmt=None, confidence: dict | None = None) -> str:
+    prompt = "\n".join(str(m.get('content', '')) for m in messages)
+    digest = hashlib.sha256(f"{model}\n{prompt}".encode('utf-8')).hexdigest()
+    tag = digest[:8]
+    if not fmt:
+        return f"stub query about {tag}"
+    score = (confidence or {}).get(model, int(digest[8:10], 16) * 100 // 255)
+    return json.dumps({
+        "confidence_score": score,
+        "internal_monologue": f"Stub reasoning {tag}.",
+        "external_response": f"Stub answer {tag}.",
+        "plan_for_layer5": [f"Step 1: analyse {tag}", "Step 2: answer"],
+        "learned_lessons": [f"Stub lesson {tag}."],
+    })
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, token_latency: float = 0.0,
+                 confidence: dict | None = None, fail_first: int = 0):
+        super().__init__(address, StubOllamaHandler)
+        self.latency = latency                # Sekunden bis zum ersten Token
+        self.token_latency = token_latency    # Sekunden je erzeugtem Wort
+        self.confidence = dict(confidence or {})
+        self.fail_first = fail_first          # so viele Anfragen zuerst mit 503 beantworten
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = {}
+        self.max_in_flight = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self._send_json(200, {"version": "0.0.0-stub"})
+        elif self.path == "/api/tags":
+            self._send_json(200, {"models": []})
+        else:
+            self._send_json(200, {"status": "Ollama stub is running"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": f"{self.path} is not supported by the stub"})
+            return
+
+        server = self.server
+        model = request.get("model", "")
+        with server.lock:
+            server.requests.append(request)
+            if server.fail_first > 0:
+                server.fail_first -= 1
+                failing = True
+            else:
+                failing = False
+                server.in_flight[model] = server.in_flight.get(model, 0) + 1
+                server.max_in_flight[model] = max(server.max_in_flight.get(model, 0), server.in_flight[model])
+        if failing:
+            self._send_json(503, {"error": "stub: server busy"})
+            return
+        try:
+            self._chat(request, model)
+        finally:
+            with server.lock:
+                server.in_flight[model] -= 1
+
+    def _chat(self, request: dict, model: str):
+        server = self.server
+        messages = request.get("messages", [])
+        content = stub_reply(model, messages, request.get("format"), server.confidence)
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in messages)
+        words = content.split(" ")
+        started = time.perf_counter()
+        time.sleep(server.latency)
+
+        def chunk(piece: str, done: bool) -> dict:
+            payload = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": piece},
+                "done": done,
+            }
+            if done:
+                payload.update({
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - started) * 1e9),
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": len(words),
+                })
+            return payload
+
+        if not request.get("stream", True):
+            time.sleep(server.token_latency * len(words))
+            self._send_json(200, chunk(content, True))
+            return
+
+        # NDJSON wie bei Ollama: ein Chunk je Wort, zuletzt ein leerer mit den Zählern
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, word in enumerate(words):
+                time.sleep(server.token_latency)
+                self._write_chunk(chunk(word if i == 0 else " " + word, False))
+            self._write_chunk(chunk("", True))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Der Client hat den Stream abgebrochen
+
+    def _write_chunk(self, payload: dict):
+        data = json.dumps(payload).encode('utf-8') + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubOllamaServer:
+    """Starts the stub in a daemon thread (port 0 = any free port, see `server.url`)."""
+    server = StubOllamaServer((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, name="OllamaStub", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic stand-in for the Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before the first token")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds per generated word")
+    parser.add_argument("--confidence", nargs="*", default=[], metavar="MODEL=SCORE",
+                        help="fixed confidence_score per model, e.g. gemma3:4b=30")
+    args = parser.parse_args()
+
+    confidence = {}
+    for item in args.confidence:
+        model, _, score = item.rpartition("=")
+        confidence[model] = int(score)
+    server = StubOllamaServer((args.host, args.port), latency=args.latency,
+                              token_latency=args.token_latency, confidence=confidence)
+    print(f"Ollama stub listening on {server.url} (set OLLAMA_HOST={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,42 @@
 # processing/layer1.py (KOMPLETT ÜBERARBEITET)
 
+import asyncio
 import logging
-import ollama
 import re
 
+from cognitive.llm_gateway import get_gateway
+
 class ContextEnricher:
-    def __init__(self, man):
+    def __init__(self, man, cache_responses: bool = False):
         self.man = man
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.client = ollama.Client()
+        self._client = None
+        self._async_client = None
         self.model_name = "granite4:3b"
+        # Opt-in wie bei den Thinking-Layern: mit cache_responses dürfen gleiche Eingaben aus dem
+        # LLM-Antwort-Cache kommen. Gecachte Anfragen laufen mit Temperatur 0, damit keine zufällige
+        # Stichprobe festgeschrieben wird; ohne Cache bleibt die Standardtemperatur des Modells.
+        self.cache_responses = cache_responses
         self.logger.info(f"Context Enricher (Layer 1) initialized with LLM: {self.model_name}.")
 
+    @property
+    def client(self):
+        # Gemeinsamer, gepoolter Zugang zum Ollama-Server (siehe cognitive/llm_gateway.py)
+        if self._client is None:
+            self._client = get_gateway()
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = get_gateway().aio
+        return self._async_client
+
+    def _chat_kwargs(self) -> dict:
+        if not self.cache_responses:
+            return {"cache": False}
+        return {"cache": True, "options": {"temperature": 0}}
+
     def _extract_query_from_response(self, text: str) -> str:
         """Extracts the core search query from a potentially chatty LLM response."""
         # Versucht, Text in ```-Blöcken zu finden
@@ -26,9 +51,8 @@ class ContextEnricher:
         
         return text # Absoluter Fallback
 
-    def _generate_emotional_query(self, input_text: str) -> str:
-        """Uses an LLM to transform user input into an emotion-focused search query."""
-        prompt = f"""
+    def _emotional_query_prompt(self, input_text: str) -> str:
+        return f"""
         Your job is to transform a user's statement into a search query for finding similar past experiences and emotions (your emotions).
         User statement: "{input_text}"
         Your output MUST be only the search query string, nothing else.
@@ -43,11 +67,16 @@ class ContextEnricher:
         Output:
         memories related to confusion or learning something new (again you feel stressed because the user is stressed)
         """
+
+    def _generate_emotional_query(self, input_text: str) -> str:
+        """Uses an LLM to transform user input into an emotion-focused search query."""
+        prompt = self._emotional_query_prompt(input_text)
         self.logger.info("Generating emotion-focused query with LLM...")
         try:
             response = self.client.chat(
                 model=self.model_name,
-                messages=[{'role': 'user', 'content': prompt}]
+                messages=[{'role': 'user', 'content': prompt}],
+                **self._chat_kwargs()
             )
             raw_response = response['message']['content']
             # --- KORREKTUR HIER ---
@@ -58,19 +87,25 @@ class ContextEnricher:
             self.logger.error(f"Failed to generate emotional query: {e}")
             return input_text # Fallback auf den Originaltext
 
-    def process(self, input_text: str) -> dict:
-        """
-        Processes raw text to create an "enriched data packet" with emotional context.
-        """
-        self.logger.info(f"Processing input: '{input_text}'")
+    async def _generate_emotional_query_async(self, input_text: str) -> str:
+        """Async variant of `_generate_emotional_query` (ollama.AsyncClient)."""
+        self.logger.info("Generating emotion-focused query with LLM (async)...")
+        try:
+            response = await self.async_client.chat(
+                model=self.model_name,
+                messages=[{'role': 'user', 'content': self._emotional_query_prompt(input_text)}],
+                **self._chat_kwargs()
+            )
+            query = self._extract_query_from_response(response['message']['content'])
+            self.logger.info(f"Generated emotional query: '{query}'")
+            return query
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Failed to generate emotional query: {e}")
+            return input_text
 
-        # 1. Intelligente Query an das MAN formulieren
-        emotional_query = self._generate_emotional_query(input_text)
-        
-        # 2. LTM nach emotional relevanten Erinnerungen durchsuchen
-        self.logger.info(f"Querying MAN with emotional query: '{emotional_query}'")
-        context_result = self.man.request(emotional_query, search_type='quick')
-        
+    def _build_enriched_packet(self, input_text: str, context_result: dict | None) -> dict:
         # 3. "Gefühlsvektor" extrahieren (simuliert)
         emotion_context = "neutral" # Default
         if context_result and context_result.get('metadatas') and context_result['metadatas'][0]:
@@ -85,4 +120,26 @@ class ContextEnricher:
             "emotion_context": emotion_context
         }
         self.logger.info(f"Created enriched data packet: {enriched_packet}")
-        return enriched_packet
\ No newline at end of file
+        return enriched_packet
+
+    def process(self, input_text: str) -> dict:
+        """
+        Processes raw text to create an "enriched data packet" with emotional context.
+        """
+        self.logger.info(f"Processing input: '{input_text}'")
+
+        # 1. Intelligente Query an das MAN formulieren
+        emotional_query = self._generate_emotional_query(input_text)
+        
+        # 2. LTM nach emotional relevanten Erinnerungen durchsuchen
+        self.logger.info(f"Querying MAN with emotional query: '{emotional_query}'")
+        context_result = self.man.request(emotional_query, search_type='quick')
+        return self._build_enriched_packet(input_text, context_result)
+
+    async def process_async(self, input_text: str) -> dict:
+        """Async variant of `process`; the (blocking) Chroma query runs in a worker thread."""
+        self.logger.info(f"Processing input (async): '{input_text}'")
+        emotional_query = await self._generate_emotional_query_async(input_text)
+        self.logger.info(f"Querying MAN with emotional query: '{emotional_query}'")
+        context_result = await asyncio.to_thread(self.man.request, emotional_query, search_type='quick')
+        return self._build_enriched_packet(input_text, context_result)
@@ -0,0 +1,152 @@
+# tests/test_agent_async.py
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+capa_core = pytest.importorskip("capa_core")
+
+from agent import Agent
+from processing.layer1 import ContextEnricher
+
+
+class FakeAsyncClient:
+    """
+    Stands in for ollama.AsyncClient: scripted replies per model, with an optional delay.
+    Streamed replies arrive in ten chunks spread over the delay.
+    """
+    def __init__(self, replies: dict, delays: dict | None = None):
+        self.replies = replies
+        self.delays = delays or {}
+        self.calls = []
+        self.cancelled = []
+
+    def _content(self, model):
+        reply = self.replies[model]
+        if isinstance(reply, list):
+            reply = reply.pop(0)
+        return reply if isinstance(reply, str) else json.dumps(reply)
+
+    async def chat(self, model, messages, stream=False, **kwargs):
+        self.calls.append(model)
+        if stream:
+            return self._stream(model, self._content(model))
+        try:
+            await asyncio.sleep(self.delays.get(model, 0.0))
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        return {'message': {'content': self._content(model)}}
+
+    async def _stream(self, model, content):
+        size = len(content) // 10 + 1
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        try:
+            for i, piece in enumerate(pieces):
+                await asyncio.sleep(self.delays.get(model, 0.0) / len(pieces))
+                done = i == len(pieces) - 1
+                yield {'message': {'content': piece}, 'done': done,
+                       **({'prompt_eval_count': 100, 'eval_count': 20} if done else {})}
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled.append(model)
+            raise
+
+
+class SlowMAN:
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def request(self, query_text, search_type='quick', **kwargs):
+        return {'ids': [['m1']], 'metadatas': [[{'emotion': 'curious'}]]}
+
+    def find_active_plans(self):
+        time.sleep(self.delay)
+        return ["learn chess"]
+
+
+def make_agent(client: FakeAsyncClient, man_delay: float = 0.0, **stage_timeouts) -> Agent:
+    man = SlowMAN(man_delay)
+    return Agent(capa_core.CPPCore(), man, ContextEnricher(man), memory_subsystem=None,
+                 stage_timeouts=stage_timeouts)
+
+
+def attach_client(agent: Agent, client: FakeAsyncClient):
+    agent.context_enricher._async_client = client
+    for layer in agent.layers.values():
+        layer._async_client = client
+
+
+def test_enrichment_and_plans_run_concurrently():
+    print("\n--- Testing concurrent L1 enrichment and plan lookup ---")
+    client = FakeAsyncClient(
+        replies={"granite4:3b": "curious about chess",
+                 "gemma3:4b": {"external_response": "Hi!", "confidence_score": 95}},
+        delays={"granite4:3b": 0.3},
+    )
+    agent = make_agent(client, man_delay=0.3)
+
+    async def run():
+        attach_client(agent, client)
+        started = time.perf_counter()
+        result = await agent.process_input_async("hello")
+        return result, time.perf_counter() - started
+
+    result, seconds = asyncio.run(run())
+    print(f"Result: {result}, {seconds:.2f}s, calls: {client.calls}")
+    assert result["external_response"] == "Hi!"
+    assert client.calls == ["granite4:3b", "gemma3:4b"]
+    # Nacheinander wären es >= 0.6 s
+    assert seconds < 0.55
+    print("✅ Stages ran concurrently.")
+
+
+def test_stage_timeout_escalates_and_cancels():
+    print("\n--- Testing per-stage timeouts ---")
+    client = FakeAsyncClient(
+        replies={"granite4:3b": "query",
+                 "gemma3:4b": {"external_response": "too late", "confidence_score": 99},
+                 "dolphin3": [{"internal_monologue": "plan", "plan_for_layer5": ["Step 1"]},
+                              {"internal_monologue": "done", "external_response": "Solved.", "confidence_score": 97}]},
+        delays={"gemma3:4b": 5.0},
+    )
+    agent = make_agent(client, layer3=0.1)
+
+    async def run():
+        attach_client(agent, client)
+        return await agent.process_input_async("a riddle")
+
+    result = asyncio.run(run())
+    print(f"Result: {result}, cancelled: {client.cancelled}")
+    assert result["external_response"] == "Solved."
+    assert client.cancelled == ["gemma3:4b"]
+    print("✅ L3 timed out, was cancelled, and L4/L5 answered.")
+
+
+def test_cancelling_the_pipeline_cancels_the_llm_call():
+    print("\n--- Testing cancellation ---")
+    client = FakeAsyncClient(replies={"granite4:3b": "query"}, delays={"granite4:3b": 5.0})
+    agent = make_agent(client)
+
+    async def run():
+        attach_client(agent, client)
+        task = asyncio.create_task(agent.process_input_async("hello"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert client.cancelled == ["granite4:3b"]
+    print("✅ Cancellation reached the in-flight LLM call.")
+
+
+if __name__ == "__main__":
+    test_enrichment_and_plans_run_concurrently()
+    test_stage_timeout_escalates_and_cancels()
+    test_cancelling_the_pipeline_cancels_the_llm_call()
@@ -0,0 +1,81 @@
+# tests/test_embedding_cache.py
+
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from memory.embedding_cache import CachedEmbeddingFunction
+
+
+class CountingModel:
+    """Deterministic stand-in for the sentence transformer that records every text it encodes."""
+    def __init__(self):
+        self.encoded = []
+
+    def __call__(self, input):
+        self.encoded.extend(input)
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 0.5] for text in input]
+
+
+def test_cache_hits_memory_and_disk(tmp_path):
+    print("--- Testing Embedding Cache ---")
+    cache_path = str(tmp_path / "embeddings.bin")
+    model = CountingModel()
+    cached = CachedEmbeddingFunction(model, cache_path=cache_path, max_memory_entries=2)
+
+    first = cached(["calm", "angry", "calm"])
+    assert model.encoded == ["calm", "angry"]
+    assert first[0] == first[2] == [4.0, float(sum(map(ord, "calm")) % 97), 0.5]
+
+    # Repeated texts cost a lookup; "calm" was pushed out of the LRU and comes from the file
+    assert cached(["angry", "calm", "happy"]) == [first[1], first[0], model(["happy"])[0]]
+    assert model.encoded == ["calm", "angry", "happy", "happy"]
+    assert cached.hits == 3 and cached.misses == 3
+
+    # A new process reuses the store, and sees records appended by another writer
+    restarted = CachedEmbeddingFunction(CountingModel(), cache_path=cache_path)
+    assert restarted(["calm", "angry"]) == first[:2] and restarted.embedding_function.encoded == []
+    cached(["sad"])
+    assert restarted(["sad"]) == cached(["sad"]) and restarted.embedding_function.encoded == []
+    print("--- Embedding Cache Test Passed! ---")
+
+
+def test_injected_models_get_their_own_cache_file(tmp_path):
+    print("--- Testing Embedding Cache Files for Injected Models ---")
+    from memory.subsystem import MemorySubsystem
+
+    class NamedModel(CountingModel):
+        def __init__(self, model_name, dim):
+            super().__init__()
+            self.model_name = model_name
+            self.dim = dim
+
+        def __call__(self, input):
+            return [vector + [0.0] * (self.dim - 3) for vector in super().__call__(input)]
+
+    db_path = str(tmp_path / "db")
+    small = MemorySubsystem(db_path=db_path, collection_name="small", embedding_function=NamedModel("org/small-model", 3))
+    large = MemorySubsystem(db_path=db_path, collection_name="large", embedding_function=NamedModel("large", 5))
+    small.add_experience("same text", {"source": "test"})
+    large.add_experience("same text", {"source": "test"})
+    assert len(large.sentence_transformer(["same text"])[0]) == 5
+    # Without a model name the vectors are only cached with an explicit key
+    anonymous = MemorySubsystem(db_path=db_path, collection_name="anon", embedding_function=CountingModel())
+    anonymous.add_experience("same text", {"source": "test"})
+    keyed = MemorySubsystem(db_path=db_path, collection_name="anon", embedding_function=CountingModel(),
+                            embedding_cache_key="counting-v1")
+    keyed.add_experience("other text", {"source": "test"})
+
+    files = sorted(name for name in os.listdir(db_path) if name.startswith("embeddings_"))
+    print(f"Cache files: {files}")
+    assert files == ["embeddings_anon_custom-counting-v1.bin", "embeddings_large_custom-large.bin",
+                     "embeddings_small_custom-org_small-model.bin"]
+    print("--- Injected Model Cache Test Passed! ---")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_cache_hits_memory_and_disk(pathlib.Path(tempfile.mkdtemp()))
+    test_injected_models_get_their_own_cache_file(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,243 @@
+# tests/test_listener.py
+
+import sys
+import os
+import json
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from memory.listener import (JournalTailer, JournalEventHandler, MAX_BATCH_ATTEMPTS, _start_observer,
+                             segment_path, sealed_segments)
+from memory.subsystem import MemorySubsystem
+
+
+class RecordingSubsystem:
+    """Stands in for MemorySubsystem and records what the listener hands over."""
+    def __init__(self):
+        self.added = []
+
+    def add_experience(self, text: str, metadata: dict):
+        self.added.append((text, metadata))
+
+    def add_experiences(self, texts: list, metadatas: list, batch_size: int | None = None,
+                        ids: list | None = None) -> list:
+        for text, metadata in zip(texts, metadatas):
+            self.add_experience(text, metadata)
+        return list(ids or [])
+
+
+def _entry(text: str) -> bytes:
+    return (json.dumps({"text": text, "metadata": {"source": "test"}}) + "\n").encode()
+
+
+def test_tailer_reads_incrementally(tmp_path):
+    print("--- Testing JournalTailer ---")
+    journal_path = str(tmp_path / "journal.wal")
+    with open(journal_path, "wb") as f:
+        f.write(_entry("written before start"))
+
+    tailer = JournalTailer(journal_path, chunk_size=16, start_at_end=True)
+    assert tailer.read_records() == []
+
+    with open(journal_path, "ab") as f:
+        f.write(_entry("one") + _entry("two"))
+        # A trailing line without newline must wait for its completion
+        partial = _entry("three")
+        f.write(partial[:10])
+    assert [r["text"] for r in tailer.read_records()] == ["one", "two"]
+    assert tailer.read_records() == []
+
+    with open(journal_path, "ab") as f:
+        f.write(partial[10:] + b"not json\n")
+    assert [r["text"] for r in tailer.read_records()] == ["three"]
+    assert tailer.position == os.path.getsize(journal_path)
+
+    # A truncated/replaced journal is read from the beginning
+    with open(journal_path, "wb") as f:
+        f.write(_entry("fresh"))
+    assert [r["text"] for r in tailer.read_records()] == ["fresh"]
+    tailer.close()
+    print("--- JournalTailer Test Passed! ---")
+
+
+def test_backlog_is_read_in_bounded_batches(tmp_path):
+    print("--- Testing Bounded Backlog Reads ---")
+    journal_path = str(tmp_path / "journal.wal")
+    with open(journal_path, "wb") as f:
+        f.write(b"".join(_entry(f"backlog {i}") for i in range(7)) + b"not json\n")
+
+    tailer = JournalTailer(journal_path, chunk_size=4096, start_at_end=False)
+    first = tailer.read_entries(limit=3)
+    assert [r["text"] for _, _, r in first] == ["backlog 0", "backlog 1", "backlog 2"]
+    assert tailer.position == first[-1][1] == 3 * len(_entry("backlog 0"))
+    rest = tailer.read_entries(limit=3) + tailer.read_entries(limit=3)
+    assert [r["text"] for _, _, r in rest] == [f"backlog {i}" for i in range(3, 7)]
+    assert tailer.position == os.path.getsize(journal_path)
+
+    # Der Handler hält nie mehr als batch_size Einträge und setzt nach jedem Batch einen Checkpoint
+    class BatchRecorder(RecordingSubsystem):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def add_experiences(self, texts, metadatas, batch_size=None, ids=None):
+            self.batches.append(len(texts))
+            return super().add_experiences(texts, metadatas, batch_size, ids)
+
+    subsystem = BatchRecorder()
+    handler = JournalEventHandler(subsystem, journal_path, batch_size=3, replay=True)
+    saved = []
+    original_save = handler.checkpoint.save
+    handler.checkpoint.save = lambda segment, offset: (saved.append(offset), original_save(segment, offset))
+    handler._process_new_lines()
+    print(f"Batches: {subsystem.batches}, checkpoints: {saved}")
+    assert subsystem.batches == [3, 3, 1] and len(subsystem.added) == 7
+    assert len(saved) == 4 and saved[-1] == os.path.getsize(journal_path)
+    print("--- Bounded Backlog Test Passed! ---")
+
+
+def test_first_start_does_not_replay_an_existing_journal(tmp_path):
+    print("--- Testing the First Start on a Pre-Existing Journal ---")
+    journal_path = str(tmp_path / "journal.wal")
+    # Vom alten Listener (ohne Checkpoint) bereits ins LTM übernommen
+    with open(journal_path, "wb") as f:
+        f.write(b"".join(_entry(f"already stored {i}") for i in range(3)))
+    assert not os.path.exists(journal_path + ".offset")
+
+    subsystem = RecordingSubsystem()
+    handler = JournalEventHandler(subsystem, journal_path)
+    assert handler.committed == (1, os.path.getsize(journal_path))
+    with open(journal_path + ".offset", encoding="utf-8") as f:
+        assert json.load(f) == {"segment": 1, "offset": os.path.getsize(journal_path)}
+
+    with open(journal_path, "ab") as f:
+        f.write(_entry("new"))
+    handler._process_new_lines()
+    assert [text for text, _ in subsystem.added] == ["new"]
+
+    # A full replay is opt-in
+    os.remove(journal_path + ".offset")
+    replayed = RecordingSubsystem()
+    JournalEventHandler(replayed, journal_path, replay=True)._process_new_lines()
+    assert [text for text, _ in replayed.added] == [f"already stored {i}" for i in range(3)] + ["new"]
+    print("--- First Start Test Passed! ---")
+
+
+def test_handler_ingests_via_events(tmp_path):
+    print("--- Testing Event-Driven Journal Handler ---")
+    journal_path = str(tmp_path / "journal.wal")
+    subsystem = RecordingSubsystem()
+    handler = JournalEventHandler(subsystem, journal_path, batch_size=2)
+    observer, mode = _start_observer(handler, str(tmp_path))
+    print(f"Observer mode: {mode}")
+    try:
+        with open(journal_path, "ab") as f:
+            f.write(b"".join(_entry(f"event {i}") for i in range(5)))
+        deadline = time.time() + 5
+        while len(subsystem.added) < 5 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        observer.stop()
+        observer.join()
+        handler.tailer.close()
+    assert [text for text, _ in subsystem.added] == [f"event {i}" for i in range(5)]
+    print("--- Event-Driven Journal Handler Test Passed! ---")
+
+
+def test_handler_resumes_from_checkpoint(tmp_path):
+    print("--- Testing Checkpointed Resume and Segment Compaction ---")
+    journal_path = str(tmp_path / "journal.wal")
+    with open(journal_path, "wb") as f:
+        f.write(b"".join(_entry(f"old {i}") for i in range(3)))
+
+    first = RecordingSubsystem()
+    handler = JournalEventHandler(first, journal_path, batch_size=2, replay=True)
+    handler._process_new_lines()
+    assert [text for text, _ in first.added] == ["old 0", "old 1", "old 2"]
+
+    # Written while the listener is down, including a rotation like the C++ writer's
+    with open(journal_path, "ab") as f:
+        f.write(_entry("down 0"))
+    os.rename(journal_path, segment_path(journal_path, 1))
+    with open(journal_path, "wb") as f:
+        f.write(_entry("down 1"))
+
+    second = RecordingSubsystem()
+    handler = JournalEventHandler(second, journal_path, batch_size=2)
+    handler._process_new_lines()
+    assert [text for text, _ in second.added] == ["down 0", "down 1"]
+    assert handler.committed == (2, os.path.getsize(journal_path))
+    # The consumed segment is compacted; the newest sealed one stays as (empty) sequence anchor
+    assert sealed_segments(journal_path) == [1] and os.path.getsize(segment_path(journal_path, 1)) == 0
+
+    # A failing batch is not committed and is retried on the next call
+    class FlakySubsystem(RecordingSubsystem):
+        fail = True
+        def add_experience(self, text, metadata):
+            if self.fail:
+                raise RuntimeError("store unavailable")
+            super().add_experience(text, metadata)
+
+    flaky = FlakySubsystem()
+    handler = JournalEventHandler(flaky, journal_path)
+    with open(journal_path, "ab") as f:
+        f.write(_entry("retry me"))
+    handler._process_new_lines()
+    assert flaky.added == [] and handler.committed == (2, os.path.getsize(journal_path) - len(_entry("retry me")))
+    flaky.fail = False
+    handler._process_new_lines()
+    assert [text for text, _ in flaky.added] == ["retry me"]
+    print("--- Checkpointed Resume Test Passed! ---")
+
+
+class FailingEmbeddingFunction:
+    """Embedding function that fails until it is switched back on (e.g. the model server is down)."""
+    def __init__(self):
+        self.failing = True
+
+    def __call__(self, input):
+        if self.failing:
+            raise RuntimeError("embedding backend unavailable")
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in input]
+
+
+def test_handler_does_not_lose_records_on_storage_errors(tmp_path):
+    print("--- Testing Journal Ingest with a Failing Embedder ---")
+    journal_path = str(tmp_path / "journal.wal")
+    with open(journal_path, "wb") as f:
+        f.write(_entry("first") + _entry("second"))
+    embedder = FailingEmbeddingFunction()
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=embedder, dedup="exact",
+                             embedding_cache=False)
+    handler = JournalEventHandler(memory, journal_path, replay=True)
+
+    handler._process_new_lines()
+    print(f"Committed after failure: {handler.committed}")
+    assert memory.collection.count() == 0 and handler.committed == (1, 0)
+
+    embedder.failing = False
+    handler._process_new_lines()
+    assert memory.collection.count() == 2 and handler.committed == (1, os.path.getsize(journal_path))
+
+    # Ein dauerhaft ungültiger Eintrag blockiert das Journal nicht, sondern landet im Dead-Letter-File
+    with open(journal_path, "ab") as f:
+        f.write((json.dumps({"text": "poison", "metadata": {"source": ["not", "a", "scalar"]}}) + "\n").encode()
+                + _entry("after poison"))
+    for _ in range(MAX_BATCH_ATTEMPTS):
+        handler._process_new_lines()
+    with open(handler.rejected_path, encoding="utf-8") as f:
+        assert [json.loads(line)["text"] for line in f] == ["poison"]
+    assert memory.collection.count() == 3 and handler.committed == (1, os.path.getsize(journal_path))
+    print("--- Failing Embedder Test Passed! ---")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_tailer_reads_incrementally(pathlib.Path(tempfile.mkdtemp()))
+    test_backlog_is_read_in_bounded_batches(pathlib.Path(tempfile.mkdtemp()))
+    test_first_start_does_not_replay_an_existing_journal(pathlib.Path(tempfile.mkdtemp()))
+    test_handler_ingests_via_events(pathlib.Path(tempfile.mkdtemp()))
+    test_handler_resumes_from_checkpoint(pathlib.Path(tempfile.mkdtemp()))
+    test_handler_does_not_lose_records_on_storage_errors(pathlib.Path(tempfile.mkdtemp()))
@@ -0,0 +1,116 @@
+# tests/test_llm_gateway.py
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("ollama")
+
+from cognitive import llm_gateway
+from cognitive.llm_gateway import LLMGateway, configure_gateway
+from ollama_stub_server import start_stub_server
+
+
+def test_gateway_limits_concurrency_and_records_stats():
+    print("\n--- Testing the LLM gateway against the stub server ---")
+    server = start_stub_server(latency=0.1)
+    gateway = LLMGateway(host=server.url, keep_alive="10m", max_concurrency=2, model_concurrency={"big": 1})
+    messages = [{'role': 'user', 'content': 'one two three'}]
+    try:
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            responses = list(pool.map(lambda m: gateway.chat(model=m, messages=messages, format='json'),
+                                      ["small"] * 6 + ["big"] * 3))
+    finally:
+        server.shutdown()
+
+    # Deterministisch: gleicher Prompt, gleiche Antwort
+    assert len({r['message']['content'] for r in responses[:6]}) == 1
+    print(f"Max in flight: {server.max_in_flight}")
+    assert server.max_in_flight == {"small": 2, "big": 1}
+    assert all(r["keep_alive"] == "10m" for r in server.requests)
+    stats = gateway.stats.stats()
+    print(f"Stats: {stats}")
+    assert stats["small"]["calls"] == 6 and stats["small"]["prompt_tokens"] == 18
+    assert stats["big"]["completion_tokens"] > 0 and stats["big"]["errors"] == 0
+    print("✅ Concurrency limits, keep_alive and statistics work.")
+
+
+def test_gateway_retries_and_streams():
+    print("\n--- Testing retries and streaming ---")
+    server = start_stub_server(fail_first=2)
+    gateway = LLMGateway(host=server.url, retry_backoff=0.01)
+    messages = [{'role': 'user', 'content': 'hello'}]
+    try:
+        response = gateway.chat(model="m", messages=messages, format='json')
+        chunks = list(gateway.chat(model="m", messages=messages, format='json', stream=True))
+        async_response = asyncio.run(gateway.aio.chat(model="m", messages=messages, format='json'))
+    finally:
+        server.shutdown()
+
+    streamed = "".join(c['message']['content'] for c in chunks)
+    assert streamed == response['message']['content'] == async_response['message']['content']
+    stats = gateway.stats.stats()["m"]
+    print(f"Stats: {stats}")
+    assert stats["retries"] == 2 and stats["calls"] == 3 and stats["errors"] == 0
+    assert chunks[-1]['done'] and stats["completion_tokens"] == 3 * chunks[-1]['eval_count']
+    print("✅ Transient 503s were retried; stream and async results match.")
+
+
+def test_gateway_does_not_retry_read_timeouts():
+    print("\n--- Testing that read timeouts are not retried ---")
+    import httpx
+    server = start_stub_server(latency=1.0)
+    gateway = LLMGateway(host=server.url, timeout=0.2, retry_backoff=0.01)
+    messages = [{'role': 'user', 'content': 'hello'}]
+    try:
+        for call in (lambda: gateway.chat(model="m", messages=messages),
+                     lambda: asyncio.run(gateway.aio.chat(model="m", messages=messages))):
+            try:
+                call()
+                assert False, "Expected a read timeout"
+            except httpx.ReadTimeout:
+                pass
+    finally:
+        server.shutdown()
+
+    stats = gateway.stats.stats()["m"]
+    print(f"Stats: {stats}")
+    # Ein hängender Aufruf belegt den Slot nur ein Timeout lang, nicht (retries + 1) Timeouts
+    assert stats["retries"] == 0 and stats["errors"] == 2 and stats["total_seconds"] < 1.0
+    print("✅ A hung call fails after one timeout.")
+
+
+def test_agent_runs_offline_against_the_stub():
+    print("\n--- Testing the whole agent against the stub server ---")
+    capa_core = pytest.importorskip("capa_core")
+    from agent import Agent
+    from processing.layer1 import ContextEnricher
+    from tests.test_agent_async import SlowMAN
+
+    server = start_stub_server(confidence={"gemma3:4b": 30, "dolphin3": 95})
+    previous = llm_gateway._gateway
+    gateway = configure_gateway(host=server.url)
+    try:
+        man = SlowMAN(0.0)
+        agent = Agent(capa_core.CPPCore(), man, ContextEnricher(man), memory_subsystem=None)
+        result = agent.process_input("a riddle")
+    finally:
+        llm_gateway._gateway = previous
+        server.shutdown()
+
+    print(f"Result: {result}, stats: {gateway.stats.stats()}")
+    assert result["external_response"].startswith("Stub answer")
+    assert [r["model"] for r in server.requests] == ["granite4:3b", "gemma3:4b", "dolphin3", "dolphin3"]
+    print("✅ L1 -> L3 -> L4 -> L5 ran against the stub.")
+
+
+if __name__ == "__main__":
+    test_gateway_limits_concurrency_and_records_stats()
+    test_gateway_retries_and_streams()
+    test_gateway_does_not_retry_read_timeouts()
+    test_agent_runs_offline_against_the_stub()
@@ -0,0 +1,97 @@
+# tests/test_ltm_service.py
+
+import sys
+import os
+import stat
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from memory.subsystem import MemorySubsystem
+from memory.service import start_ltm_service, connect_memory_subsystem, load_authkey, RemoteMemorySubsystem
+
+
+class CountingEmbeddingFunction:
+    """Deterministic stand-in for the sentence transformer that counts model calls."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(len(input))
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in input]
+
+
+def test_service_groups_writes_and_serves_queries(tmp_path):
+    print("--- Testing LTM Service ---")
+    embedder = CountingEmbeddingFunction()
+    owner = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=embedder, embedding_cache=False)
+    address = str(tmp_path / "ltm.sock")
+    service = start_ltm_service(owner, address=address, authkey=b"test")
+    service.write_delay = 0.2
+
+    clients = [connect_memory_subsystem(address=address, authkey=b"test") for _ in range(4)]
+    assert all(isinstance(client, RemoteMemorySubsystem) for client in clients)
+
+    results = {}
+    def write(i, client):
+        results[i] = client.add_experiences([f"lesson {i}a", f"lesson {i}b"], [{"client": i}] * 2)
+    threads = [threading.Thread(target=write, args=(i, c)) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    # Concurrent writers end up in far fewer model calls than requests
+    assert owner.collection.count() == 8 and all(len(ids) == 2 for ids in results.values())
+    assert len(embedder.calls) < 4
+    print(f"4 write requests -> {len(embedder.calls)} embedding call(s)")
+
+    reader = clients[0]
+    assert reader.generation == owner.generation > 0
+    hits = reader.query_memories("lesson 2a", n_results=1)
+    assert len(hits["documents"][0]) == 1 and hits["distances"][0][0] == 0.0
+    assert reader.collection.get(where={"client": 3})["documents"] == ["lesson 3a", "lesson 3b"]
+
+    # Metadata updates are applied by the single writer thread, too
+    update_threads = []
+    original_update = owner.update_metadatas
+    def recording_update(ids, metadatas):
+        update_threads.append(threading.current_thread().name)
+        original_update(ids, metadatas)
+    owner.update_metadatas = recording_update
+    generation = reader.generation
+    reader.update_metadatas([results[0][0]], [{"reviewed": True}])
+    assert update_threads == ["LTMServiceWriter"] and reader.generation == generation + 1
+    assert owner.collection.get(ids=[results[0][0]])["metadatas"][0]["reviewed"] is True
+    print("--- LTM Service Test Passed! ---")
+
+
+def test_authkey_is_generated_per_install(tmp_path):
+    print("--- Testing the per-install LTM service key ---")
+    key_path = str(tmp_path / "keys" / "ltm_service.key")
+    key = load_authkey(key_path, create=True)
+    assert len(key) == 64 and load_authkey(key_path) == key
+    if sys.platform != 'win32':
+        assert stat.S_IMODE(os.stat(key_path).st_mode) == 0o600
+        os.chmod(key_path, 0o644)
+        try:
+            load_authkey(key_path)
+            assert False, "Expected PermissionError for a world-readable key"
+        except PermissionError:
+            pass
+    assert load_authkey(str(tmp_path / "other.key"), create=True) != key
+    print("--- LTM service key Test Passed! ---")
+
+
+def test_connect_falls_back_to_local(tmp_path):
+    subsystem = connect_memory_subsystem(address=str(tmp_path / "missing.sock"), authkey=b"test",
+                                         db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    assert isinstance(subsystem, MemorySubsystem)
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_service_groups_writes_and_serves_queries(pathlib.Path(tempfile.mkdtemp()))
+    test_connect_falls_back_to_local(pathlib.Path(tempfile.mkdtemp()))
+    test_authkey_is_generated_per_install(pathlib.Path(tempfile.mkdtemp()))
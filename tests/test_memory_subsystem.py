@@ -0,0 +1,204 @@
+# tests/test_memory_subsystem.py
+
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from memory.subsystem import MemorySubsystem, content_id
+from memory.man import MemoryAccessNetwork
+
+
+class CountingEmbeddingFunction:
+    """Deterministic stand-in for the sentence transformer that counts model calls."""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(len(input))
+        return [[float(len(text)), float(sum(map(ord, text)) % 97), 1.0] for text in input]
+
+
+def test_add_experiences_batches(tmp_path):
+    print("--- Testing Batched add_experiences ---")
+    embedder = CountingEmbeddingFunction()
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), batch_size=4, embedding_function=embedder)
+
+    texts = [f"lesson {i}" for i in range(10)]
+    ids = memory.add_experiences(texts, [{"source": "test"} for _ in texts])
+    # 10 texts with batch_size 4 -> 3 model calls instead of 10
+    assert embedder.calls == [4, 4, 2]
+    assert len(ids) == len(set(ids)) == 10
+    assert memory.collection.count() == 10
+
+    # One invalid entry must not cost the rest of its batch
+    ids = memory.add_experiences(["good", "bad"], [{"source": "test"}, {"source": ["not", "a", "scalar"]}], batch_size=8)
+    assert len(ids) == 1 and memory.collection.count() == 11
+    print("--- Batched add_experiences Test Passed! ---")
+
+
+def test_content_ids_and_dedup(tmp_path):
+    print("--- Testing Content-Addressed IDs and Dedup ---")
+    # Same-millisecond writes of different texts no longer collide
+    assert content_id("a") != content_id("b")
+    assert content_id("Learned: be brief.", "normalized") == content_id("  learned BE brief ", "normalized")
+    assert content_id("same", None) != content_id("same", None)
+
+    embedder = CountingEmbeddingFunction()
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=embedder, dedup="normalized")
+    memory.add_experiences(["Lesson one.", "lesson ONE", "Lesson two."], [{"source": "test"}] * 3)
+    assert memory.collection.count() == 2 and embedder.calls == [2]
+
+    # Known texts are skipped before embedding
+    ids = memory.add_experiences(["lesson one", "Lesson three."], [{"source": "test"}] * 2)
+    assert len(ids) == 1 and memory.collection.count() == 3 and embedder.calls == [2, 1]
+    assert memory.add_experiences(["Lesson two"], [{"source": "test"}]) == [] and embedder.calls == [2, 1]
+
+    # Without dedup, repeated texts are all stored
+    plain = MemorySubsystem(db_path=str(tmp_path / "db"), collection_name="plain", embedding_function=embedder)
+    plain.add_experiences(["again"] * 3, [{"source": "test"}] * 3)
+    assert plain.collection.count() == 3
+    print("--- Content-Addressed IDs and Dedup Test Passed! ---")
+
+
+def test_man_query_cache(tmp_path):
+    print("--- Testing MAN Query Cache ---")
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    memory.add_experiences(["a calm day", "a stressful bug hunt"], [{"source": "test"}] * 2)
+    man = MemoryAccessNetwork(memory)
+
+    queries = []
+    original_query = memory.query_memories
+    memory.query_memories = lambda *args, **kwargs: queries.append(args) or original_query(*args, **kwargs)
+
+    first = man.request("Stressful  BUG", n_results=1)
+    assert man.request("stressful bug", n_results=1) is first
+    assert len(queries) == 1
+    # Different n_results or filters are different keys
+    man.request("stressful bug", n_results=2)
+    man.request("stressful bug", n_results=1, where={"source": "test"})
+    assert len(queries) == 3
+
+    # A write bumps the generation: no stale result is served
+    memory.add_experience("a stressful bug, fixed", {"source": "test"})
+    man.request("stressful bug", n_results=1)
+    assert len(queries) == 4
+
+    stats = man.cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 4 and stats["invalidations"] == 1
+    print(f"Cache stats: {stats}")
+    print("--- MAN Query Cache Test Passed! ---")
+
+
+def test_lazy_initialization(tmp_path):
+    print("--- Testing Lazy Memory Subsystem Startup ---")
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    # Nothing is loaded until the LTM is first needed
+    assert not memory.is_ready and not os.path.exists(str(tmp_path / "db"))
+    memory.warm_up().join(timeout=30)
+    assert memory.is_ready and memory.init_seconds is not None
+    assert memory.collection.count() == 0
+    print(f"Memory Subsystem initialized in {memory.init_seconds * 1000:.1f} ms")
+    print("--- Lazy Memory Subsystem Startup Test Passed! ---")
+
+
+def test_plan_registry(tmp_path):
+    print("--- Testing Active Plan Registry ---")
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    # A plan that was stored before startup is picked up by the initial load
+    memory.add_experience("Learn the user's preferred tone", {"type": "future_plan", "status": "active"})
+    memory.add_experiences([f"unrelated memory {i}" for i in range(20)], [{"source": "test"}] * 20)
+    man = MemoryAccessNetwork(memory)
+    assert man.find_active_plans() == ["Learn the user's preferred tone"]
+
+    # After the initial load, plans are listed from the index without scanning the collection
+    collection = memory._collection
+    class NoScanCollection:
+        def __getattr__(self, name):
+            assert name != "get", "listing plans must not scan the collection"
+            return getattr(collection, name)
+    memory._collection = NoScanCollection()
+    plan_id = man.create_plan("Ask a follow-up question next session", {"priority": "high"})
+    assert man.find_active_plans() == ["Learn the user's preferred tone", "Ask a follow-up question next session"]
+    memory._collection = collection
+
+    man.complete_plan(plan_id)
+    assert man.find_active_plans() == ["Learn the user's preferred tone"]
+    stored = memory.collection.get(ids=[plan_id])["metadatas"][0]
+    assert stored == {"type": "future_plan", "status": "completed", "priority": "high"}
+
+    # A status-only update that reactivates a plan brings its text back
+    man.complete_plan(plan_id, status="active")
+    assert man.find_active_plans() == ["Learn the user's preferred tone", "Ask a follow-up question next session"]
+
+    # Plans written by another writer (e.g. the LTM listener) are picked up without a local write
+    listener_side = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    listener_side.add_experience("Plan written by the listener", {"type": "future_plan", "status": "active"})
+    assert "Plan written by the listener" in man.find_active_plans()
+    print("--- Active Plan Registry Test Passed! ---")
+
+
+def test_slow_search_fan_out_and_mmr(tmp_path):
+    print("--- Testing Slow Search (Fan-Out + MMR) ---")
+    import numpy as np
+    from memory.slow_search import reformulate, mmr
+
+    subqueries = reformulate("I failed the exam, and I feel stressed about the next one")
+    assert subqueries[0] == "I failed the exam, and I feel stressed about the next one"
+    assert "failed exam feel stressed next one" in subqueries and len(subqueries) <= 4
+
+    # MMR prefers a diverse second pick over a near-duplicate of the first
+    candidates = np.array([[1.0, 0.0], [0.99, 0.01], [0.7, 0.7]])
+    assert mmr(np.array([[1.0, 0.0]]), candidates, k=2, lambda_mult=1.0)[0].tolist() == [0, 1]
+    order, _ = mmr(np.array([[1.0, 0.0]]), candidates, k=2, lambda_mult=0.3)
+    assert order.tolist() == [0, 2]
+
+    memory = MemorySubsystem(db_path=str(tmp_path / "db"), embedding_function=CountingEmbeddingFunction())
+    texts = [f"memory number {i}" for i in range(30)]
+    memory.add_experiences(texts, [{"source": "test"}] * len(texts))
+    man = MemoryAccessNetwork(memory)
+    results = man.request("memory number 7, and memory number 12", search_type="slow", n_results=5)
+    assert len(results["ids"][0]) == 5 and len(set(results["ids"][0])) == 5
+    assert set(results["documents"][0]) <= set(texts)
+
+    # Distances are in the collection's metric (Chroma default: squared L2), like a quick search
+    subqueries = reformulate("memory number 7, and memory number 12")
+    query_embeddings = np.array(memory.sentence_transformer(subqueries))
+    for document, distance in zip(results["documents"][0], results["distances"][0]):
+        embedding = np.array(memory.sentence_transformer([document])[0])
+        assert abs(distance - ((query_embeddings - embedding) ** 2).sum(axis=1).min()) < 1e-3
+    quick = man.request("memory number 7", n_results=1)
+    assert quick["distances"][0][0] == man.request("memory number 7", search_type="slow", n_results=1)["distances"][0][0]
+
+    # A slow search whose sub-queries missed the latency budget is not cached
+    original_query_many = memory.query_many
+    calls = []
+    def partial_query_many(*args, **kwargs):
+        embeddings, answers = original_query_many(*args, **kwargs)
+        calls.append(len(answers))
+        return embeddings, (answers[:1] + [None] * (len(answers) - 1) if len(calls) == 1 else answers)
+    memory.query_many = partial_query_many
+    query = "memory number 3, and memory number 4"
+    man.request(query, search_type="slow", n_results=3)
+    complete = man.request(query, search_type="slow", n_results=3)
+    assert len(calls) == 2 and man.request(query, search_type="slow", n_results=3) is complete
+    memory.query_many = original_query_many
+
+    # While every query worker is busy (e.g. with stragglers), sub-queries are skipped instead of queued
+    from memory.subsystem import QUERY_WORKERS
+    memory._queries_in_flight = QUERY_WORKERS
+    _, busy = memory.query_many(["memory number 1", "memory number 2"], n_results=2, timeout=0.5)
+    assert busy[0] is not None and busy[1] is None
+    memory._queries_in_flight = 0
+    print("--- Slow Search Test Passed! ---")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_add_experiences_batches(pathlib.Path(tempfile.mkdtemp()))
+    test_content_ids_and_dedup(pathlib.Path(tempfile.mkdtemp()))
+    test_man_query_cache(pathlib.Path(tempfile.mkdtemp()))
+    test_lazy_initialization(pathlib.Path(tempfile.mkdtemp()))
+    test_plan_registry(pathlib.Path(tempfile.mkdtemp()))
+    test_slow_search_fan_out_and_mmr(pathlib.Path(tempfile.mkdtemp()))
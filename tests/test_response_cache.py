@@ -0,0 +1,102 @@
+# tests/test_response_cache.py
+
+import sys
+import os
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("ollama")
+
+from cognitive.llm_gateway import LLMGateway
+from cognitive.response_cache import LLMResponseCache, request_key
+from ollama_stub_server import start_stub_server
+
+
+def test_cache_is_content_addressed_bounded_and_persistent(tmp_path):
+    print("--- Testing LLM Response Cache ---")
+    cache_path = str(tmp_path / "llm_cache.sqlite")
+    messages = [{'role': 'user', 'content': 'hello'}]
+    key = request_key("m", messages, format='json')
+    assert key == request_key("m", [{'content': 'hello', 'role': 'user'}], format='json', keep_alive="5m")
+    assert key != request_key("m", messages, format='json', options={"temperature": 0})
+    assert key != request_key("other", messages, format='json')
+
+    cache = LLMResponseCache(cache_path, max_entries=2)
+    cache.put("a", {"message": {"content": "A"}})
+    cache.put("b", {"message": {"content": "B"}})
+    assert cache.get("a") is not None  # "a" ist jetzt jünger als "b"
+    cache.put("c", {"message": {"content": "C"}})
+    assert len(cache) == 2 and cache.get("b") is None
+    cache.close()
+
+    restarted = LLMResponseCache(cache_path, max_entries=2)
+    assert restarted.get("a") == {"message": {"content": "A"}}
+    print(f"Stats: {restarted.stats()}")
+    print("--- LLM Response Cache Test Passed! ---")
+
+
+def test_gateway_serves_hits_without_the_server(tmp_path):
+    print("--- Testing cached gateway calls ---")
+    server = start_stub_server()
+    gateway = LLMGateway(host=server.url, response_cache=LLMResponseCache(str(tmp_path / "llm_cache.sqlite")))
+    messages = [{'role': 'user', 'content': 'same prompt'}]
+    try:
+        first = gateway.chat(model="m", messages=messages, format='json')
+        second = gateway.chat(model="m", messages=messages, format='json')
+        streamed = list(gateway.chat(model="m", messages=messages, format='json', stream=True))
+        gateway.chat(model="m", messages=messages, format='json', cache=False)
+        other = list(gateway.chat(model="m", messages=[{'role': 'user', 'content': 'new'}], format='json', stream=True))
+        gateway.chat(model="m", messages=[{'role': 'user', 'content': 'new'}], format='json')
+    finally:
+        server.shutdown()
+
+    assert second['message']['content'] == first['message']['content'] == streamed[0]['message']['content']
+    assert len(streamed) == 1 and second['eval_count'] == 0
+    # Erste Anfrage, Bypass, erster Stream; der zweite "new"-Aufruf kommt aus dem Cache
+    assert len(server.requests) == 3 and len(other) > 1
+    stats = gateway.stats.stats()["m"]
+    print(f"Gateway stats: {stats}, cache: {gateway.response_cache.stats()}")
+    assert stats["cache_hits"] == 3 and stats["calls"] == 3
+    print("--- Cached gateway calls Test Passed! ---")
+
+
+def test_only_validated_responses_are_cached(tmp_path):
+    print("--- Testing that unparsable responses are not cached ---")
+    server = start_stub_server()
+    gateway = LLMGateway(host=server.url, response_cache=LLMResponseCache(str(tmp_path / "llm_cache.sqlite")))
+    messages = [{'role': 'user', 'content': 'parse me'}]
+
+    def reject(content):
+        raise ValueError("not the expected JSON")
+
+    try:
+        for _ in range(2):
+            gateway.chat(model="m", messages=messages, format='json', validate=reject)
+            list(gateway.chat(model="m", messages=messages, format='json', stream=True, validate=reject))
+        assert len(server.requests) == 4 and len(gateway.response_cache) == 0
+        gateway.chat(model="m", messages=messages, format='json', validate=lambda content: None)
+        gateway.chat(model="m", messages=messages, format='json', validate=reject)
+    finally:
+        server.shutdown()
+    # Ein gültiges Ergebnis wird gespeichert und danach ohne Server beantwortet
+    assert len(server.requests) == 5 and gateway.stats.stats()["m"]["cache_hits"] == 1
+    print("--- Validated caching Test Passed! ---")
+
+
+def test_layer1_caching_is_opt_in():
+    print("--- Testing that Layer 1 keeps sampling unless caching is enabled ---")
+    from processing.layer1 import ContextEnricher
+    assert ContextEnricher(man=None)._chat_kwargs() == {"cache": False}
+    assert ContextEnricher(man=None, cache_responses=True)._chat_kwargs() == {"cache": True, "options": {"temperature": 0}}
+    print("--- Layer 1 caching Test Passed! ---")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+    test_cache_is_content_addressed_bounded_and_persistent(pathlib.Path(tempfile.mkdtemp()))
+    test_gateway_serves_hits_without_the_server(pathlib.Path(tempfile.mkdtemp()))
+    test_only_validated_responses_are_cached(pathlib.Path(tempfile.mkdtemp()))
+    test_layer1_caching_is_opt_in()
@@ -0,0 +1,161 @@
+# tests/test_speculative_l4.py
+
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+capa_core = pytest.importorskip("capa_core")
+
+from agent import Agent
+from processing.layer1 import ContextEnricher
+from tests.test_agent_async import FakeAsyncClient, SlowMAN, attach_client
+
+
+class FakeClient:
+    """
+    Stands in for ollama.Client: scripted replies per model, with a delay and token counts.
+    Streamed replies arrive in ten chunks spread over the delay; closing the stream early
+    is recorded in `cancelled`.
+    """
+    def __init__(self, replies: dict, delays: dict | None = None):
+        self.replies = replies
+        self.delays = delays or {}
+        self.calls = []
+        self.cancelled = []
+        self._lock = threading.Lock()
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        with self._lock:
+            self.calls.append(model)
+            reply = self.replies[model]
+            if isinstance(reply, list):
+                reply = reply.pop(0)
+        content = reply if isinstance(reply, str) else json.dumps(reply)
+        if stream:
+            return self._stream(model, content)
+        time.sleep(self.delays.get(model, 0.0))
+        return {'message': {'content': content}, 'prompt_eval_count': 100, 'eval_count': 20}
+
+    def _stream(self, model, content):
+        size = len(content) // 10 + 1
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        try:
+            for i, piece in enumerate(pieces):
+                time.sleep(self.delays.get(model, 0.0) / len(pieces))
+                done = i == len(pieces) - 1
+                yield {'message': {'content': piece}, 'done': done,
+                       **({'prompt_eval_count': 100, 'eval_count': 20} if done else {})}
+        except GeneratorExit:
+            self.cancelled.append(model)
+            raise
+
+
+def make_agent(client, speculative_l4=True) -> Agent:
+    man = SlowMAN(0.0)
+    agent = Agent(capa_core.CPPCore(), man, ContextEnricher(man), memory_subsystem=None,
+                  speculative_l4=speculative_l4)
+    agent.context_enricher._client = client
+    for layer in agent.layers.values():
+        layer._client = client
+    return agent
+
+
+PLAN = {"internal_monologue": "plan", "plan_for_layer5": ["Step 1"]}
+ANSWER = {"internal_monologue": "done", "external_response": "Solved.", "confidence_score": 97}
+
+
+def test_speculative_plan_is_used_on_escalation():
+    print("\n--- Testing a speculation hit ---")
+    client = FakeClient(
+        replies={"granite4:3b": "query",
+                 "gemma3:4b": {"internal_monologue": "hard", "confidence_score": 20},
+                 "dolphin3": [PLAN, ANSWER]},
+        delays={"gemma3:4b": 0.3, "dolphin3": 0.3},
+    )
+    agent = make_agent(client)
+    started = time.perf_counter()
+    result = agent.process_input("a riddle")
+    seconds = time.perf_counter() - started
+    stats = agent.speculation_stats.stats()
+    print(f"Result: {result}, {seconds:.2f}s, stats: {stats}")
+    assert result["external_response"] == "Solved."
+    assert client.calls.count("dolphin3") == 2
+    # Seriell wären es L3 + L4 + L5 = 0.9 s
+    assert seconds < 0.8
+    assert stats["hits"] == 1 and stats["misses"] == 0 and stats["hit_rate"] == 1.0
+    assert stats["saved_seconds"] > 0.2
+    print("✅ The speculative plan saved one model call.")
+
+
+def test_speculative_plan_is_discarded_when_l3_is_confident():
+    print("\n--- Testing a speculation miss ---")
+    client = FakeClient(
+        replies={"granite4:3b": "query",
+                 "gemma3:4b": {"external_response": "Hi!", "confidence_score": 95},
+                 "dolphin3": PLAN},
+        delays={"gemma3:4b": 0.1, "dolphin3": 5.0},
+    )
+    agent = make_agent(client)
+    result = agent.process_input("hello")
+    assert result["external_response"] == "Hi!"
+    # The discarded plan stops generating instead of holding a pool worker for its full duration
+    started = time.perf_counter()
+    agent._speculation_pool.shutdown(wait=True)
+    freed_after = time.perf_counter() - started
+    stats = agent.speculation_stats.stats()
+    print(f"Stats: {stats}, worker freed after {freed_after:.2f}s")
+    assert stats["misses"] == 1 and stats["hit_rate"] == 0.0 and stats["cancelled"] == 1
+    assert client.cancelled == ["dolphin3"] and freed_after < 2.0
+    # The cancelled plan still cost its prompt and the chunks streamed so far (estimated)
+    assert stats["wasted_prompt_tokens"] > 0 and 0 < stats["wasted_completion_tokens"] < 10
+    print("✅ The discarded plan was cancelled and its tokens counted as waste.")
+
+    # A plan that already finished when it is discarded counts as waste
+    client = FakeClient(
+        replies={"granite4:3b": "query",
+                 "gemma3:4b": {"external_response": "Hi!", "confidence_score": 95},
+                 "dolphin3": PLAN},
+        delays={"gemma3:4b": 0.3},
+    )
+    agent = make_agent(client)
+    agent.process_input("hello")
+    agent._speculation_pool.shutdown(wait=True)
+    stats = agent.speculation_stats.stats()
+    assert stats["wasted_prompt_tokens"] == 100 and stats["wasted_completion_tokens"] == 20
+    print("✅ The finished, discarded plan was counted as waste.")
+
+
+def test_async_speculation():
+    print("\n--- Testing speculation in the async pipeline ---")
+    client = FakeAsyncClient(
+        replies={"granite4:3b": "query",
+                 "gemma3:4b": {"external_response": "Hi!", "confidence_score": 95},
+                 "dolphin3": PLAN},
+        delays={"dolphin3": 5.0},
+    )
+    agent = make_agent(None)
+
+    async def run():
+        attach_client(agent, client)
+        return await agent.process_input_async("hello")
+
+    result = asyncio.run(run())
+    print(f"Result: {result}, cancelled: {client.cancelled}")
+    assert result["external_response"] == "Hi!"
+    assert client.cancelled == ["dolphin3"]
+    stats = agent.speculation_stats.stats()
+    assert stats["misses"] == 1 and stats["cancelled"] == 1 and stats["wasted_prompt_tokens"] > 0
+    print("✅ The speculative L4 call was cancelled.")
+
+
+if __name__ == "__main__":
+    test_speculative_plan_is_used_on_escalation()
+    test_speculative_plan_is_discarded_when_l3_is_confident()
+    test_async_speculation()
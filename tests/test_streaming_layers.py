@@ -0,0 +1,128 @@
+# tests/test_streaming_layers.py
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import msgpack
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+pytest.importorskip("ollama")
+
+from cognitive import llm_gateway
+from cognitive.json_stream import StreamingJSONObject
+from cognitive.layers import ThinkingLayer3
+from cognitive.llm_gateway import configure_gateway
+from ollama_stub_server import start_stub_server
+
+
+def test_fields_are_decoded_while_streaming():
+    print("\n--- Testing incremental JSON decoding ---")
+    text = ('Sure! {"confidence_score": 35, "plan": ["a, b", {"x": "}"}], '
+            '"internal_monologue": "He said \\"hi\\", then left.", "external_response": "N/A"}')
+    parser = StreamingJSONObject()
+    seen_at = {}
+    for i, c in enumerate(text):
+        for key in parser.feed(c):
+            seen_at.setdefault(key, i)
+
+    print(f"Fields: {parser.fields}")
+    assert parser.complete
+    assert parser.fields == json.loads(text[text.index('{'):])
+    # Die Konfidenz steht lange vor dem Ende der Antwort fest
+    assert seen_at["confidence_score"] < text.index('"plan"') < seen_at["plan"] < seen_at["external_response"]
+    assert StreamingJSONObject().feed('{"confidence_score": Your score (0-100), "x": 1}') == \
+        {"confidence_score": "Your score (0-100)", "x": 1}
+    print("✅ Fields are available as soon as their value is complete.")
+
+
+def _run_with_stub(confidence: dict, body):
+    server = start_stub_server(token_latency=0.05, confidence=confidence)
+    previous = llm_gateway._gateway
+    gateway = configure_gateway(host=server.url)
+    try:
+        return body(), gateway, server
+    finally:
+        llm_gateway._gateway = previous
+        server.shutdown()
+
+
+def test_low_confidence_stops_the_l3_stream_early():
+    print("\n--- Testing early escalation from a streamed L3 call ---")
+    from agent import _escalates
+    layer = ThinkingLayer3(cpp_core=None)
+    kwargs = dict(graph_snapshot=msgpack.packb([[], []]), emotion_context="neutral", internal_emotion_text="calm", input_text="a riddle")
+
+    def body():
+        started = time.perf_counter()
+        early = layer.think_streaming(stop_when=_escalates, **kwargs)
+        early_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        full = layer.think_streaming(**kwargs)
+        return early, early_seconds, full, time.perf_counter() - started
+
+    (early, early_seconds, full, full_seconds), gateway, _ = _run_with_stub({"gemma3:4b": 30}, body)
+    print(f"Early: {early} ({early_seconds:.2f}s), full: {full} ({full_seconds:.2f}s)")
+    print(f"Gateway stats: {gateway.stats.stats()}")
+    assert early == {"confidence_score": 30, "stopped_early": True}
+    assert full["confidence_score"] == 30 and full["external_response"].startswith("Stub answer")
+    assert early_seconds < full_seconds / 3
+    assert gateway.stats.stats()["gemma3:4b"]["cancelled"] == 1
+    print("✅ The stream was closed as soon as the low confidence was known.")
+
+
+def test_agent_escalates_from_streamed_l3():
+    print("\n--- Testing the agent with streamed L3 (sync and async) ---")
+    capa_core = pytest.importorskip("capa_core")
+    from agent import Agent
+    from processing.layer1 import ContextEnricher
+    from tests.test_agent_async import SlowMAN
+
+    def body():
+        man = SlowMAN(0.0)
+        agent = Agent(capa_core.CPPCore(), man, ContextEnricher(man), memory_subsystem=None, stream_l3=True)
+        return agent.process_input("a riddle"), asyncio.run(agent.process_input_async("another riddle"))
+
+    (result, async_result), gateway, server = _run_with_stub({"gemma3:4b": 20, "dolphin3": 95}, body)
+    print(f"Results: {result}, {async_result}, stats: {gateway.stats.stats()}")
+    assert result["external_response"].startswith("Stub answer")
+    assert async_result["external_response"].startswith("Stub answer")
+    assert gateway.stats.stats()["gemma3:4b"]["cancelled"] == 2
+    assert [r["model"] for r in server.requests].count("dolphin3") == 4
+    print("✅ L3 escalated to L4/L5 without waiting for its full answer.")
+
+
+def test_failed_escalation_from_streamed_l3_returns_an_error_response():
+    print("\n--- Testing a failed escalation after an early-stopped L3 stream ---")
+    capa_core = pytest.importorskip("capa_core")
+    from tests.test_speculative_l4 import FakeClient, make_agent
+    from agent import ESCALATION_FAILED_RESPONSE
+
+    # Nur der gestreamte Aufruf fragt die Konfidenz zuerst ab
+    layer = ThinkingLayer3(cpp_core=None)
+    kwargs = dict(graph_snapshot=msgpack.packb([[], []]), emotion_context="neutral", internal_emotion_text="calm", input_text="hi")
+    plain, streamed = layer._build_prompt(**kwargs), layer._build_prompt(confidence_first=True, **kwargs)
+    assert plain.index('"internal_monologue"') < plain.index('"confidence_score"')
+    assert streamed.index('"confidence_score"') < streamed.index('"internal_monologue"')
+
+    client = FakeClient(replies={"granite4:3b": "query",
+                                 "gemma3:4b": {"confidence_score": 20, "internal_monologue": "hard"},
+                                 "dolphin3": {"internal_monologue": "no idea"}})
+    agent = make_agent(client, speculative_l4=False)
+    agent.stream_l3 = True
+    result = agent.process_input("a riddle")
+    print(f"Result: {result}, cancelled: {client.cancelled}")
+    assert client.cancelled == ["gemma3:4b"]
+    assert result["external_response"] == ESCALATION_FAILED_RESPONSE and result["confidence_score"] == 0
+    print("✅ The user gets an error response instead of 'N/A'.")
+
+
+if __name__ == "__main__":
+    test_fields_are_decoded_while_streaming()
+    test_low_confidence_stops_the_l3_stream_early()
+    test_agent_escalates_from_streamed_l3()
+    test_failed_escalation_from_streamed_l3_returns_an_error_response()